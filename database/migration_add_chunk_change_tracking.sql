@@ -0,0 +1,69 @@
+-- Migration: Track chunk changes for the in-memory vector index
+-- The index used to poll chunks.updated_at, which holds the writer's
+-- transaction start time: rows from a long /index transaction committed
+-- minutes "in the past" and were never picked up, and deleted chunks were
+-- never seen at all. Chunks are now stamped with the writing transaction's
+-- ID and deletions are recorded in chunk_deletions; see
+-- indexer/vector_index.py. Needs PostgreSQL 13+ (xid8).
+
+BEGIN;
+
+-- Existing rows stay NULL: a load reads them, and they only need a stamp
+-- once they change again
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS change_xid xid8;
+
+CREATE INDEX IF NOT EXISTS idx_chunks_change_xid ON chunks(change_xid);
+DROP INDEX IF EXISTS idx_chunks_updated_at;
+
+CREATE OR REPLACE FUNCTION stamp_chunk_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS chunks_change_xid ON chunks;
+CREATE TRIGGER chunks_change_xid
+    BEFORE INSERT OR UPDATE ON chunks
+    FOR EACH ROW EXECUTE FUNCTION stamp_chunk_change();
+
+CREATE TABLE IF NOT EXISTS chunk_deletions (
+    chunk_id INTEGER, -- NULL for a TRUNCATE
+    deleted_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_chunk_deletions_xid ON chunk_deletions(deleted_xid);
+CREATE INDEX IF NOT EXISTS idx_chunk_deletions_deleted_at ON chunk_deletions(deleted_at);
+
+CREATE OR REPLACE FUNCTION record_chunk_deletions()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        INSERT INTO chunk_deletions (chunk_id) VALUES (NULL);
+    ELSE
+        INSERT INTO chunk_deletions (chunk_id) SELECT id FROM old_rows;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS chunks_deletions ON chunks;
+CREATE TRIGGER chunks_deletions
+    AFTER DELETE ON chunks
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_chunk_deletions();
+
+DROP TRIGGER IF EXISTS chunks_deletions_truncate ON chunks;
+CREATE TRIGGER chunks_deletions_truncate
+    AFTER TRUNCATE ON chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION record_chunk_deletions();
+
+COMMENT ON TABLE chunk_deletions IS 'Deleted chunk IDs for the indexer''s in-memory vector index refresh; pruned after a day';
+
+COMMIT;
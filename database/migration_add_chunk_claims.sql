@@ -0,0 +1,11 @@
+-- Migration: Claim chunks for embedding
+-- run_embedding used to read pending chunks with a plain SELECT, so a worker
+-- embed job and an /embed call (or two workers) embedded the same rows twice.
+-- It now claims them with FOR UPDATE SKIP LOCKED and stamps claimed_by; a
+-- claim older than EMBED_CLAIM_SECONDS is treated as abandoned.
+
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS idx_chunks_claimed_by ON chunks(claimed_by)
+    WHERE claimed_by IS NOT NULL;
@@ -0,0 +1,5 @@
+-- Migration: Index chunks.updated_at
+-- The indexer's in-memory vector index (VECTOR_INDEX_ENABLED) polls for chunks
+-- changed since its last refresh; without this index every poll scans the table
+
+CREATE INDEX IF NOT EXISTS idx_chunks_updated_at ON chunks(updated_at);
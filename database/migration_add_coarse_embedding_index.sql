@@ -0,0 +1,11 @@
+-- Migration: Add a coarse Matryoshka index for two-stage retrieval
+-- Gemini embeddings keep most of their meaning in the leading dimensions, so
+-- /retrieve (two_stage) takes candidates from a small index on the first 256
+-- dimensions and rescores them on the full 768. Requires pgvector 0.7.0+.
+-- For halfvec storage (migration_halfvec_embeddings.sql) use
+-- subvector(embedding, 1, 256)::halfvec(256) with halfvec_cosine_ops instead.
+-- To change the dimension, set EMBEDDING_COARSE_DIMENSION and run:
+--   python indexer/ann_index.py rebuild
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chunks_embedding_coarse ON chunks
+    USING hnsw ((subvector(embedding, 1, 256)::vector(256)) vector_cosine_ops) WITH (m = 16, ef_construction = 64);
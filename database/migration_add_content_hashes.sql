@@ -0,0 +1,20 @@
+-- Migration: Add content hashes for deduplication and incremental re-indexing
+-- Unchanged files skip extraction, unchanged chunks keep their embeddings,
+-- and identical chunks across documents reuse one embedding
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Backfill chunk hashes with the same normalization as chunker_embedder.content_hash
+-- (NFKC + collapsed whitespace; normalize() requires PostgreSQL 13+)
+UPDATE chunks
+SET content_hash = encode(
+    sha256(convert_to(btrim(regexp_replace(normalize(content, NFKC), '\s+', ' ', 'g')), 'UTF8')),
+    'hex'
+)
+WHERE content_hash IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_chunks_content_hash ON chunks(content_hash);
+
+COMMENT ON COLUMN documents.content_hash IS 'SHA-256 of the file the current chunks were built from';
+COMMENT ON COLUMN chunks.content_hash IS 'SHA-256 of NFKC/whitespace-normalized content';
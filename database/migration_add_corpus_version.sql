@@ -0,0 +1,35 @@
+-- Migration: Corpus version counter
+-- The indexer caches /retrieve results per corpus version; this trigger bumps
+-- the version whenever chunks are inserted, deleted (including via document
+-- deletes, which cascade) or (re-)embedded, so cached results never outlive
+-- the chunks they were computed from
+
+CREATE TABLE IF NOT EXISTS corpus_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id), -- Single row
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+INSERT INTO corpus_state DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_corpus_version()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE corpus_state SET version = version + 1, updated_at = NOW();
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS chunks_corpus_version ON chunks;
+CREATE TRIGGER chunks_corpus_version
+    AFTER INSERT OR DELETE OR UPDATE OF content, embedding, status, chunk_index ON chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
+
+DROP TRIGGER IF EXISTS chunks_corpus_version_truncate ON chunks;
+CREATE TRIGGER chunks_corpus_version_truncate
+    AFTER TRUNCATE ON chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
+
+COMMENT ON TABLE corpus_state IS 'Single-row corpus version, incremented on every chunk insert, delete or embedding change (invalidates cached retrieval results)';
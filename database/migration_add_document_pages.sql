@@ -0,0 +1,20 @@
+-- Migration: Stream extracted pages between ingestion stages
+-- Extract jobs now write page texts to document_pages in batches and chunk
+-- jobs stream them back, so neither holds a whole book in memory; chunks
+-- record the page they start on
+
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS page_number INTEGER;
+
+CREATE TABLE IF NOT EXISTS document_pages (
+    document_id INTEGER REFERENCES documents(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL, -- Order within the document (vision descriptions follow the pages)
+    page_number INTEGER,
+    content TEXT NOT NULL,
+    PRIMARY KEY (document_id, seq)
+);
+
+COMMENT ON TABLE document_pages IS 'Per-page extracted text handed from extract to chunk jobs, cleared after chunking';
+
+-- documents.extracted_text is no longer used; drop it once no chunk jobs
+-- queued by an older worker are left:
+-- ALTER TABLE documents DROP COLUMN IF EXISTS extracted_text;
@@ -0,0 +1,16 @@
+-- Migration: Add persistent embedding cache
+-- Repeated questions and boilerplate chunks are embedded once and reused by every indexer process
+
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model TEXT NOT NULL,
+    task_type TEXT NOT NULL,
+    dimensionality INTEGER NOT NULL,
+    text_hash TEXT NOT NULL, -- SHA-256 of the exact embedded text
+    embedding REAL[] NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (model, task_type, dimensionality, text_hash)
+);
+
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_created_at ON embedding_cache(created_at);
+
+COMMENT ON TABLE embedding_cache IS 'Cached embeddings keyed by model, task type, dimensionality and text hash; pruned by age and row count';
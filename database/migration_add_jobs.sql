@@ -0,0 +1,31 @@
+-- Migration: Add durable ingestion job queue
+-- Lets indexer/worker.py process extract, chunk and embed stages in the background
+
+-- Extracted text is handed from the extract job to the chunk job through the document row
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS extracted_text TEXT;
+
+-- Create jobs table
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    document_id INTEGER REFERENCES documents(id) ON DELETE CASCADE,
+    stage TEXT NOT NULL CHECK (stage IN ('extract', 'chunk', 'embed')),
+    status TEXT DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'completed', 'failed')),
+    payload JSONB DEFAULT '{}'::jsonb,
+    progress INTEGER DEFAULT 0,
+    progress_total INTEGER,
+    attempts INTEGER DEFAULT 0,
+    max_attempts INTEGER DEFAULT 3,
+    locked_by TEXT,
+    heartbeat_at TIMESTAMP WITH TIME ZONE,
+    run_after TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    error_message TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs(stage, run_after, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs(heartbeat_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_jobs_document_id ON jobs(document_id);
+
+COMMENT ON TABLE jobs IS 'Durable ingestion queue. Stages: extract -> chunk -> embed. Status: queued, running, completed, failed';
+COMMENT ON COLUMN documents.extracted_text IS 'Hand-off between extract and chunk jobs, cleared after chunking';
@@ -0,0 +1,97 @@
+-- Migration: Add lexical (full-text) search and hybrid retrieval
+-- /retrieve can combine vector similarity with an index-backed tsvector
+-- search (Indonesian + English) using reciprocal rank fusion
+-- (the 'indonesian' text search configuration requires PostgreSQL 12+)
+
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS content_tsv tsvector GENERATED ALWAYS AS (
+    to_tsvector('indonesian', content) || to_tsvector('english', content)
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_chunks_content_tsv ON chunks USING GIN (content_tsv);
+
+-- Function for lexical search over the full-text index
+CREATE OR REPLACE FUNCTION match_chunks_lexical(
+    query_text TEXT,
+    match_count INT DEFAULT 5,
+    filter_document INT DEFAULT NULL
+)
+RETURNS TABLE (
+    id INT,
+    document_id INT,
+    content TEXT,
+    chunk_index INTEGER,
+    similarity FLOAT
+)
+LANGUAGE sql STABLE
+AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('indonesian', query_text)
+            || websearch_to_tsquery('english', query_text) AS query
+    )
+    SELECT
+        chunks.id,
+        chunks.document_id,
+        chunks.content,
+        chunks.chunk_index,
+        ts_rank_cd(chunks.content_tsv, q.query)::FLOAT AS similarity
+    FROM chunks, q
+    WHERE chunks.content_tsv @@ q.query
+        AND (filter_document IS NULL OR chunks.document_id = filter_document)
+    ORDER BY similarity DESC, chunks.id
+    LIMIT match_count;
+$$;
+
+-- Function for hybrid search: reciprocal rank fusion of vector and lexical results
+CREATE OR REPLACE FUNCTION hybrid_match_chunks(
+    query_embedding vector(768),
+    query_text TEXT,
+    match_count INT DEFAULT 5,
+    filter_document INT DEFAULT NULL,
+    candidate_count INT DEFAULT 50,
+    rrf_k INT DEFAULT 60
+)
+RETURNS TABLE (
+    id INT,
+    document_id INT,
+    content TEXT,
+    chunk_index INTEGER,
+    similarity FLOAT,
+    vector_rank INT,
+    lexical_rank INT
+)
+LANGUAGE sql STABLE
+AS $$
+    WITH vector_hits AS (
+        SELECT v.id, (row_number() OVER (ORDER BY v.similarity DESC))::INT AS rank
+        FROM match_chunks(query_embedding, candidate_count, filter_document) v
+    ),
+    lexical_hits AS (
+        SELECT l.id, (row_number() OVER (ORDER BY l.similarity DESC, l.id))::INT AS rank
+        FROM match_chunks_lexical(query_text, candidate_count, filter_document) l
+    ),
+    fused AS (
+        SELECT
+            COALESCE(vector_hits.id, lexical_hits.id) AS id,
+            COALESCE(1.0 / (rrf_k + vector_hits.rank), 0)
+                + COALESCE(1.0 / (rrf_k + lexical_hits.rank), 0) AS score,
+            vector_hits.rank AS vector_rank,
+            lexical_hits.rank AS lexical_rank
+        FROM vector_hits
+        FULL OUTER JOIN lexical_hits ON vector_hits.id = lexical_hits.id
+    )
+    SELECT
+        chunks.id,
+        chunks.document_id,
+        chunks.content,
+        chunks.chunk_index,
+        fused.score::FLOAT AS similarity,
+        fused.vector_rank,
+        fused.lexical_rank
+    FROM fused
+    JOIN chunks ON chunks.id = fused.id
+    ORDER BY fused.score DESC, chunks.id
+    LIMIT match_count;
+$$;
+
+COMMENT ON FUNCTION match_chunks_lexical IS 'Full-text search (Indonesian + English) ranked by ts_rank_cd';
+COMMENT ON FUNCTION hybrid_match_chunks IS 'Hybrid search: reciprocal rank fusion of match_chunks and match_chunks_lexical';
@@ -0,0 +1,197 @@
+-- Migration: Maintained status counts for /stats
+-- /stats used to count documents and chunks with full scans on every call;
+-- triggers now keep per-status counts up to date as rows change, and
+-- recount_status_counts() fills them once from the existing rows. Run in
+-- one transaction so no write slips in between the triggers and the fill.
+
+BEGIN;
+
+-- Maintained status counts, so /stats reads a handful of rows instead of
+-- scanning chunks. Statement-level triggers append one delta row per
+-- (status, has embedding) group touched; writers never update a shared
+-- row, so concurrent embed batches do not contend or deadlock on them.
+-- compact_status_counts() folds the deltas into status_counts.
+CREATE TABLE IF NOT EXISTS status_counts (
+    table_name TEXT NOT NULL, -- 'documents' or 'chunks'
+    status TEXT NOT NULL,
+    with_embedding BOOLEAN NOT NULL DEFAULT FALSE, -- chunks.embedding IS NOT NULL
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, status, with_embedding)
+);
+
+CREATE TABLE IF NOT EXISTS status_count_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    with_embedding BOOLEAN NOT NULL DEFAULT FALSE,
+    delta BIGINT NOT NULL
+);
+
+-- Exact current counts: compacted rows plus deltas not yet folded in
+CREATE OR REPLACE VIEW status_count_totals AS
+SELECT table_name, status, with_embedding, SUM(count)::bigint AS count
+FROM (
+    SELECT table_name, status, with_embedding, count FROM status_counts
+    UNION ALL
+    SELECT table_name, status, with_embedding, delta FROM status_count_deltas
+) AS c
+GROUP BY table_name, status, with_embedding;
+
+CREATE OR REPLACE FUNCTION count_document_statuses()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM status_count_deltas WHERE table_name = 'documents';
+        DELETE FROM status_counts WHERE table_name = 'documents';
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO status_count_deltas (table_name, status, delta)
+        SELECT 'documents', COALESCE(status, 'unknown'), COUNT(*) FROM new_rows GROUP BY 2;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO status_count_deltas (table_name, status, delta)
+        SELECT 'documents', COALESCE(status, 'unknown'), -COUNT(*) FROM old_rows GROUP BY 2;
+    ELSE
+        INSERT INTO status_count_deltas (table_name, status, delta)
+        SELECT 'documents', status, SUM(delta)
+        FROM (
+            SELECT COALESCE(status, 'unknown') AS status, 1 AS delta FROM new_rows
+            UNION ALL
+            SELECT COALESCE(status, 'unknown'), -1 FROM old_rows
+        ) AS d
+        GROUP BY status
+        HAVING SUM(delta) <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION count_chunk_statuses()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM status_count_deltas WHERE table_name = 'chunks';
+        DELETE FROM status_counts WHERE table_name = 'chunks';
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO status_count_deltas (table_name, status, with_embedding, delta)
+        SELECT 'chunks', COALESCE(status, 'unknown'), embedding IS NOT NULL, COUNT(*)
+        FROM new_rows GROUP BY 2, 3;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO status_count_deltas (table_name, status, with_embedding, delta)
+        SELECT 'chunks', COALESCE(status, 'unknown'), embedding IS NOT NULL, -COUNT(*)
+        FROM old_rows GROUP BY 2, 3;
+    ELSE
+        -- Re-indexed or moved chunks net to zero and add no delta rows
+        INSERT INTO status_count_deltas (table_name, status, with_embedding, delta)
+        SELECT 'chunks', status, with_embedding, SUM(delta)
+        FROM (
+            SELECT COALESCE(status, 'unknown') AS status,
+                   embedding IS NOT NULL AS with_embedding,
+                   1 AS delta
+            FROM new_rows
+            UNION ALL
+            SELECT COALESCE(status, 'unknown'), embedding IS NOT NULL, -1 FROM old_rows
+        ) AS d
+        GROUP BY status, with_embedding
+        HAVING SUM(delta) <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS documents_status_counts_insert ON documents;
+CREATE TRIGGER documents_status_counts_insert
+    AFTER INSERT ON documents REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_document_statuses();
+
+DROP TRIGGER IF EXISTS documents_status_counts_update ON documents;
+CREATE TRIGGER documents_status_counts_update
+    AFTER UPDATE ON documents REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_document_statuses();
+
+DROP TRIGGER IF EXISTS documents_status_counts_delete ON documents;
+CREATE TRIGGER documents_status_counts_delete
+    AFTER DELETE ON documents REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_document_statuses();
+
+DROP TRIGGER IF EXISTS documents_status_counts_truncate ON documents;
+CREATE TRIGGER documents_status_counts_truncate
+    AFTER TRUNCATE ON documents
+    FOR EACH STATEMENT EXECUTE FUNCTION count_document_statuses();
+
+DROP TRIGGER IF EXISTS chunks_status_counts_insert ON chunks;
+CREATE TRIGGER chunks_status_counts_insert
+    AFTER INSERT ON chunks REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_chunk_statuses();
+
+DROP TRIGGER IF EXISTS chunks_status_counts_update ON chunks;
+CREATE TRIGGER chunks_status_counts_update
+    AFTER UPDATE ON chunks REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_chunk_statuses();
+
+DROP TRIGGER IF EXISTS chunks_status_counts_delete ON chunks;
+CREATE TRIGGER chunks_status_counts_delete
+    AFTER DELETE ON chunks REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_chunk_statuses();
+
+DROP TRIGGER IF EXISTS chunks_status_counts_truncate ON chunks;
+CREATE TRIGGER chunks_status_counts_truncate
+    AFTER TRUNCATE ON chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION count_chunk_statuses();
+
+-- Fold pending deltas into status_counts (called by /stats; one caller at a
+-- time, the others skip since status_count_totals is exact either way)
+CREATE OR REPLACE FUNCTION compact_status_counts()
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('status_counts')) THEN
+        RETURN;
+    END IF;
+
+    WITH moved AS (
+        DELETE FROM status_count_deltas
+        RETURNING table_name, status, with_embedding, delta
+    )
+    INSERT INTO status_counts AS s (table_name, status, with_embedding, count)
+    SELECT table_name, status, with_embedding, SUM(delta)
+    FROM moved
+    GROUP BY table_name, status, with_embedding
+    ON CONFLICT (table_name, status, with_embedding)
+    DO UPDATE SET count = s.count + EXCLUDED.count;
+END;
+$$;
+
+-- Rebuild the counters from a full scan (initial fill and audits). Blocks
+-- writes to documents and chunks while it runs.
+CREATE OR REPLACE FUNCTION recount_status_counts()
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('status_counts'));
+    LOCK TABLE documents, chunks IN SHARE MODE;
+
+    DELETE FROM status_count_deltas;
+    DELETE FROM status_counts;
+
+    INSERT INTO status_counts (table_name, status, count)
+    SELECT 'documents', COALESCE(status, 'unknown'), COUNT(*) FROM documents GROUP BY 2;
+
+    INSERT INTO status_counts (table_name, status, with_embedding, count)
+    SELECT 'chunks', COALESCE(status, 'unknown'), embedding IS NOT NULL, COUNT(*)
+    FROM chunks GROUP BY 2, 3;
+END;
+$$;
+
+-- Initial fill (takes a SHARE lock on documents and chunks while it counts)
+SELECT recount_status_counts();
+
+COMMENT ON TABLE status_counts IS 'Document and chunk counts per status (chunks also split by embedding presence), maintained by triggers for /stats';
+COMMENT ON TABLE status_count_deltas IS 'Per-statement changes to status_counts, folded in by compact_status_counts()';
+
+COMMIT;
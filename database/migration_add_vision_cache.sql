@@ -0,0 +1,12 @@
+-- Migration: Add Gemini Vision description cache
+-- Re-indexed documents and duplicate slides reuse descriptions instead of calling the API again
+
+CREATE TABLE IF NOT EXISTS vision_cache (
+    image_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    description TEXT NOT NULL, -- Empty string = page has no significant visuals
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (image_hash, model)
+);
+
+COMMENT ON TABLE vision_cache IS 'Cached Gemini Vision page descriptions, keyed by dHash of the page image';
@@ -0,0 +1,55 @@
+-- Migration: Corpus version from appended change rows
+-- migration_add_corpus_version.sql bumped a single corpus_state row from a
+-- statement trigger. That row lock is held until commit, so one long /index
+-- transaction blocked every other chunk writer (/embed batch commits, worker
+-- stages, other /index calls) until it finished. The trigger now appends a
+-- row to corpus_changes instead, which takes no shared lock. The version is
+-- corpus_state.version plus the number of change rows visible to the reader,
+-- so it still moves exactly when a chunk change commits.
+-- compact_corpus_version() folds change rows into corpus_state.version.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS corpus_changes (
+    id BIGSERIAL PRIMARY KEY
+);
+
+-- Same triggers as before (chunks_corpus_version, chunks_corpus_version_truncate)
+CREATE OR REPLACE FUNCTION bump_corpus_version()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO corpus_changes DEFAULT VALUES;
+    RETURN NULL;
+END;
+$$;
+
+-- Fold change rows into corpus_state.version. The sum the indexer reads is
+-- unchanged, since both sides commit together. One caller at a time.
+CREATE OR REPLACE FUNCTION compact_corpus_version()
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    folded BIGINT;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('corpus_version')) THEN
+        RETURN;
+    END IF;
+
+    WITH moved AS (
+        DELETE FROM corpus_changes RETURNING id
+    )
+    SELECT COUNT(*) INTO folded FROM moved;
+
+    IF folded > 0 THEN
+        UPDATE corpus_state SET version = version + folded, updated_at = NOW();
+    END IF;
+END;
+$$;
+
+COMMENT ON TABLE corpus_state IS 'Compacted corpus version; the current version adds the rows in corpus_changes (invalidates cached retrieval results)';
+COMMENT ON TABLE corpus_changes IS 'One row per chunk-changing statement, folded into corpus_state by compact_corpus_version()';
+
+COMMIT;
@@ -0,0 +1,66 @@
+-- Migration: Store chunk embeddings as halfvec (16-bit floats)
+-- Halves the size of chunks.embedding and of its HNSW/IVFFlat index; recall@10
+-- stays within noise of float32 for Gemini embeddings (measure with:
+-- python indexer/benchmark.py quantization). Requires pgvector 0.7.0+.
+--
+-- The indexer needs no configuration change: embeddings are still written as
+-- vector and cast on assignment, and ann_index.py picks halfvec_cosine_ops from
+-- the column type. To revert, run the same steps with vector(768),
+-- vector(256) and vector_cosine_ops, and restore match_chunks from schema.sql.
+
+BEGIN;
+
+DROP INDEX IF EXISTS idx_chunks_embedding;
+-- Indexes subvector(...)::vector(256); two-stage queries now cast to
+-- halfvec(256), which that index cannot serve
+DROP INDEX IF EXISTS idx_chunks_embedding_coarse;
+
+ALTER TABLE chunks
+    ALTER COLUMN embedding TYPE halfvec(768) USING embedding::halfvec(768);
+
+-- Same signature as before, so callers keep passing a vector(768) query
+CREATE OR REPLACE FUNCTION match_chunks(
+    query_embedding vector(768),
+    match_count INT DEFAULT 5,
+    filter_document INT DEFAULT NULL
+)
+RETURNS TABLE (
+    id INT,
+    document_id INT,
+    content TEXT,
+    chunk_index INTEGER,
+    similarity FLOAT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        chunks.id,
+        chunks.document_id,
+        chunks.content,
+        chunks.chunk_index,
+        1 - (chunks.embedding <=> query_embedding::halfvec(768)) AS similarity
+    FROM chunks
+    WHERE (filter_document IS NULL OR chunks.document_id = filter_document)
+        AND embedding IS NOT NULL
+        AND status = 'embedded'
+    ORDER BY chunks.embedding <=> query_embedding::halfvec(768)
+    LIMIT match_count;
+END;
+$$;
+
+COMMIT;
+
+-- Outside the transaction so reads continue during the build
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chunks_embedding
+    ON chunks USING hnsw (embedding halfvec_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+-- Coarse index for two-stage retrieval (migration_add_coarse_embedding_index.sql),
+-- with the expression match_chunks_two_stage uses for halfvec columns. Change
+-- 256 to match EMBEDDING_COARSE_DIMENSION if it is set.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chunks_embedding_coarse
+    ON chunks USING hnsw ((subvector(embedding, 1, 256)::halfvec(256)) halfvec_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+COMMENT ON COLUMN chunks.embedding IS 'Gemini embedding stored as halfvec(768)';
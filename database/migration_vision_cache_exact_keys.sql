@@ -0,0 +1,9 @@
+-- Migration: Exact vision cache keys
+-- vision_cache used to be keyed by a 16x16 dHash of the rendered page, so
+-- slides sharing a template got each other's descriptions. Keys are now
+-- "sha256:" hashes of the page content (or "pixels-sha256:" of the render);
+-- the old perceptual keys can never match again, so drop them
+
+DELETE FROM vision_cache WHERE image_hash NOT LIKE '%sha256:%';
+
+COMMENT ON TABLE vision_cache IS 'Cached Gemini Vision page descriptions, keyed by an exact hash of the page content (or rendered pixels)';
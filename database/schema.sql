@@ -1,10 +1,19 @@
 -- TutorAI Database Schema
--- PostgreSQL 14+ with pgvector extension
+-- PostgreSQL 14+ with pgvector 0.7.0+
 
 -- Enable pgvector extension
 CREATE EXTENSION IF NOT EXISTS vector;
 
 -- Drop tables if they exist (for clean setup)
+DROP TABLE IF EXISTS status_count_deltas CASCADE;
+DROP TABLE IF EXISTS status_counts CASCADE;
+DROP TABLE IF EXISTS corpus_changes CASCADE;
+DROP TABLE IF EXISTS corpus_state CASCADE;
+DROP TABLE IF EXISTS chunk_deletions CASCADE;
+DROP TABLE IF EXISTS embedding_cache CASCADE;
+DROP TABLE IF EXISTS vision_cache CASCADE;
+DROP TABLE IF EXISTS document_pages CASCADE;
+DROP TABLE IF EXISTS jobs CASCADE;
 DROP TABLE IF EXISTS feedback CASCADE;
 DROP TABLE IF EXISTS chat_history CASCADE;
 DROP TABLE IF EXISTS chunks CASCADE;
@@ -36,6 +45,7 @@ CREATE TABLE documents (
     status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'processing', 'completed', 'failed')),
     file_size INTEGER,
     error_message TEXT,
+    content_hash TEXT, -- SHA-256 of the file the current chunks were built from
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -49,11 +59,20 @@ CREATE TABLE chunks (
     id SERIAL PRIMARY KEY,
     document_id INTEGER REFERENCES documents(id) ON DELETE CASCADE,
     content TEXT NOT NULL,
-    embedding vector(768),
+    embedding vector(768), -- halfvec(768) after migration_halfvec_embeddings.sql
     chunk_index INTEGER NOT NULL,
+    page_number INTEGER, -- Source page the chunk starts on (NULL for chunks indexed before page tracking)
     status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'embedded', 'failed')),
     error_message TEXT,
     retry_count INTEGER DEFAULT 0,
+    content_hash TEXT, -- SHA-256 of NFKC/whitespace-normalized content
+    -- Full-text index terms, Indonesian and English stems combined
+    content_tsv tsvector GENERATED ALWAYS AS (
+        to_tsvector('indonesian', content) || to_tsvector('english', content)
+    ) STORED,
+    change_xid xid8, -- Last writing transaction, set by trigger (vector index refresh)
+    claimed_by TEXT, -- Embedding run working on the chunk (see run_embedding)
+    claimed_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -61,8 +80,362 @@ CREATE TABLE chunks (
 CREATE INDEX idx_chunks_document_id ON chunks(document_id);
 CREATE INDEX idx_chunks_status ON chunks(status);
 CREATE INDEX idx_chunks_document_status ON chunks(document_id, status);
--- IVFFlat index for fast similarity search
-CREATE INDEX idx_chunks_embedding ON chunks USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+CREATE INDEX idx_chunks_content_hash ON chunks(content_hash);
+CREATE INDEX idx_chunks_claimed_by ON chunks(claimed_by) WHERE claimed_by IS NOT NULL;
+-- Incremental refresh of the indexer's in-memory vector index
+CREATE INDEX idx_chunks_change_xid ON chunks(change_xid);
+-- GIN index for lexical (full-text) search
+CREATE INDEX idx_chunks_content_tsv ON chunks USING GIN (content_tsv);
+-- HNSW index for fast similarity search (needs no training data, so it can be
+-- built on the empty table). To use IVFFlat instead, set ANN_INDEX_TYPE=ivfflat:
+-- indexer/ann_index.py builds it with lists sized to the row count and rebuilds
+-- it as the corpus grows.
+CREATE INDEX idx_chunks_embedding ON chunks USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+-- Coarse HNSW index on the first 256 dimensions (Matryoshka truncation) for
+-- two-stage retrieval; ann_index.py rebuilds it if EMBEDDING_COARSE_DIMENSION changes.
+-- subvector() (and the halfvec casts after migration_halfvec_embeddings.sql)
+-- need pgvector 0.7.0+, which is why the schema as a whole does.
+CREATE INDEX idx_chunks_embedding_coarse ON chunks
+    USING hnsw ((subvector(embedding, 1, 256)::vector(256)) vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+-- Ingestion job queue (claimed by indexer/worker.py with FOR UPDATE SKIP LOCKED)
+CREATE TABLE jobs (
+    id SERIAL PRIMARY KEY,
+    document_id INTEGER REFERENCES documents(id) ON DELETE CASCADE,
+    stage TEXT NOT NULL CHECK (stage IN ('extract', 'chunk', 'embed')),
+    status TEXT DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'completed', 'failed')),
+    payload JSONB DEFAULT '{}'::jsonb,
+    progress INTEGER DEFAULT 0,
+    progress_total INTEGER,
+    attempts INTEGER DEFAULT 0,
+    max_attempts INTEGER DEFAULT 3,
+    locked_by TEXT,
+    heartbeat_at TIMESTAMP WITH TIME ZONE,
+    run_after TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    error_message TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX idx_jobs_queued ON jobs(stage, run_after, id) WHERE status = 'queued';
+CREATE INDEX idx_jobs_running ON jobs(heartbeat_at) WHERE status = 'running';
+CREATE INDEX idx_jobs_document_id ON jobs(document_id);
+
+-- Extracted page texts handed from extract jobs to chunk jobs, streamed in
+-- page order and deleted after chunking
+CREATE TABLE document_pages (
+    document_id INTEGER REFERENCES documents(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL, -- Order within the document (vision descriptions follow the pages)
+    page_number INTEGER,
+    content TEXT NOT NULL,
+    PRIMARY KEY (document_id, seq)
+);
+
+-- Gemini Vision page descriptions keyed by an exact page content hash
+CREATE TABLE vision_cache (
+    image_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    description TEXT NOT NULL, -- Empty string = page has no significant visuals
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (image_hash, model)
+);
+
+-- Embedding cache shared by all indexer processes (see indexer/embedding_cache.py)
+CREATE TABLE embedding_cache (
+    model TEXT NOT NULL,
+    task_type TEXT NOT NULL,
+    dimensionality INTEGER NOT NULL,
+    text_hash TEXT NOT NULL, -- SHA-256 of the exact embedded text
+    embedding REAL[] NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (model, task_type, dimensionality, text_hash)
+);
+
+CREATE INDEX idx_embedding_cache_created_at ON embedding_cache(created_at);
+
+-- Change tracking for the indexer's in-memory vector index: chunks are
+-- stamped with the writing transaction's ID, which (unlike a timestamp)
+-- tells a poller which rows may not have been visible to its last snapshot,
+-- and deleted chunk IDs are kept for a day in chunk_deletions
+CREATE OR REPLACE FUNCTION stamp_chunk_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id();
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER chunks_change_xid
+    BEFORE INSERT OR UPDATE ON chunks
+    FOR EACH ROW EXECUTE FUNCTION stamp_chunk_change();
+
+CREATE TABLE chunk_deletions (
+    chunk_id INTEGER, -- NULL for a TRUNCATE
+    deleted_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX idx_chunk_deletions_xid ON chunk_deletions(deleted_xid);
+CREATE INDEX idx_chunk_deletions_deleted_at ON chunk_deletions(deleted_at);
+
+CREATE OR REPLACE FUNCTION record_chunk_deletions()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        INSERT INTO chunk_deletions (chunk_id) VALUES (NULL);
+    ELSE
+        INSERT INTO chunk_deletions (chunk_id) SELECT id FROM old_rows;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER chunks_deletions
+    AFTER DELETE ON chunks
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_chunk_deletions();
+
+CREATE TRIGGER chunks_deletions_truncate
+    AFTER TRUNCATE ON chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION record_chunk_deletions();
+
+-- Corpus version: moves whenever the set of searchable chunks changes, so
+-- the indexer's retrieval cache can drop stale results. Triggers append a
+-- row to corpus_changes rather than bumping a shared row, whose lock a long
+-- /index transaction would hold until commit, blocking every other chunk
+-- writer. The version is corpus_state.version plus the visible change rows;
+-- compact_corpus_version() folds the rows in.
+CREATE TABLE corpus_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id), -- Single row
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+INSERT INTO corpus_state DEFAULT VALUES;
+
+CREATE TABLE corpus_changes (
+    id BIGSERIAL PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION bump_corpus_version()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO corpus_changes DEFAULT VALUES;
+    RETURN NULL;
+END;
+$$;
+
+-- One caller at a time; the others skip, since the sum is exact either way
+CREATE OR REPLACE FUNCTION compact_corpus_version()
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    folded BIGINT;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('corpus_version')) THEN
+        RETURN;
+    END IF;
+
+    WITH moved AS (
+        DELETE FROM corpus_changes RETURNING id
+    )
+    SELECT COUNT(*) INTO folded FROM moved;
+
+    IF folded > 0 THEN
+        UPDATE corpus_state SET version = version + folded, updated_at = NOW();
+    END IF;
+END;
+$$;
+
+-- Statement-level, so a batch of 100 embeddings bumps the version once
+CREATE TRIGGER chunks_corpus_version
+    AFTER INSERT OR DELETE OR UPDATE OF content, embedding, status, chunk_index ON chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
+
+CREATE TRIGGER chunks_corpus_version_truncate
+    AFTER TRUNCATE ON chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
+
+-- Maintained status counts, so /stats reads a handful of rows instead of
+-- scanning chunks. Statement-level triggers append one delta row per
+-- (status, has embedding) group touched; writers never update a shared
+-- row, so concurrent embed batches do not contend or deadlock on them.
+-- compact_status_counts() folds the deltas into status_counts.
+CREATE TABLE status_counts (
+    table_name TEXT NOT NULL, -- 'documents' or 'chunks'
+    status TEXT NOT NULL,
+    with_embedding BOOLEAN NOT NULL DEFAULT FALSE, -- chunks.embedding IS NOT NULL
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, status, with_embedding)
+);
+
+CREATE TABLE status_count_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    with_embedding BOOLEAN NOT NULL DEFAULT FALSE,
+    delta BIGINT NOT NULL
+);
+
+-- Exact current counts: compacted rows plus deltas not yet folded in
+CREATE VIEW status_count_totals AS
+SELECT table_name, status, with_embedding, SUM(count)::bigint AS count
+FROM (
+    SELECT table_name, status, with_embedding, count FROM status_counts
+    UNION ALL
+    SELECT table_name, status, with_embedding, delta FROM status_count_deltas
+) AS c
+GROUP BY table_name, status, with_embedding;
+
+CREATE OR REPLACE FUNCTION count_document_statuses()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM status_count_deltas WHERE table_name = 'documents';
+        DELETE FROM status_counts WHERE table_name = 'documents';
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO status_count_deltas (table_name, status, delta)
+        SELECT 'documents', COALESCE(status, 'unknown'), COUNT(*) FROM new_rows GROUP BY 2;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO status_count_deltas (table_name, status, delta)
+        SELECT 'documents', COALESCE(status, 'unknown'), -COUNT(*) FROM old_rows GROUP BY 2;
+    ELSE
+        INSERT INTO status_count_deltas (table_name, status, delta)
+        SELECT 'documents', status, SUM(delta)
+        FROM (
+            SELECT COALESCE(status, 'unknown') AS status, 1 AS delta FROM new_rows
+            UNION ALL
+            SELECT COALESCE(status, 'unknown'), -1 FROM old_rows
+        ) AS d
+        GROUP BY status
+        HAVING SUM(delta) <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION count_chunk_statuses()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM status_count_deltas WHERE table_name = 'chunks';
+        DELETE FROM status_counts WHERE table_name = 'chunks';
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO status_count_deltas (table_name, status, with_embedding, delta)
+        SELECT 'chunks', COALESCE(status, 'unknown'), embedding IS NOT NULL, COUNT(*)
+        FROM new_rows GROUP BY 2, 3;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO status_count_deltas (table_name, status, with_embedding, delta)
+        SELECT 'chunks', COALESCE(status, 'unknown'), embedding IS NOT NULL, -COUNT(*)
+        FROM old_rows GROUP BY 2, 3;
+    ELSE
+        -- Re-indexed or moved chunks net to zero and add no delta rows
+        INSERT INTO status_count_deltas (table_name, status, with_embedding, delta)
+        SELECT 'chunks', status, with_embedding, SUM(delta)
+        FROM (
+            SELECT COALESCE(status, 'unknown') AS status,
+                   embedding IS NOT NULL AS with_embedding,
+                   1 AS delta
+            FROM new_rows
+            UNION ALL
+            SELECT COALESCE(status, 'unknown'), embedding IS NOT NULL, -1 FROM old_rows
+        ) AS d
+        GROUP BY status, with_embedding
+        HAVING SUM(delta) <> 0;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Transition tables need one trigger per event
+CREATE TRIGGER documents_status_counts_insert
+    AFTER INSERT ON documents REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_document_statuses();
+
+CREATE TRIGGER documents_status_counts_update
+    AFTER UPDATE ON documents REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_document_statuses();
+
+CREATE TRIGGER documents_status_counts_delete
+    AFTER DELETE ON documents REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_document_statuses();
+
+CREATE TRIGGER documents_status_counts_truncate
+    AFTER TRUNCATE ON documents
+    FOR EACH STATEMENT EXECUTE FUNCTION count_document_statuses();
+
+CREATE TRIGGER chunks_status_counts_insert
+    AFTER INSERT ON chunks REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_chunk_statuses();
+
+CREATE TRIGGER chunks_status_counts_update
+    AFTER UPDATE ON chunks REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_chunk_statuses();
+
+CREATE TRIGGER chunks_status_counts_delete
+    AFTER DELETE ON chunks REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_chunk_statuses();
+
+CREATE TRIGGER chunks_status_counts_truncate
+    AFTER TRUNCATE ON chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION count_chunk_statuses();
+
+-- Fold pending deltas into status_counts (called by /stats; one caller at a
+-- time, the others skip since status_count_totals is exact either way)
+CREATE OR REPLACE FUNCTION compact_status_counts()
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('status_counts')) THEN
+        RETURN;
+    END IF;
+
+    WITH moved AS (
+        DELETE FROM status_count_deltas
+        RETURNING table_name, status, with_embedding, delta
+    )
+    INSERT INTO status_counts AS s (table_name, status, with_embedding, count)
+    SELECT table_name, status, with_embedding, SUM(delta)
+    FROM moved
+    GROUP BY table_name, status, with_embedding
+    ON CONFLICT (table_name, status, with_embedding)
+    DO UPDATE SET count = s.count + EXCLUDED.count;
+END;
+$$;
+
+-- Rebuild the counters from a full scan (initial fill and audits). Blocks
+-- writes to documents and chunks while it runs.
+CREATE OR REPLACE FUNCTION recount_status_counts()
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('status_counts'));
+    LOCK TABLE documents, chunks IN SHARE MODE;
+
+    DELETE FROM status_count_deltas;
+    DELETE FROM status_counts;
+
+    INSERT INTO status_counts (table_name, status, count)
+    SELECT 'documents', COALESCE(status, 'unknown'), COUNT(*) FROM documents GROUP BY 2;
+
+    INSERT INTO status_counts (table_name, status, with_embedding, count)
+    SELECT 'chunks', COALESCE(status, 'unknown'), embedding IS NOT NULL, COUNT(*)
+    FROM chunks GROUP BY 2, 3;
+END;
+$$;
 
 -- Chat history table
 CREATE TABLE chat_history (
@@ -125,6 +498,90 @@ BEGIN
 END;
 $$;
 
+-- Function for lexical search over the full-text index
+CREATE OR REPLACE FUNCTION match_chunks_lexical(
+    query_text TEXT,
+    match_count INT DEFAULT 5,
+    filter_document INT DEFAULT NULL
+)
+RETURNS TABLE (
+    id INT,
+    document_id INT,
+    content TEXT,
+    chunk_index INTEGER,
+    similarity FLOAT
+)
+LANGUAGE sql STABLE
+AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('indonesian', query_text)
+            || websearch_to_tsquery('english', query_text) AS query
+    )
+    SELECT
+        chunks.id,
+        chunks.document_id,
+        chunks.content,
+        chunks.chunk_index,
+        ts_rank_cd(chunks.content_tsv, q.query)::FLOAT AS similarity
+    FROM chunks, q
+    WHERE chunks.content_tsv @@ q.query
+        AND (filter_document IS NULL OR chunks.document_id = filter_document)
+    ORDER BY similarity DESC, chunks.id
+    LIMIT match_count;
+$$;
+
+-- Function for hybrid search: reciprocal rank fusion of vector and lexical results
+CREATE OR REPLACE FUNCTION hybrid_match_chunks(
+    query_embedding vector(768),
+    query_text TEXT,
+    match_count INT DEFAULT 5,
+    filter_document INT DEFAULT NULL,
+    candidate_count INT DEFAULT 50,
+    rrf_k INT DEFAULT 60
+)
+RETURNS TABLE (
+    id INT,
+    document_id INT,
+    content TEXT,
+    chunk_index INTEGER,
+    similarity FLOAT,
+    vector_rank INT,
+    lexical_rank INT
+)
+LANGUAGE sql STABLE
+AS $$
+    WITH vector_hits AS (
+        SELECT v.id, (row_number() OVER (ORDER BY v.similarity DESC))::INT AS rank
+        FROM match_chunks(query_embedding, candidate_count, filter_document) v
+    ),
+    lexical_hits AS (
+        SELECT l.id, (row_number() OVER (ORDER BY l.similarity DESC, l.id))::INT AS rank
+        FROM match_chunks_lexical(query_text, candidate_count, filter_document) l
+    ),
+    fused AS (
+        SELECT
+            COALESCE(vector_hits.id, lexical_hits.id) AS id,
+            COALESCE(1.0 / (rrf_k + vector_hits.rank), 0)
+                + COALESCE(1.0 / (rrf_k + lexical_hits.rank), 0) AS score,
+            vector_hits.rank AS vector_rank,
+            lexical_hits.rank AS lexical_rank
+        FROM vector_hits
+        FULL OUTER JOIN lexical_hits ON vector_hits.id = lexical_hits.id
+    )
+    SELECT
+        chunks.id,
+        chunks.document_id,
+        chunks.content,
+        chunks.chunk_index,
+        fused.score::FLOAT AS similarity,
+        fused.vector_rank,
+        fused.lexical_rank
+    FROM fused
+    JOIN chunks ON chunks.id = fused.id
+    ORDER BY fused.score DESC, chunks.id
+    LIMIT match_count;
+$$;
+
 -- Create default admin user (password: admin123 - hashed with bcrypt)
 -- Note: This is for development only. Change password in production!
 INSERT INTO profiles (email, password_hash, name, role) VALUES 
@@ -138,6 +595,17 @@ INSERT INTO profiles (email, password_hash, name, role) VALUES
 COMMENT ON TABLE profiles IS 'User profiles with JWT authentication';
 COMMENT ON TABLE documents IS 'Uploaded PDF documents for RAG';
 COMMENT ON TABLE chunks IS 'Text chunks with Gemini embeddings (768-dim). Status: pending (chunked, waiting for embedding), embedded (completed), failed (embedding error)';
+COMMENT ON TABLE jobs IS 'Durable ingestion queue. Stages: extract -> chunk -> embed. Status: queued, running, completed, failed';
+COMMENT ON TABLE document_pages IS 'Per-page extracted text handed from extract to chunk jobs, cleared after chunking';
+COMMENT ON TABLE vision_cache IS 'Cached Gemini Vision page descriptions, keyed by an exact hash of the page content (or rendered pixels)';
+COMMENT ON TABLE embedding_cache IS 'Cached embeddings keyed by model, task type, dimensionality and text hash; pruned by age and row count';
+COMMENT ON TABLE chunk_deletions IS 'Deleted chunk IDs for the indexer''s in-memory vector index refresh; pruned after a day';
+COMMENT ON TABLE corpus_state IS 'Compacted corpus version; the current version adds the rows in corpus_changes (invalidates cached retrieval results)';
+COMMENT ON TABLE corpus_changes IS 'One row per chunk-changing statement, folded into corpus_state by compact_corpus_version()';
+COMMENT ON TABLE status_counts IS 'Document and chunk counts per status (chunks also split by embedding presence), maintained by triggers for /stats';
+COMMENT ON TABLE status_count_deltas IS 'Per-statement changes to status_counts, folded in by compact_status_counts()';
 COMMENT ON TABLE chat_history IS 'User chat conversations with AI';
 COMMENT ON TABLE feedback IS 'User feedback on chat responses (thumbs up/down)';
 COMMENT ON FUNCTION match_chunks IS 'Semantic similarity search using cosine distance';
+COMMENT ON FUNCTION match_chunks_lexical IS 'Full-text search (Indonesian + English) ranked by ts_rank_cd';
+COMMENT ON FUNCTION hybrid_match_chunks IS 'Hybrid search: reciprocal rank fusion of match_chunks and match_chunks_lexical';
@@ -0,0 +1,462 @@
+"""
+ANN index lifecycle for TutorAI
+Builds and maintains the approximate nearest-neighbour index on chunks.embedding
+
+HNSW needs no training data and keeps its recall as the corpus grows.
+IVFFlat clusters the rows that exist when it is built, so it is rebuilt with
+`lists` derived from the row count whenever the corpus has grown or shrunk
+enough for the old centroids to be wrong.
+
+A second, coarse HNSW index covers the first EMBEDDING_COARSE_DIMENSION
+components of each embedding (a Matryoshka truncation) for two-stage
+retrieval: candidates from the small index, rescored on the full vectors.
+
+Usage:
+    python ann_index.py status
+    python ann_index.py rebuild --type ivfflat
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    from db import get_db_connection, vector_literal
+except ImportError:
+    from .db import get_db_connection, vector_literal
+
+load_dotenv()
+
+INDEX_NAME = "idx_chunks_embedding"
+INDEX_TYPES = ["hnsw", "ivfflat"]
+
+COARSE_INDEX_NAME = "idx_chunks_embedding_coarse"
+# Matryoshka prefix length for two-stage retrieval (0 disables the coarse index)
+EMBEDDING_COARSE_DIMENSION = int(os.getenv("EMBEDDING_COARSE_DIMENSION", "256"))
+
+ANN_INDEX_TYPE = os.getenv("ANN_INDEX_TYPE", "hnsw")
+ANN_AUTO_REBUILD = os.getenv("ANN_AUTO_REBUILD", "true").lower() == "true"
+ANN_BUILD_MEMORY = os.getenv("ANN_BUILD_MEMORY", "256MB")
+
+# Build parameters (pgvector defaults)
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+
+# Query-time defaults, overridable per /retrieve request
+# (tune with: python benchmark.py ann-recall)
+ANN_EF_SEARCH = int(os.getenv("ANN_EF_SEARCH", "40"))
+ANN_PROBES = int(os.getenv("ANN_PROBES", "10"))
+
+# Below this many embedded rows IVFFlat is not worth building (exact scan is fast)
+IVFFLAT_MIN_ROWS = int(os.getenv("IVFFLAT_MIN_ROWS", "1000"))
+
+# Rebuild IVFFlat once the ideal lists is outside [current / 2, current * 2]
+IVFFLAT_REBUILD_RATIO = 2.0
+
+# Serializes rebuilds across indexer processes and workers
+REBUILD_LOCK_KEY = 7684001
+
+
+def ivfflat_lists(row_count: int) -> int:
+    """pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond"""
+    if row_count <= 1_000_000:
+        return max(1, row_count // 1000)
+    return int(math.sqrt(row_count))
+
+
+def coarse_expression(column_type: str, dimension: int) -> str:
+    """
+    Indexed expression for the truncated embedding
+
+    Queries must repeat it verbatim to use the coarse index. Cosine distance
+    ignores vector length, so the prefix needs no renormalization.
+    """
+    base_type = column_type.split("(")[0]
+    return f"subvector(embedding, 1, {dimension})::{base_type}({dimension})"
+
+
+def _parse_reloptions(reloptions) -> Dict[str, int]:
+    options = {}
+    for option in reloptions or []:
+        key, _, value = option.partition("=")
+        options[key] = int(value) if value.isdigit() else value
+    return options
+
+
+def _parse_coarse_indexdef(indexdef: str) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Prefix length and vector type (vector or halfvec) of a coarse index
+
+    The type comes from the operator class, which is what a query's cast
+    has to match for the planner to use the index.
+    """
+    dimension = re.search(r"subvector\(embedding, 1, (\d+)\)", indexdef)
+    opclass = re.search(r"\b(\w+)_cosine_ops\b", indexdef)
+    return (
+        int(dimension.group(1)) if dimension else None,
+        opclass.group(1) if opclass else None,
+    )
+
+
+def get_embedding_column_type(cursor) -> str:
+    """chunks.embedding type, e.g. vector(768) or halfvec(768)"""
+    cursor.execute(
+        """
+        SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = 'chunks'::regclass AND attname = 'embedding'
+        """
+    )
+    return cursor.fetchone()[0]
+
+
+def embedding_dimension_mismatch(column_type: str, dimension: int) -> Optional[str]:
+    """Why `dimension`-float embeddings cannot be stored in the column, or None"""
+    match = re.fullmatch(r"(\w+)\((\d+)\)", column_type)
+    # An unconstrained vector column takes any dimension (but cannot be indexed)
+    if match and int(match.group(2)) != dimension:
+        return (
+            f"chunks.embedding is {column_type} but EMBEDDING_DIMENSION is {dimension}; "
+            f"change one of them (and re-embed) so they match"
+        )
+    return None
+
+
+def get_index_status(cursor) -> Dict[str, Any]:
+    """
+    Describe the current ANN index
+
+    Returns:
+        Dict with column_type (vector(768) or halfvec(768)), type (None if
+        there is no index), options, valid, size_bytes, row_estimate
+        (planner estimate of chunks rows), and the coarse index's
+        coarse_dimension, coarse_type and coarse_valid
+    """
+    cursor.execute(
+        """
+        SELECT am.amname, c.reloptions, i.indisvalid, pg_relation_size(c.oid)
+        FROM pg_class c
+        JOIN pg_index i ON i.indexrelid = c.oid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE c.relname = %s
+        """,
+        (INDEX_NAME,),
+    )
+    row = cursor.fetchone()
+
+    column_type = get_embedding_column_type(cursor)
+
+    cursor.execute(
+        """
+        SELECT pg_get_indexdef(c.oid), i.indisvalid
+        FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.relname = %s
+        """,
+        (COARSE_INDEX_NAME,),
+    )
+    coarse_row = cursor.fetchone()
+    coarse_dimension, coarse_type = (
+        _parse_coarse_indexdef(coarse_row[0]) if coarse_row else (None, None)
+    )
+
+    # reltuples is -1 before the first ANALYZE; fall back to counting
+    cursor.execute("SELECT reltuples::BIGINT FROM pg_class WHERE relname = 'chunks'")
+    estimate = cursor.fetchone()
+    if not estimate or estimate[0] < 0:
+        cursor.execute("SELECT COUNT(*) FROM chunks WHERE embedding IS NOT NULL")
+        estimate = cursor.fetchone()
+
+    return {
+        "name": INDEX_NAME,
+        "column_type": column_type,
+        "type": row[0] if row else None,
+        "options": _parse_reloptions(row[1]) if row else {},
+        "valid": bool(row[2]) if row else False,
+        "size_bytes": row[3] if row else 0,
+        "row_estimate": int(estimate[0]),
+        "coarse_dimension": coarse_dimension,
+        "coarse_type": coarse_type,
+        "coarse_valid": bool(coarse_row[1]) if coarse_row else False,
+    }
+
+
+def rebuild_reason(status: Dict[str, Any], index_type: str) -> Optional[str]:
+    """Why the index needs rebuilding, or None if it is fine"""
+    if index_type == "ivfflat" and status["row_estimate"] < IVFFLAT_MIN_ROWS:
+        return None
+    if status["type"] is None:
+        return "missing"
+    if not status["valid"]:
+        return "invalid"
+    if status["type"] != index_type:
+        return f"type changed from {status['type']}"
+    if index_type == "ivfflat":
+        current = status["options"].get("lists", 100)
+        target = ivfflat_lists(status["row_estimate"])
+        if not current / IVFFLAT_REBUILD_RATIO <= target <= current * IVFFLAT_REBUILD_RATIO:
+            return f"lists {current} -> {target}"
+    return None
+
+
+def coarse_rebuild_reason(status: Dict[str, Any], dimension: int) -> Optional[str]:
+    """Why the coarse index needs rebuilding, or None if it is fine (or disabled)"""
+    if dimension <= 0:
+        return None
+    if status["coarse_dimension"] is None:
+        return "missing"
+    if not status["coarse_valid"]:
+        return "invalid"
+    if status["coarse_dimension"] != dimension:
+        return f"dimension {status['coarse_dimension']} -> {dimension}"
+    # e.g. still vector after migration_halfvec_embeddings.sql: queries cast
+    # to halfvec and would no longer match it
+    column_base_type = status["column_type"].split("(")[0]
+    if status["coarse_type"] != column_base_type:
+        return f"type {status['coarse_type']} -> {column_base_type}"
+    return None
+
+
+def _build_and_swap(cursor, name: str, create_sql: str):
+    """Build CONCURRENTLY under a temporary name, then replace `name` with it"""
+    new_name = f"{name}_new"
+    # Leftover from an interrupted concurrent build
+    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}")
+    cursor.execute(create_sql.format(name=new_name))
+    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    cursor.execute(f"ALTER INDEX {new_name} RENAME TO {name}")
+
+
+def _index_definition(index_type: str, row_count: int, column_type: str) -> str:
+    # vector(768) -> vector_cosine_ops, halfvec(768) -> halfvec_cosine_ops
+    opclass = f"{column_type.split('(')[0]}_cosine_ops"
+    if index_type == "hnsw":
+        options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+    else:
+        options = f"lists = {ivfflat_lists(row_count)}"
+    return (
+        f"CREATE INDEX CONCURRENTLY {{name}} ON chunks "
+        f"USING {index_type} (embedding {opclass}) WITH ({options})"
+    )
+
+
+def rebuild_index(
+    index_type: str = ANN_INDEX_TYPE, force: bool = False
+) -> Dict[str, Any]:
+    """
+    Rebuild the ANN index if it is missing, invalid, of another type or
+    (IVFFlat) sized for a different row count, and the coarse index if its
+    dimension differs from EMBEDDING_COARSE_DIMENSION or its type from the
+    embedding column's
+
+    The new index is built CONCURRENTLY under a temporary name and swapped
+    in, so retrieval keeps using the old index during the build. The build
+    session has no statement timeout, since a build on a real corpus takes
+    far longer than the pool's DB_STATEMENT_TIMEOUT_MS. Only one process
+    rebuilds at a time; others return immediately.
+
+    Returns:
+        Dict with rebuilt/reason, coarse_rebuilt/coarse_reason and the
+        resulting index status
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown ANN index type: {index_type}")
+
+    conn = get_db_connection()
+    conn.autocommit = True  # CREATE/DROP INDEX CONCURRENTLY can't run in a transaction
+    cursor = conn.cursor()
+
+    try:
+        # get_db_connection sets a 30s statement_timeout; a cancelled build
+        # would leave an invalid index behind and fail the same way every time
+        cursor.execute("SET statement_timeout = 0")
+        cursor.execute("SET maintenance_work_mem = %s", (ANN_BUILD_MEMORY,))
+
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (REBUILD_LOCK_KEY,))
+        if not cursor.fetchone()[0]:
+            return {"rebuilt": False, "reason": "rebuild already running"}
+
+        try:
+            status = get_index_status(cursor)
+            reason = "forced" if force else rebuild_reason(status, index_type)
+            coarse_reason = coarse_rebuild_reason(status, EMBEDDING_COARSE_DIMENSION)
+            result = {
+                "rebuilt": False,
+                "reason": reason,
+                "coarse_rebuilt": False,
+                "coarse_reason": coarse_reason,
+            }
+            if not reason and not coarse_reason:
+                return {**result, "index": status}
+
+            if reason:
+                cursor.execute("SELECT COUNT(*) FROM chunks WHERE embedding IS NOT NULL")
+                row_count = cursor.fetchone()[0]
+                print(f"Rebuilding {INDEX_NAME} as {index_type} ({reason}, {row_count} rows)")
+                _build_and_swap(
+                    cursor,
+                    INDEX_NAME,
+                    _index_definition(index_type, row_count, status["column_type"]),
+                )
+                result["rebuilt"] = True
+
+            if coarse_reason:
+                print(f"Rebuilding {COARSE_INDEX_NAME} ({coarse_reason})")
+                expression = coarse_expression(status["column_type"], EMBEDDING_COARSE_DIMENSION)
+                opclass = f"{status['column_type'].split('(')[0]}_cosine_ops"
+                _build_and_swap(
+                    cursor,
+                    COARSE_INDEX_NAME,
+                    f"CREATE INDEX CONCURRENTLY {{name}} ON chunks USING hnsw (({expression}) {opclass}) "
+                    f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})",
+                )
+                result["coarse_rebuilt"] = True
+
+            cursor.execute("ANALYZE chunks")
+            # Two-stage queries in this process pick up a changed column type now
+            reset_embedding_column_type()
+            return {**result, "index": get_index_status(cursor)}
+
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (REBUILD_LOCK_KEY,))
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# chunks.embedding type, e.g. vector(768) or halfvec(768), and when it was
+# read. Re-read periodically so a running server notices a halfvec migration.
+_embedding_column_type: Optional[Tuple[str, float]] = None
+COLUMN_TYPE_TTL_SECONDS = 60.0
+
+
+def reset_embedding_column_type():
+    """Make the next two-stage search re-read the embedding column type"""
+    global _embedding_column_type
+    _embedding_column_type = None
+
+
+async def _get_embedding_column_type(conn) -> str:
+    global _embedding_column_type
+    now = time.monotonic()
+    if _embedding_column_type is None or now - _embedding_column_type[1] > COLUMN_TYPE_TTL_SECONDS:
+        column_type = await conn.fetchval(
+            """
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'chunks'::regclass AND attname = 'embedding'
+            """
+        )
+        _embedding_column_type = (column_type, now)
+    return _embedding_column_type[0]
+
+
+async def match_chunks_two_stage(
+    conn,
+    query_embedding: Sequence[float],
+    match_count: int,
+    filter_document: Optional[int] = None,
+    coarse_dimension: int = EMBEDDING_COARSE_DIMENSION,
+    candidate_count: int = 100,
+) -> List[Any]:
+    """
+    Two-stage vector search on an asyncpg connection
+
+    Stage one takes candidate_count chunks from the coarse index on the
+    first coarse_dimension components; stage two rescores them exactly on
+    the full embeddings. Same row shape as match_chunks.
+    """
+    column_type = await _get_embedding_column_type(conn)
+    base_type = column_type.split("(")[0]
+
+    return await conn.fetch(
+        f"""
+        SELECT
+            chunks.id,
+            chunks.document_id,
+            chunks.content,
+            chunks.chunk_index,
+            1 - (chunks.embedding <=> $1::text::{column_type}) AS similarity
+        FROM (
+            SELECT id FROM chunks
+            WHERE embedding IS NOT NULL
+              AND status = 'embedded'
+              AND ($3::int IS NULL OR document_id = $3)
+            ORDER BY {coarse_expression(column_type, coarse_dimension)}
+                <=> $4::text::{base_type}({coarse_dimension})
+            LIMIT $5
+        ) candidates
+        JOIN chunks ON chunks.id = candidates.id
+        ORDER BY similarity DESC
+        LIMIT $2
+        """,
+        vector_literal(query_embedding),
+        match_count,
+        filter_document,
+        vector_literal(query_embedding[:coarse_dimension]),
+        candidate_count,
+    )
+
+
+_rebuild_thread: Optional[threading.Thread] = None
+_rebuild_thread_lock = threading.Lock()
+
+
+def _rebuild_in_background():
+    try:
+        result = rebuild_index()
+        if result["rebuilt"]:
+            print(f"ANN index rebuilt: {result['reason']}")
+        if result.get("coarse_rebuilt"):
+            print(f"Coarse ANN index rebuilt: {result['coarse_reason']}")
+    except Exception as e:
+        print(f"ANN index rebuild failed: {e}")
+
+
+def maybe_rebuild_index() -> bool:
+    """
+    Start a rebuild check in a background thread after bulk ingestion
+
+    Returns at once, so /embed and embed jobs never wait for an index
+    build. At most one check runs per process. If the process exits
+    mid-build, the half-built index is dropped by the next rebuild.
+    Never raises.
+
+    Returns:
+        True if a check was started
+    """
+    global _rebuild_thread
+    if not ANN_AUTO_REBUILD:
+        return False
+
+    with _rebuild_thread_lock:
+        if _rebuild_thread is not None and _rebuild_thread.is_alive():
+            return False
+        _rebuild_thread = threading.Thread(
+            target=_rebuild_in_background, name="ann-index-rebuild", daemon=True
+        )
+        _rebuild_thread.start()
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TutorAI ANN index lifecycle")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="Show the current index")
+    rebuild_parser = subparsers.add_parser("rebuild", help="Rebuild if needed")
+    rebuild_parser.add_argument("--type", choices=INDEX_TYPES, default=ANN_INDEX_TYPE)
+    rebuild_parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        conn = get_db_connection()
+        with conn.cursor() as cursor:
+            print(json.dumps(get_index_status(cursor), indent=2))
+        conn.close()
+    else:
+        print(json.dumps(rebuild_index(args.type, args.force), indent=2, default=str))
@@ -3,32 +3,122 @@ Chunker and Embedder module for TutorAI
 Handles semantic text chunking and Gemini API embedding generation
 """
 
+import asyncio
+import bisect
+import functools
+import hashlib
 import re
-from typing import List, Dict, Any
-import google.generativeai as genai
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 import os
 from dotenv import load_dotenv
-from langchain_text_splitters import (
-    RecursiveCharacterTextSplitter,
-    NLTKTextSplitter,
-)
-import nltk
+
+try:
+    from embedding_cache import embedding_cache
+    from metrics import INGEST_STAGE_SECONDS, timed_provider_call
+except ImportError:
+    from .embedding_cache import embedding_cache
+    from .metrics import INGEST_STAGE_SECONDS, timed_provider_call
 
 load_dotenv()
 
-# Configure Gemini API
+# Gemini API key (checked when the first embedding is requested, not at import)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
 
-genai.configure(api_key=GEMINI_API_KEY)
+# Download the NLTK punkt model on first use if it is not installed
+NLTK_AUTO_DOWNLOAD = os.getenv("NLTK_AUTO_DOWNLOAD", "true").lower() == "true"
 
-# Download NLTK data for semantic chunking (if not already downloaded)
-try:
-    nltk.data.find("tokenizers/punkt")
-except LookupError:
-    nltk.download("punkt", quiet=True)
-    nltk.download("punkt_tab", quiet=True)
+# Embedding model settings. The dimension must match chunks.embedding
+# (vector(768) in schema.sql); the indexer checks it at startup.
+EMBEDDING_MODEL = "models/gemini-embedding-001"
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "768"))
+
+# Chunks of text chunk_pages buffers before splitting (bounds its memory)
+CHUNK_WINDOW_CHUNKS = 8
+
+# Optional per-chunk token limit on top of chunk_size (0 = characters only)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0")) or None
+
+# Characters past chunk_size the simple method looks through for a sentence end
+SIMPLE_BOUNDARY_SEARCH = 100
+
+# Cut points for recursive splitting, strongest first (cleaned text has no
+# newlines, but raw text passed to the splitters may)
+RECURSIVE_SEPARATORS = ["\n\n", "\n", ". ", "! ", "? ", "; ", ", ", " "]
+_UNIT_SEPARATORS = RECURSIVE_SEPARATORS.index(". ") + 1
+
+# Precompiled cleaning patterns (page number forms fused into one pass)
+_SPECIAL_CHARS = re.compile(r"[^\w\s.,!?;:()\-\'\"]+")
+_PAGE_NUMBERS = re.compile(r"\b(?:[Pp]age\s+\d+|p\.\s*\d+)\b")
+_TOKENS = re.compile(r"\w+|[^\w\s]")
+
+Span = Tuple[int, int]
+
+# Maximum number of texts the Gemini batch embed API accepts per request
+MAX_EMBED_BATCH_SIZE = 100
+
+# Threads for query embeddings requested from async endpoints
+QUERY_EMBED_CONCURRENCY = int(os.getenv("QUERY_EMBED_CONCURRENCY", "32"))
+query_embed_executor = ThreadPoolExecutor(
+    max_workers=QUERY_EMBED_CONCURRENCY, thread_name_prefix="embed-query"
+)
+
+# Stage histograms, bound once so the hot path skips the label lookup
+_chunking_seconds = INGEST_STAGE_SECONDS.labels("chunking")
+_embedding_seconds = INGEST_STAGE_SECONDS.labels("embedding")
+
+_warned = set()
+
+
+def _warn_once(message: str):
+    if message not in _warned:
+        _warned.add(message)
+        print(message)
+
+
+@functools.lru_cache(maxsize=None)
+def get_genai():
+    """
+    google.generativeai, imported and configured on first use
+
+    Importing the SDK (grpc, protobuf) dominates startup, so modules that
+    only chunk or serve cached results never pay for it.
+
+    Raises:
+        ValueError: If GEMINI_API_KEY is not set
+    """
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY not found in environment variables")
+
+    import google.generativeai as genai
+
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai
+
+
+def _embed_content(content, task_type: str) -> Dict[str, Any]:
+    """
+    One Gemini embed_content request, counted and timed for /metrics
+
+    Document batches are observed as the "embedding" ingest stage; query
+    embeddings are timed by /retrieve itself.
+    """
+    if task_type == "retrieval_query":
+        operation, stage_histogram = "embed_query", None
+    else:
+        operation, stage_histogram = "embed_document", _embedding_seconds
+
+    return timed_provider_call(
+        operation,
+        stage_histogram,
+        get_genai().embed_content,
+        model=EMBEDDING_MODEL,
+        content=content,
+        task_type=task_type,
+        output_dimensionality=EMBEDDING_DIMENSION,  # Match database schema
+    )
 
 
 def clean_text(text: str) -> str:
@@ -41,24 +131,331 @@ def clean_text(text: str) -> str:
     Returns:
         Cleaned text
     """
-    # Remove excessive whitespace
-    text = re.sub(r"\s+", " ", text)
+    # Remove excessive whitespace (str.split is one C-level pass, no regex)
+    text = " ".join(text.split())
 
     # Remove special characters but keep punctuation
-    text = re.sub(r"[^\w\s.,!?;:()\-\'\"]+", "", text)
+    text = _SPECIAL_CHARS.sub("", text)
 
     # Remove page numbers (common pattern: Page X, p. X, etc.)
-    text = re.sub(r"\b[Pp]age\s+\d+\b", "", text)
-    text = re.sub(r"\bp\.\s*\d+\b", "", text)
+    text = _PAGE_NUMBERS.sub("", text)
 
     # Trim whitespace
-    text = text.strip()
+    return text.strip()
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate token count: words and punctuation marks
+
+    Subword tokenizers split rare words further, so keep max_tokens a
+    little below the model's real limit.
+    """
+    return sum(1 for _ in _TOKENS.finditer(text))
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash of normalized chunk content, used to detect unchanged and duplicate chunks
+
+    Normalization applies Unicode NFKC and collapses whitespace, so chunks that
+    differ only in spacing share a hash (and an embedding).
+
+    Args:
+        text: Chunk content
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+# Why punkt could not be loaded, per language. lru_cache does not cache
+# exceptions, so without this every split would retry the download.
+_punkt_unavailable: Dict[str, str] = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _sentence_tokenizer(language: str = "english"):
+    """
+    Punkt model, loaded once per process and language
+
+    Raises LookupError if it is not installed and cannot be downloaded;
+    later calls raise straight away, without trying again.
+    """
+    if language in _punkt_unavailable:
+        raise LookupError(_punkt_unavailable[language])
+
+    import nltk
+    from nltk.tokenize.punkt import PunktTokenizer
+
+    try:
+        return PunktTokenizer(language)
+    except LookupError as e:
+        error = e
+    if NLTK_AUTO_DOWNLOAD:
+        nltk.download("punkt_tab", quiet=True)
+        try:
+            return PunktTokenizer(language)
+        except LookupError as e:
+            error = e
+
+    _punkt_unavailable[language] = str(error)
+    raise error
+
+
+def _strip_span(text: str, start: int, end: int) -> Span:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _separator_spans(
+    text: str, start: int, end: int, separators: Sequence[str], max_size: int
+) -> List[Span]:
+    """
+    Cut text[start:end] at the first separator it contains, recursing into
+    pieces still longer than max_size with the next separators (the
+    RecursiveCharacterTextSplitter strategy, on offsets instead of copies)
+    """
+    if end - start <= max_size:
+        return [(start, end)]
+
+    for level, separator in enumerate(separators):
+        if text.find(separator, start, end) != -1:
+            break
+    else:
+        # No separator left: hard cut
+        return [(i, min(i + max_size, end)) for i in range(start, end, max_size)]
+
+    spans = []
+    position = start
+    while position < end:
+        cut = text.find(separator, position, end)
+        # The separator stays with the piece before it
+        piece_end = end if cut == -1 else cut + len(separator)
+        spans.extend(
+            _separator_spans(text, position, piece_end, separators[level + 1 :], max_size)
+        )
+        position = piece_end
+    return spans
+
+
+def _token_limited_spans(text: str, spans: List[Span], max_tokens: int) -> List[Span]:
+    """Cut spans that alone exceed max_tokens into proportionally shorter pieces"""
+    limited = []
+    for start, end in spans:
+        tokens = count_tokens(text[start:end])
+        if tokens <= max_tokens:
+            limited.append((start, end))
+        else:
+            max_size = max(1, (end - start) * max_tokens // tokens)
+            limited.extend(
+                _separator_spans(text, start, end, RECURSIVE_SEPARATORS, max_size)
+            )
+    return limited
+
+
+def _merge_spans(
+    text: str,
+    spans: List[Span],
+    chunk_size: int,
+    overlap: int,
+    max_tokens: Optional[int] = None,
+) -> List[Span]:
+    """
+    Greedily merge consecutive spans into chunks of at most chunk_size
+    characters (and max_tokens tokens), starting each chunk with up to
+    `overlap` characters of trailing spans from the previous one
+    """
+    chunks = []
+    window: Deque[Tuple[int, int, int]] = deque()  # (start, end, tokens)
+    window_tokens = 0
+
+    def too_big(span_end: int, span_tokens: int) -> bool:
+        return span_end - window[0][0] > chunk_size or bool(
+            max_tokens and window_tokens + span_tokens > max_tokens
+        )
+
+    for span_start, span_end in spans:
+        span_tokens = count_tokens(text[span_start:span_end]) if max_tokens else 0
+
+        if window and too_big(span_end, span_tokens):
+            chunks.append((window[0][0], window[-1][1]))
+            while window and (
+                window[-1][1] - window[0][0] > overlap or too_big(span_end, span_tokens)
+            ):
+                window_tokens -= window.popleft()[2]
+
+        window.append((span_start, span_end, span_tokens))
+        window_tokens += span_tokens
+
+    if window:
+        chunks.append((window[0][0], window[-1][1]))
+    return chunks
+
+
+def _simple_spans(text: str, chunk_size: int, overlap: int) -> List[Span]:
+    """Fixed-size chunks extended to the next sentence end (no tokenizer)"""
+    spans = []
+    start = 0
+    text_length = len(text)
 
-    return text
+    while start < text_length:
+        end = start + chunk_size
+
+        # Try to break at sentence boundary
+        if end < text_length:
+            best_end = end
+
+            for i in range(end, min(end + SIMPLE_BOUNDARY_SEARCH, text_length)):
+                if text[i] in ".!?\n":
+                    best_end = i + 1
+                    break
+
+            end = best_end
+        else:
+            end = text_length
+
+        spans.append((start, end))
+        start = end - overlap if end < text_length else text_length
+
+    return spans
+
+
+def _unit_spans(text: str, method: str) -> Tuple[List[Span], Sequence[str]]:
+    """
+    Cut text into units that split the same way whatever text follows them:
+    sentences ('semantic') or the pieces between top-level separators
+    ('recursive'), plus the separators left for cutting oversized units
+    """
+    if method == "semantic":
+        try:
+            sentences = list(_sentence_tokenizer().span_tokenize(text))
+            return sentences, RECURSIVE_SEPARATORS[2:]
+        except LookupError as e:
+            _warn_once(f"NLTK punkt unavailable ({e}), using recursive chunking")
+    elif method != "recursive":
+        raise ValueError(f"Unknown chunking method: {method}")
+
+    # Units end at sentence ends at the weakest: a window of text without
+    # one must not be cut where the whole document would not be
+    for level, separator in enumerate(RECURSIVE_SEPARATORS[:_UNIT_SEPARATORS]):
+        if separator in text:
+            break
+    else:
+        return [(0, len(text))], RECURSIVE_SEPARATORS[_UNIT_SEPARATORS:]
+
+    units = []
+    position = 0
+    while position < len(text):
+        cut = text.find(separator, position)
+        unit_end = len(text) if cut == -1 else cut + len(separator)
+        units.append((position, unit_end))
+        position = unit_end
+    return units, RECURSIVE_SEPARATORS[level + 1 :]
+
+
+def _chunk_spans(
+    text: str,
+    chunk_size: int,
+    overlap: int,
+    method: str,
+    max_tokens: Optional[int] = None,
+    merge_from: int = 0,
+) -> Tuple[List[Span], int, Span]:
+    """
+    Chunk spans of already-cleaned text, and how many of them are final:
+    the same however the text continues (see chunk_pages)
+
+    Args:
+        merge_from: Offset of the first chunk, for text that starts with
+            the end of a unit already chunked up to there
+
+    Returns:
+        (spans, final, resume): spans are not yet stripped of whitespace,
+        and text[resume[0]:] re-split with merge_from=resume[1] - resume[0]
+        continues with the first chunk that is not final
+    """
+    if method == "simple":
+        spans = _simple_spans(text, chunk_size, overlap)
+        final = 0
+        for start, end in spans:
+            # The last chunk, or one whose search for a sentence end ran
+            # into the end of the text
+            if end >= len(text) or (
+                end == start + chunk_size and end + SIMPLE_BOUNDARY_SEARCH > len(text)
+            ):
+                break
+            final += 1
+        resume = spans[final][0] if final < len(spans) else len(text)
+        return spans, final, (resume, resume)
+
+    units, separators = _unit_spans(text, method)
+    spans = [
+        piece
+        for start, end in units
+        for piece in _separator_spans(text, start, end, separators, chunk_size)
+    ]
+    if max_tokens:
+        spans = _token_limited_spans(text, spans, max_tokens)
+    spans = [span for span in spans if span[0] >= merge_from]
+    chunks = _merge_spans(text, spans, chunk_size, overlap, max_tokens)
+
+    # A chunk is final once the span that closed it belongs to a complete
+    # unit; the last unit may continue in text not seen yet
+    span_starts = [start for start, _ in spans]
+    last_unit_start = units[-1][0] if units else len(text)
+    final = 0
+    for _, end in chunks[:-1]:
+        if span_starts[bisect.bisect_left(span_starts, end)] >= last_unit_start:
+            break
+        final += 1
+
+    if final == len(chunks):
+        return chunks, final, (len(text), len(text))
+    # Re-split from the start of the unit the first unfinished chunk starts in
+    merge_start = chunks[final][0]
+    unit_starts = [start for start, _ in units]
+    unit_start = unit_starts[bisect.bisect_right(unit_starts, merge_start) - 1]
+    return chunks, final, (unit_start, merge_start)
+
+
+def _span_pieces(text: str, spans: Iterable[Span]) -> List[Tuple[str, int, int]]:
+    """(content, start_char, end_char) of each span stripped of whitespace"""
+    pieces = []
+    for span in spans:
+        start, end = _strip_span(text, *span)
+        if start < end:
+            pieces.append((text[start:end], start, end))
+    return pieces
+
+
+def _split_text(
+    text: str,
+    chunk_size: int,
+    overlap: int,
+    method: str,
+    max_tokens: Optional[int] = None,
+) -> List[Tuple[str, int, int]]:
+    """
+    Split already-cleaned text into (content, start_char, end_char) pieces
+
+    content is always exactly text[start_char:end_char].
+    """
+    spans, _, _ = _chunk_spans(text, chunk_size, overlap, method, max_tokens)
+    return _span_pieces(text, spans)
 
 
 def chunk_text(
-    text: str, chunk_size: int = 1000, overlap: int = 200, method: str = "semantic"
+    text: str,
+    chunk_size: int = 1000,
+    overlap: int = 200,
+    method: str = "semantic",
+    max_tokens: Optional[int] = CHUNK_MAX_TOKENS,
 ) -> List[Dict[str, Any]]:
     """
     Split text into chunks using semantic-aware splitting
@@ -67,7 +464,10 @@ def chunk_text(
         text: Input text to chunk
         chunk_size: Target size of each chunk in characters (default: 1000)
         overlap: Number of overlapping characters between chunks (default: 200)
-        method: Chunking method - 'semantic' (NLTK sentence-based) or 'recursive' (fallback)
+        method: Chunking method - 'semantic' (NLTK sentence-based), 'recursive'
+            (separator-based; also used if punkt is missing) or 'simple'
+            (fixed size, no tokenizer)
+        max_tokens: Optional token limit per chunk (see count_tokens)
 
     Returns:
         List of dicts containing chunk info: {content, chunk_index, start_char, end_char}
@@ -78,99 +478,127 @@ def chunk_text(
     if not text:
         return []
 
-    chunks = []
+    return [
+        {
+            "content": content,
+            "chunk_index": chunk_index,
+            "start_char": start_char,
+            "end_char": end_char,
+        }
+        for chunk_index, (content, start_char, end_char) in enumerate(
+            _split_text(text, chunk_size, overlap, method, max_tokens)
+        )
+    ]
+
+
+def chunk_pages(
+    pages: Iterable[Tuple[Optional[int], str]],
+    chunk_size: int = 1000,
+    overlap: int = 200,
+    method: str = "semantic",
+    window_chunks: int = CHUNK_WINDOW_CHUNKS,
+    max_tokens: Optional[int] = CHUNK_MAX_TOKENS,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Clean and chunk a stream of pages incrementally
+
+    Pages are cleaned one at a time and appended to a window of about
+    `window_chunks` chunks of text. When the window is full it is split and
+    the chunks that text still to come cannot change are yielded; the rest
+    stays in the window, from the start of the sentence (or separator
+    piece) the first unfinished chunk begins in. Memory therefore stays
+    flat however long the document is, and the chunks are exactly those
+    chunk_text returns for the whole text (unless one sentence outgrows
+    four windows).
+
+    Args:
+        pages: (page_number, text) tuples in document order
+        chunk_size: Target size of each chunk in characters (default: 1000)
+        overlap: Number of overlapping characters between chunks (default: 200)
+        method: Chunking method - 'semantic', 'recursive' or 'simple'
+        window_chunks: Chunks of text buffered before splitting
+        max_tokens: Optional token limit per chunk (see count_tokens)
+
+    Yields:
+        Dicts of {content, chunk_index, start_char, end_char, page_number};
+        offsets index the cleaned document text and page_number is the page
+        the chunk starts on
+    """
+    window_chars = max(window_chunks, 2) * chunk_size
+    window = ""
+    window_start = 0  # Offset of window[0] in the cleaned document
+    merge_from = 0  # Window offset the first unfinished chunk starts at
+    # Document offsets where the pages in the window start, and their numbers
+    page_offsets: List[int] = []
+    page_numbers: List[Optional[int]] = []
     chunk_index = 0
 
-    try:
-        if method == "semantic":
-            # Use NLTK-based semantic chunking (respects sentence boundaries)
-            text_splitter = NLTKTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=overlap,
-            )
-        else:
-            # Fallback to recursive character splitting
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=overlap,
-                separators=["\n\n", "\n", ". ", "! ", "? ", "; ", ", ", " ", ""],
-                length_function=len,
-            )
+    def page_at(offset: int) -> Optional[int]:
+        position = bisect.bisect_right(page_offsets, offset) - 1
+        return page_numbers[max(position, 0)] if page_numbers else None
+
+    def emit(spans):
+        nonlocal chunk_index
+        for content, start_char, end_char in _span_pieces(window, spans):
+            yield {
+                "content": content,
+                "chunk_index": chunk_index,
+                "start_char": window_start + start_char,
+                "end_char": window_start + end_char,
+                "page_number": page_at(window_start + start_char),
+            }
+            chunk_index += 1
 
-        # Split text into chunks
-        chunk_texts = text_splitter.split_text(text)
+    for page_number, page_text in pages:
+        cleaned = clean_text(page_text)
+        if not cleaned:
+            continue
 
-        # Build chunk metadata
-        current_pos = 0
-        for chunk_text in chunk_texts:
-            chunk_text = chunk_text.strip()
-            if not chunk_text:
-                continue
+        if window:
+            window += " "
+        page_offsets.append(window_start + len(window))
+        page_numbers.append(page_number)
+        window += cleaned
+
+        if len(window) < window_chars:
+            continue
 
-            # Find position in original text
-            start_char = text.find(chunk_text, current_pos)
-            if start_char == -1:
-                start_char = current_pos
-            end_char = start_char + len(chunk_text)
-
-            chunks.append(
-                {
-                    "content": chunk_text,
-                    "chunk_index": chunk_index,
-                    "start_char": start_char,
-                    "end_char": end_char,
-                }
+        with _chunking_seconds.time():
+            spans, final, (keep_from, merge_start) = _chunk_spans(
+                window, chunk_size, overlap, method, max_tokens, merge_from
             )
-            chunk_index += 1
-            current_pos = end_char
 
-    except Exception as e:
-        print(f"Error in semantic chunking: {e}")
-        print("Falling back to simple chunking...")
-
-        # Fallback to simple overlap chunking
-        start = 0
-        text_length = len(text)
-
-        while start < text_length:
-            end = start + chunk_size
-
-            # Try to break at sentence boundary
-            if end < text_length:
-                sentence_ends = [".", "!", "?", "\n"]
-                best_end = end
-
-                for i in range(end, min(end + 100, text_length)):
-                    if text[i] in sentence_ends:
-                        best_end = i + 1
-                        break
-
-                end = best_end
-            else:
-                end = text_length
-
-            chunk_content = text[start:end].strip()
-
-            if chunk_content:
-                chunks.append(
-                    {
-                        "content": chunk_content,
-                        "chunk_index": chunk_index,
-                        "start_char": start,
-                        "end_char": end,
-                    }
-                )
-                chunk_index += 1
+        if not final:
+            # A sentence longer than a few windows is cut where the window
+            # ends instead of being buffered whole
+            if len(window) < 4 * window_chars or len(spans) < 2:
+                continue
+            final = len(spans) - 1
+            keep_from = merge_start = spans[-1][0]
 
-            start = end - overlap if end < text_length else text_length
+        yield from emit(spans[:final])
 
-    return chunks
+        window = window[keep_from:]
+        window_start += keep_from
+        merge_from = merge_start - keep_from
+        # Forget pages that ended before the window (keep the one it starts in)
+        first_page = bisect.bisect_right(page_offsets, window_start) - 1
+        if first_page > 0:
+            del page_offsets[:first_page]
+            del page_numbers[:first_page]
+
+    if window:
+        with _chunking_seconds.time():
+            spans, _, _ = _chunk_spans(window, chunk_size, overlap, method, max_tokens, merge_from)
+        yield from emit(spans)
 
 
 def embed_text(text: str, task_type: str = "retrieval_document") -> List[float]:
     """
     Generate embedding for a single text using Gemini API
 
+    Previously seen texts are served from the embedding cache.
+
     Args:
         text: Input text to embed
         task_type: Type of embedding task
@@ -180,49 +608,81 @@ def embed_text(text: str, task_type: str = "retrieval_document") -> List[float]:
     Returns:
         768-dimensional embedding vector
     """
+    cached = embedding_cache.get_many(
+        EMBEDDING_MODEL, task_type, EMBEDDING_DIMENSION, [text]
+    )[0]
+    if cached is not None:
+        return cached
+
     try:
-        result = genai.embed_content(
-            model="models/gemini-embedding-001", 
-            content=text, 
-            task_type=task_type,
-            output_dimensionality=768  # Force 768 dimensions to match database schema
-        )
-        return result["embedding"]
+        result = _embed_content(text, task_type)
+        embedding = result["embedding"]
     except Exception as e:
         print(f"Error embedding text: {e}")
         raise
 
+    embedding_cache.put_many(
+        EMBEDDING_MODEL, task_type, EMBEDDING_DIMENSION, [text], [embedding]
+    )
+    return embedding
+
 
 def embed_batches(
-    texts: List[str], task_type: str = "retrieval_document", batch_size: int = 100
+    texts: List[str],
+    task_type: str = "retrieval_document",
+    batch_size: int = MAX_EMBED_BATCH_SIZE,
 ) -> List[List[float]]:
     """
     Generate embeddings for multiple texts in batches
 
+    Cached and repeated texts are resolved first; only the remaining unique
+    texts are sent to the Gemini API, one request per batch, so embedding
+    N texts costs at most ceil(N / batch_size) round trips.
+
     Args:
         texts: List of texts to embed
         task_type: Type of embedding task
-        batch_size: Number of texts to process at once (Gemini limit: ~100)
+        batch_size: Number of texts sent per API request (Gemini limit: 100)
 
     Returns:
-        List of 768-dimensional embedding vectors
+        List of 768-dimensional embedding vectors, in the same order as texts
     """
-    embeddings = []
+    batch_size = max(1, min(batch_size, MAX_EMBED_BATCH_SIZE))
+
+    cached = embedding_cache.get_many(
+        EMBEDDING_MODEL, task_type, EMBEDDING_DIMENSION, texts
+    )
+    uncached = list(
+        dict.fromkeys(text for text, embedding in zip(texts, cached) if embedding is None)
+    )
+    computed = {}
 
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i : i + batch_size]
+    for i in range(0, len(uncached), batch_size):
+        batch = uncached[i : i + batch_size]
 
         try:
-            # Process batch
-            for text in batch:
-                embedding = embed_text(text, task_type)
-                embeddings.append(embedding)
+            # One request for the whole batch
+            result = _embed_content(batch, task_type)
+            batch_embeddings = result["embedding"]
+
+            if len(batch_embeddings) != len(batch):
+                raise ValueError(
+                    f"Expected {len(batch)} embeddings, got {len(batch_embeddings)}"
+                )
 
         except Exception as e:
-            print(f"Error processing batch {i}-{i+batch_size}: {e}")
+            print(f"Error processing batch {i}-{i+len(batch)}: {e}")
             raise
 
-    return embeddings
+        computed.update(zip(batch, batch_embeddings))
+        embedding_cache.put_many(
+            EMBEDDING_MODEL, task_type, EMBEDDING_DIMENSION, batch, batch_embeddings
+        )
+
+    return [
+        embedding if embedding is not None else computed[text]
+        for text, embedding in zip(texts, cached)
+    ]
 
 
 def embed_query(query: str) -> List[float]:
@@ -238,6 +698,59 @@ def embed_query(query: str) -> List[float]:
     return embed_text(query, task_type="retrieval_query")
 
 
+async def embed_query_async(query: str) -> List[float]:
+    """
+    Generate embedding for a search query without blocking the event loop
+
+    The genai SDK call runs on query_embed_executor, so a slow embedding
+    request only occupies one of its threads instead of the whole worker.
+
+    Args:
+        query: Search query text
+
+    Returns:
+        768-dimensional embedding vector
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(query_embed_executor, embed_query, query)
+
+
+async def embed_queries_async(queries: List[str]) -> List[List[float]]:
+    """
+    Generate embeddings for several search queries without blocking the event loop
+
+    Uses embed_batches, so up to MAX_EMBED_BATCH_SIZE queries share one
+    API request.
+
+    Args:
+        queries: Search query texts
+
+    Returns:
+        List of 768-dimensional embedding vectors, in the same order as queries
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        query_embed_executor, lambda: embed_batches(queries, task_type="retrieval_query")
+    )
+
+
+def warm_up():
+    """
+    Load everything the first request would otherwise pay for
+
+    Loads the punkt model (downloading it if allowed), runs each splitter
+    once and, if an API key is set, imports and configures the Gemini SDK.
+    Meant for service startup; nothing here touches the network except a
+    missing punkt download.
+    """
+    sample = "Warm up the chunker. It splits sentences, separators and characters."
+    for method in ("semantic", "recursive", "simple"):
+        chunk_text(sample, chunk_size=32, overlap=8, method=method)
+
+    if GEMINI_API_KEY:
+        get_genai()
+
+
 if __name__ == "__main__":
     # Test chunking
     sample_text = """
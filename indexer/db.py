@@ -0,0 +1,368 @@
+"""
+Database module for TutorAI indexer
+Bounded, health-checked connection pools shared by the FastAPI endpoints:
+psycopg2 for the threadpool endpoints and asyncpg for the async retrieval path
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+import asyncpg
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Pool settings (DB_POOL_MAX=0 disables pooling, useful for benchmarks)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+# get_corpus_version compacts corpus_changes beyond this many rows
+CORPUS_VERSION_COMPACT_ROWS = 1000
+
+# Connections idle longer than this are pinged before being handed out
+DB_HEALTHCHECK_IDLE_SECONDS = 30
+
+
+def database_url() -> str:
+    """
+    DATABASE_URL, checked when the first connection is made rather than at import
+
+    Raises:
+        ValueError: If DATABASE_URL is not set
+    """
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL not found in environment variables")
+    return DATABASE_URL
+
+
+def get_db_connection():
+    """Create and return a new (unpooled) database connection"""
+    return psycopg2.connect(
+        database_url(), options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    )
+
+
+class HealthCheckedPool(ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool that sets a statement timeout on every
+    connection and pings idle connections before handing them out
+    """
+
+    def __init__(self, minconn: int, maxconn: int):
+        self.last_used: Dict[int, float] = {}
+        self.semaphore = threading.BoundedSemaphore(maxconn)
+        super().__init__(
+            minconn,
+            maxconn,
+            database_url(),
+            options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+        )
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - self.last_used.get(id(conn), 0.0) < DB_HEALTHCHECK_IDLE_SECONDS:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def putconn(self, conn, key=None, close=False):
+        if close or conn.closed:
+            self.last_used.pop(id(conn), None)
+        super().putconn(conn, key=key, close=close)
+
+    def borrow(self, timeout: Optional[float] = None):
+        """
+        Get a healthy connection, waiting if all connections are in use
+
+        Raises:
+            PoolError: If none became free within `timeout` seconds
+        """
+        if not self.semaphore.acquire(timeout=timeout):
+            raise PoolError(f"No pooled connection free within {timeout}s")
+        try:
+            conn = self.getconn()
+            while not self._is_healthy(conn):
+                self.putconn(conn, close=True)
+                conn = self.getconn()
+            return conn
+        except Exception:
+            self.semaphore.release()
+            raise
+
+    def give_back(self, conn):
+        """Return a connection, discarding it if it is broken"""
+        try:
+            broken = (
+                conn.closed
+                or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN
+            )
+            if not broken and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self.last_used[id(conn)] = time.monotonic()
+            self.putconn(conn, close=broken)
+        finally:
+            self.semaphore.release()
+
+
+db_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """Create the shared pool on first use (None when pooling is disabled)"""
+    global db_pool
+    if DB_POOL_MAX <= 0:
+        return None
+    if db_pool is None:
+        with _pool_lock:
+            if db_pool is None:
+                db_pool = HealthCheckedPool(DB_POOL_MIN, DB_POOL_MAX)
+    return db_pool
+
+
+@contextmanager
+def db_connection(timeout: Optional[float] = None) -> Iterator["extensions.connection"]:
+    """
+    Borrow a connection from the pool for the duration of a `with` block
+
+    Uncommitted work is rolled back when the connection is returned, and
+    broken connections are replaced instead of being reused.
+
+    Args:
+        timeout: Seconds to wait for a free connection (default: no limit)
+    """
+    pool = get_db_pool()
+
+    if pool is None:
+        conn = get_db_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    conn = pool.borrow(timeout)
+    try:
+        yield conn
+    finally:
+        pool.give_back(conn)
+
+
+def close_db_pool():
+    """Close every pooled connection (called on shutdown)"""
+    global db_pool
+    if db_pool is not None:
+        db_pool.closeall()
+        db_pool = None
+
+
+# Async pool (asyncpg) for the retrieval hot path. asyncpg prepares and
+# caches every statement per connection, so match_chunks is only parsed
+# and planned once per connection.
+
+async_db_pool: Optional[asyncpg.Pool] = None
+_async_pool_lock = asyncio.Lock()
+
+# Idle pooled connections are closed after this many seconds
+ASYNC_POOL_MAX_INACTIVE_SECONDS = 300
+
+
+def vector_literal(values: Sequence[float]) -> str:
+    """pgvector text representation, e.g. '[0.1,0.2]'"""
+    return "[" + ",".join(repr(float(value)) for value in values) + "]"
+
+
+async def _connect_async() -> asyncpg.Connection:
+    return await asyncpg.connect(
+        database_url(),
+        server_settings={"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+    )
+
+
+async def get_async_db_pool() -> Optional[asyncpg.Pool]:
+    """Create the shared asyncpg pool on first use (None when pooling is disabled)"""
+    global async_db_pool
+    if DB_POOL_MAX <= 0:
+        return None
+    if async_db_pool is None:
+        async with _async_pool_lock:
+            if async_db_pool is None:
+                async_db_pool = await asyncpg.create_pool(
+                    database_url(),
+                    min_size=min(DB_POOL_MIN, DB_POOL_MAX),
+                    max_size=DB_POOL_MAX,
+                    max_inactive_connection_lifetime=ASYNC_POOL_MAX_INACTIVE_SECONDS,
+                    server_settings={"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+                )
+    return async_db_pool
+
+
+@asynccontextmanager
+async def async_db_connection() -> AsyncIterator[asyncpg.Connection]:
+    """
+    Borrow an asyncpg connection for the duration of an `async with` block
+
+    asyncpg resets connections on release and drops broken ones, so a
+    failed query never leaks state into the next request.
+    """
+    pool = await get_async_db_pool()
+
+    if pool is None:
+        conn = await _connect_async()
+        try:
+            yield conn
+        finally:
+            await conn.close()
+        return
+
+    async with pool.acquire() as conn:
+        yield conn
+
+
+async def set_ann_search_params(conn: asyncpg.Connection, ef_search: int, probes: int):
+    """
+    Set HNSW ef_search and IVFFlat probes for the current transaction
+
+    Must be called inside `async with conn.transaction()`, since the settings
+    are transaction-local and must not leak into the next pool borrower.
+    """
+    await conn.execute(
+        "SELECT set_config('hnsw.ef_search', $1, true), set_config('ivfflat.probes', $2, true)",
+        str(ef_search),
+        str(probes),
+    )
+
+
+async def match_chunks(
+    conn: asyncpg.Connection,
+    query_embedding: Sequence[float],
+    match_count: int,
+    filter_document: Optional[int] = None,
+) -> List[asyncpg.Record]:
+    """Run the match_chunks similarity search"""
+    return await conn.fetch(
+        "SELECT * FROM match_chunks($1::text::vector, $2, $3)",
+        vector_literal(query_embedding),
+        match_count,
+        filter_document,
+    )
+
+
+async def match_chunks_batch(
+    conn: asyncpg.Connection,
+    query_embeddings: Sequence[Sequence[float]],
+    match_count: int,
+    filter_document: Optional[int] = None,
+) -> List[List[asyncpg.Record]]:
+    """
+    Run match_chunks for several queries in one set-based statement
+
+    The query vectors are unnested into rows and each is searched through a
+    LATERAL call, so N queries cost one round trip instead of N.
+
+    Returns:
+        One list of match_chunks rows per query, in input order
+    """
+    rows = await conn.fetch(
+        """
+        SELECT (q.ord - 1)::int AS query_index, m.*
+        FROM unnest($1::text[]) WITH ORDINALITY AS q(embedding, ord)
+        CROSS JOIN LATERAL match_chunks(q.embedding::vector, $2, $3) AS m
+        ORDER BY q.ord, m.similarity DESC
+        """,
+        [vector_literal(embedding) for embedding in query_embeddings],
+        match_count,
+        filter_document,
+    )
+
+    results: List[List[asyncpg.Record]] = [[] for _ in query_embeddings]
+    for row in rows:
+        results[row["query_index"]].append(row)
+    return results
+
+
+async def match_chunks_lexical(
+    conn: asyncpg.Connection,
+    query_text: str,
+    match_count: int,
+    filter_document: Optional[int] = None,
+) -> List[asyncpg.Record]:
+    """Run the full-text search (GIN index on chunks.content_tsv)"""
+    return await conn.fetch(
+        "SELECT * FROM match_chunks_lexical($1, $2, $3)",
+        query_text,
+        match_count,
+        filter_document,
+    )
+
+
+async def hybrid_match_chunks(
+    conn: asyncpg.Connection,
+    query_embedding: Sequence[float],
+    query_text: str,
+    match_count: int,
+    filter_document: Optional[int] = None,
+    candidate_count: int = 50,
+    rrf_k: int = 60,
+) -> List[asyncpg.Record]:
+    """
+    Fuse vector and lexical results with reciprocal rank fusion
+
+    Each signal contributes 1 / (rrf_k + rank) for its top candidate_count
+    chunks; the similarity column holds the fused score.
+    """
+    return await conn.fetch(
+        "SELECT * FROM hybrid_match_chunks($1::text::vector, $2, $3, $4, $5, $6)",
+        vector_literal(query_embedding),
+        query_text,
+        match_count,
+        filter_document,
+        candidate_count,
+        rrf_k,
+    )
+
+
+async def get_corpus_version(conn: asyncpg.Connection) -> Optional[int]:
+    """
+    Current corpus version: corpus_state.version plus the corpus_changes rows
+    triggers append on every chunk change
+
+    Change rows are folded into corpus_state once there are more than
+    CORPUS_VERSION_COMPACT_ROWS of them.
+
+    Returns None if it cannot be read, e.g. before migration_corpus_version_deltas.sql
+    """
+    try:
+        row = await conn.fetchrow(
+            "SELECT version, (SELECT COUNT(*) FROM corpus_changes) AS pending FROM corpus_state"
+        )
+        if row["pending"] > CORPUS_VERSION_COMPACT_ROWS:
+            await conn.execute("SELECT compact_corpus_version()")
+        return row["version"] + row["pending"]
+    except asyncpg.PostgresError as e:
+        print(f"Corpus version unavailable: {e}")
+        return None
+
+
+async def close_async_db_pool():
+    """Close the asyncpg pool (called on shutdown)"""
+    global async_db_pool
+    if async_db_pool is not None:
+        await async_db_pool.close()
+        async_db_pool = None
@@ -0,0 +1,312 @@
+"""
+Embedding cache for TutorAI
+Two tiers: an in-process LRU and a shared Postgres table (embedding_cache)
+"""
+
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError
+
+try:
+    from db import db_connection
+except ImportError:
+    from .db import db_connection
+
+load_dotenv()
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_STORE = os.getenv("EMBEDDING_CACHE_STORE", "true").lower() == "true"
+EMBEDDING_CACHE_MAX_AGE_DAYS = int(os.getenv("EMBEDDING_CACHE_MAX_AGE_DAYS", "90"))
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "1000000"))
+
+# Seconds a lookup waits for a pooled connection before treating it as a miss
+EMBEDDING_CACHE_POOL_TIMEOUT = float(os.getenv("EMBEDDING_CACHE_POOL_TIMEOUT", "0.5"))
+
+# Prune the Postgres tier once every this many writes, deleting at most
+# PRUNE_BATCH_ROWS rows per rule so a prune never holds locks for long
+PRUNE_EVERY_WRITES = 1000
+PRUNE_BATCH_ROWS = 5000
+
+# Backoff after the store fails (seconds, doubled per consecutive failure)
+STORE_RETRY_BASE_SECONDS = 1.0
+STORE_RETRY_MAX_SECONDS = 60.0
+
+CacheKey = Tuple[str, str, int, str]
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 of the exact text that was embedded"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed by (model, task_type, output_dimensionality, text hash)
+
+    Lookups check the in-process LRU first (microseconds) and then the
+    Postgres table, which is shared by every indexer process and worker.
+    Store lookups borrow connections from the db.py pool, so concurrent
+    query embeddings do not queue behind one connection. If the database is
+    unreachable or the pool is saturated the cache keeps working
+    memory-only, and the store is retried with backoff.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = EMBEDDING_CACHE_SIZE,
+        use_store: bool = False,
+        max_age_days: int = EMBEDDING_CACHE_MAX_AGE_DAYS,
+        max_rows: int = EMBEDDING_CACHE_MAX_ROWS,
+        pool_timeout: float = EMBEDDING_CACHE_POOL_TIMEOUT,
+    ):
+        self.max_entries = max_entries
+        self.use_store = use_store
+        self.max_age_days = max_age_days
+        self.max_rows = max_rows
+        self.pool_timeout = pool_timeout
+
+        self.memory: "OrderedDict[CacheKey, Tuple[float, ...]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.store_failures = 0
+        self.store_retry_at = 0.0
+        self.counters = {"memory_hits": 0, "store_hits": 0, "misses": 0}
+
+    # In-process tier
+
+    def _memory_get(self, key: CacheKey) -> Optional[List[float]]:
+        with self.lock:
+            embedding = self.memory.get(key)
+            if embedding is None:
+                return None
+            self.memory.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return list(embedding)
+
+    def _memory_put(self, key: CacheKey, embedding: Sequence[float]):
+        with self.lock:
+            self.memory[key] = tuple(embedding)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+    # Postgres tier
+
+    def _store_available(self) -> bool:
+        if not self.use_store:
+            return False
+        with self.lock:
+            return time.monotonic() >= self.store_retry_at
+
+    def _store_failed(self, action: str, error: Exception):
+        """Back off from the store after a failure instead of hammering it"""
+        with self.lock:
+            self.store_failures += 1
+            delay = min(
+                STORE_RETRY_MAX_SECONDS,
+                STORE_RETRY_BASE_SECONDS * 2 ** (self.store_failures - 1),
+            )
+            self.store_retry_at = time.monotonic() + random.uniform(delay / 2, delay)
+        print(f"Embedding cache {action} failed, memory only for {delay:.0f}s: {error}")
+
+    def _store_succeeded(self):
+        if self.store_failures:
+            with self.lock:
+                self.store_failures = 0
+                self.store_retry_at = 0.0
+
+    @contextmanager
+    def _store_cursor(self) -> Iterator:
+        """Cursor on a pooled connection; the caller's work is committed on exit"""
+        with db_connection(timeout=self.pool_timeout) as conn:
+            with conn.cursor() as cursor:
+                yield cursor
+            conn.commit()
+
+    def _store_get(self, keys: List[CacheKey]) -> Dict[CacheKey, List[float]]:
+        if not keys or not self._store_available():
+            return {}
+
+        model, task_type, dimensionality, _ = keys[0]
+        try:
+            with self._store_cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT text_hash, embedding FROM embedding_cache
+                    WHERE model = %s AND task_type = %s AND dimensionality = %s
+                      AND text_hash = ANY(%s)
+                    """,
+                    (model, task_type, dimensionality, [key[3] for key in keys]),
+                )
+                rows = cursor.fetchall()
+        except PoolError:
+            return {}  # Pool saturated: a miss now, not a reason to back off
+        except Exception as e:
+            self._store_failed("lookup", e)
+            return {}
+
+        self._store_succeeded()
+        return {(model, task_type, dimensionality, row[0]): row[1] for row in rows}
+
+    def _store_put(self, items: List[Tuple[CacheKey, List[float]]]):
+        if not items or not self._store_available():
+            return
+
+        try:
+            with self._store_cursor() as cursor:
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO embedding_cache
+                        (model, task_type, dimensionality, text_hash, embedding)
+                    VALUES %s
+                    ON CONFLICT DO NOTHING
+                    """,
+                    [(*key, list(embedding)) for key, embedding in items],
+                    template="(%s, %s, %s, %s, %s::real[])",
+                )
+        except PoolError:
+            return
+        except Exception as e:
+            self._store_failed("write", e)
+            return
+
+        self._store_succeeded()
+
+        with self.lock:
+            self.writes += len(items)
+            prune = self.writes >= PRUNE_EVERY_WRITES
+            if prune:
+                self.writes = 0
+        if prune:
+            self._prune()
+
+    def _prune(self):
+        """
+        Evict up to PRUNE_BATCH_ROWS entries older than max_age_days, then up
+        to PRUNE_BATCH_ROWS of the oldest beyond max_rows
+
+        Both deletes walk idx_embedding_cache_created_at from the oldest end,
+        and the row count comes from the planner's estimate, so a prune
+        costs the rows it removes rather than a scan of the table. One
+        process prunes at a time.
+        """
+        try:
+            with self._store_cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_try_advisory_xact_lock(hashtext('embedding_cache_prune'))"
+                )
+                if not cursor.fetchone()[0]:
+                    return
+
+                cursor.execute(
+                    """
+                    DELETE FROM embedding_cache
+                    WHERE ctid = ANY(ARRAY(
+                        SELECT ctid FROM embedding_cache
+                        WHERE created_at < NOW() - make_interval(days => %s)
+                        ORDER BY created_at
+                        LIMIT %s
+                    ))
+                    """,
+                    (self.max_age_days, PRUNE_BATCH_ROWS),
+                )
+
+                cursor.execute(
+                    """
+                    SELECT reltuples::bigint FROM pg_class
+                    WHERE oid = 'embedding_cache'::regclass
+                    """
+                )
+                excess = cursor.fetchone()[0] - self.max_rows
+                if excess > 0:
+                    cursor.execute(
+                        """
+                        DELETE FROM embedding_cache
+                        WHERE ctid = ANY(ARRAY(
+                            SELECT ctid FROM embedding_cache
+                            ORDER BY created_at
+                            LIMIT %s
+                        ))
+                        """,
+                        (min(excess, PRUNE_BATCH_ROWS),),
+                    )
+        except Exception as e:
+            print(f"Embedding cache prune failed: {e}")
+
+    # Public API
+
+    def get_many(
+        self, model: str, task_type: str, dimensionality: int, texts: List[str]
+    ) -> List[Optional[List[float]]]:
+        """
+        Look up embeddings for several texts
+
+        Returns:
+            One entry per text: the cached embedding, or None on a miss
+        """
+        keys = [(model, task_type, dimensionality, text_hash(text)) for text in texts]
+        results = [self._memory_get(key) for key in keys]
+
+        missing = list({key for key, result in zip(keys, results) if result is None})
+        store_hits = 0
+
+        if missing:
+            found = self._store_get(missing)
+            store_hits = len(found)
+            for key, embedding in found.items():
+                self._memory_put(key, embedding)
+
+            for i, key in enumerate(keys):
+                if results[i] is None and key in found:
+                    results[i] = list(found[key])
+
+        with self.lock:
+            self.counters["store_hits"] += store_hits
+            self.counters["misses"] += sum(1 for result in results if result is None)
+
+        return results
+
+    def put_many(
+        self,
+        model: str,
+        task_type: str,
+        dimensionality: int,
+        texts: List[str],
+        embeddings: List[List[float]],
+    ):
+        """Store embeddings in both tiers"""
+        items = [
+            ((model, task_type, dimensionality, text_hash(text)), embedding)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        for key, embedding in items:
+            self._memory_put(key, embedding)
+        self._store_put(items)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters since process start"""
+        with self.lock:
+            lookups = sum(self.counters.values())
+            hits = self.counters["memory_hits"] + self.counters["store_hits"]
+            return {
+                **self.counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "store_enabled": self.use_store,
+                "store_backing_off": time.monotonic() < self.store_retry_at,
+            }
+
+
+embedding_cache = EmbeddingCache(
+    use_store=EMBEDDING_CACHE_STORE and bool(os.getenv("DATABASE_URL"))
+)
@@ -0,0 +1,248 @@
+"""
+Embedding scheduler for TutorAI
+Runs batched embedding requests concurrently while respecting provider RPM/TPM quotas
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    from metrics import PROVIDER_RETRIES
+except ImportError:
+    from .metrics import PROVIDER_RETRIES
+
+load_dotenv()
+
+# Scheduler defaults (Gemini free tier quotas for gemini-embedding-001)
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_RPM = float(os.getenv("EMBED_RPM", "100"))
+EMBED_TPM = float(os.getenv("EMBED_TPM", "30000"))
+EMBED_MAX_RATE_LIMIT_RETRIES = int(os.getenv("EMBED_MAX_RATE_LIMIT_RETRIES", "5"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate used for TPM accounting (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check whether a provider error is a 429 / quota exhausted response"""
+    if getattr(error, "code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "resource exhausted" in message or "quota" in message
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket whose refill rate can shrink and recover
+
+    The rate adapts AIMD-style: it is halved on every throttle signal and
+    grows back by 5% on each success, never above the configured quota.
+    """
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 10.0):
+        self.max_rate = rate_per_minute / 60.0
+        self.min_rate = self.max_rate * 0.1
+        self.rate = self.max_rate
+        self.capacity = max(1.0, self.max_rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        Block until `amount` tokens are available
+
+        Returns:
+            Seconds spent waiting
+        """
+        # A request larger than the bucket waits for a full bucket and then
+        # leaves it in debt, so later requests wait out the excess and the
+        # long-run rate never exceeds the quota
+        needed = min(amount, self.capacity)
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return waited
+                wait = (needed - self.tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+    def throttle(self) -> None:
+        """Halve the refill rate after a 429 and drain the burst allowance"""
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def recover(self) -> None:
+        """Grow the refill rate back towards the configured quota"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate * 1.05)
+
+
+class RateLimiter:
+    """Combined requests-per-minute and tokens-per-minute limiter"""
+
+    def __init__(
+        self, rpm: float = EMBED_RPM, tpm: float = EMBED_TPM, burst_seconds: float = 10.0
+    ):
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds)
+
+    def acquire(self, token_count: int) -> float:
+        return self.requests.acquire(1) + self.tokens.acquire(token_count)
+
+    def throttle(self) -> None:
+        self.requests.throttle()
+        self.tokens.throttle()
+
+    def recover(self) -> None:
+        self.requests.recover()
+        self.tokens.recover()
+
+
+# One quota per process: every scheduler (concurrent /embed calls, worker
+# embed jobs) draws from this limiter unless given its own. Separate worker
+# processes each hold one, so split EMBED_RPM/EMBED_TPM between them.
+embedding_rate_limiter = RateLimiter()
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2**attempt)))
+
+
+class EmbeddingScheduler:
+    """
+    Concurrent embedding scheduler
+
+    Each batch is one provider request. Up to `concurrency` batches are in
+    flight at once, every request first passes through the rate limiter,
+    and 429 responses are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        concurrency: int = EMBED_CONCURRENCY,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_rate_limit_retries: int = EMBED_MAX_RATE_LIMIT_RETRIES,
+    ):
+        self.embed_fn = embed_fn
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = rate_limiter or embedding_rate_limiter
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "throttle_wait_seconds": 0.0}
+
+    def _count(self, key: str, value: float = 1) -> None:
+        with self.stats_lock:
+            self.stats[key] += value
+
+    def _embed_with_backoff(self, texts: List[str]) -> List[List[float]]:
+        token_count = sum(estimate_tokens(text) for text in texts)
+        attempt = 0
+
+        while True:
+            self._count("throttle_wait_seconds", self.rate_limiter.acquire(token_count))
+            self._count("requests")
+
+            try:
+                embeddings = self.embed_fn(texts)
+                self.rate_limiter.recover()
+                return embeddings
+
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_rate_limit_retries:
+                    raise
+
+                self._count("rate_limited")
+                PROVIDER_RETRIES.labels("embed_document").inc()
+                self.rate_limiter.throttle()
+                delay = backoff_delay(attempt)
+                print(f"Rate limited, retrying batch in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                attempt += 1
+
+    def run(
+        self,
+        batches: Sequence[Tuple[List[Any], List[str]]],
+        on_success: Callable[[List[Any], List[List[float]]], None],
+        on_failure: Callable[[List[Any], Exception], None],
+    ) -> Dict[str, Any]:
+        """
+        Embed all batches and hand results to the callbacks
+
+        Args:
+            batches: List of (keys, texts) pairs, one provider request each
+            on_success: Called with (keys, embeddings) when a batch succeeds
+            on_failure: Called with (keys, error) when a batch gives up
+
+        Returns:
+            Throughput statistics for the run
+        """
+        started_at = time.monotonic()
+        succeeded = 0
+        failed = 0
+        failed_keys: List[Any] = []
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {
+                executor.submit(self._embed_with_backoff, texts): keys
+                for keys, texts in batches
+            }
+
+            for future in as_completed(futures):
+                keys = futures[future]
+                try:
+                    embeddings = future.result()
+                    on_success(keys, embeddings)
+                    succeeded += len(keys)
+                except Exception as e:
+                    print(f"Error embedding batch of {len(keys)}: {e}")
+                    try:
+                        on_failure(keys, e)
+                    except Exception as callback_error:
+                        print(f"Error recording batch failure: {callback_error}")
+                    failed += len(keys)
+                    failed_keys.extend(keys)
+
+                elapsed = time.monotonic() - started_at
+                print(
+                    f"Embedded {succeeded + failed} chunks in {elapsed:.1f}s "
+                    f"({(succeeded + failed) / max(elapsed, 1e-9):.1f} chunks/s)"
+                )
+
+        elapsed = time.monotonic() - started_at
+
+        return {
+            "processed": succeeded + failed,
+            "succeeded": succeeded,
+            "failed": failed,
+            "failed_keys": failed_keys,
+            "elapsed_seconds": round(elapsed, 3),
+            "chunks_per_second": round(succeeded / elapsed, 2) if elapsed > 0 else 0.0,
+            "requests": self.stats["requests"],
+            "rate_limited": self.stats["rate_limited"],
+            "throttle_wait_seconds": round(self.stats["throttle_wait_seconds"], 3),
+        }
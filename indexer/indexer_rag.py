@@ -3,28 +3,164 @@ TutorAI Indexer Service
 FastAPI service for PDF processing, text chunking, embedding, and semantic retrieval
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field
+from typing import Iterable, Iterator, List, Literal, Optional, Dict, Any, Tuple
 import psycopg2
-from psycopg2.extras import execute_values
+from psycopg2.extras import RealDictCursor, execute_values
+import asyncio
 import os
+import time
+import uuid
 from dotenv import load_dotenv
-import pypdf
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import tempfile
-import google.generativeai as genai
-
-# OCR Dependencies
-import pypdf
-import pytesseract
-from pdf2image import convert_from_path
-from PIL import Image
 
 try:
-    from chunker_embedder import chunk_text, embed_batches, embed_query, embed_text
+    from ann_index import (
+        ANN_EF_SEARCH,
+        ANN_INDEX_TYPE,
+        ANN_PROBES,
+        EMBEDDING_COARSE_DIMENSION,
+        INDEX_TYPES,
+        embedding_dimension_mismatch,
+        get_embedding_column_type,
+        get_index_status,
+        match_chunks_two_stage,
+        maybe_rebuild_index,
+        rebuild_index,
+    )
+    from chunker_embedder import (
+        EMBEDDING_DIMENSION,
+        MAX_EMBED_BATCH_SIZE,
+        chunk_pages,
+        content_hash,
+        embed_batches,
+        embed_queries_async,
+        embed_query_async,
+        embed_text,
+        warm_up as warm_up_chunker,
+    )
+    from db import (
+        async_db_connection,
+        close_async_db_pool,
+        close_db_pool,
+        db_connection,
+        get_async_db_pool,
+        get_corpus_version,
+        get_db_connection,
+        get_db_pool,
+        hybrid_match_chunks,
+        match_chunks,
+        match_chunks_batch,
+        match_chunks_lexical,
+        set_ann_search_params,
+    )
+    from embedding_cache import embedding_cache
+    from embedding_scheduler import EMBED_CONCURRENCY, EmbeddingScheduler
+    from jobs import enqueue_job, get_job, list_jobs
+    from metrics import (
+        INGEST_STAGE_SECONDS,
+        RETRIEVE_STAGE_SECONDS,
+        cache_collector,
+        update_backlog,
+    )
+    from ocr import (
+        OCR_WORKERS,
+        VISION_DPI,
+        clear_page_images,
+        file_hash,
+        get_page_count,
+        iter_ocr_pages,
+        iter_pages_with_ocr,
+        new_page_image_key,
+        page_content_key,
+        page_has_images,
+        page_needs_ocr,
+    )
+    from retrieval_cache import normalize_query, retrieval_cache
+    from semantic_cache import semantic_cache
+    from vector_index import (
+        VECTOR_INDEX_ENABLED,
+        maintain_index,
+        search_chunks,
+        search_chunks_batch,
+        vector_index,
+    )
+    from vision import VisionCache, describe_pages
 except ImportError:
-    from .chunker_embedder import chunk_text, embed_batches, embed_query, embed_text
+    from .ann_index import (
+        ANN_EF_SEARCH,
+        ANN_INDEX_TYPE,
+        ANN_PROBES,
+        EMBEDDING_COARSE_DIMENSION,
+        INDEX_TYPES,
+        embedding_dimension_mismatch,
+        get_embedding_column_type,
+        get_index_status,
+        match_chunks_two_stage,
+        maybe_rebuild_index,
+        rebuild_index,
+    )
+    from .chunker_embedder import (
+        EMBEDDING_DIMENSION,
+        MAX_EMBED_BATCH_SIZE,
+        chunk_pages,
+        content_hash,
+        embed_batches,
+        embed_queries_async,
+        embed_query_async,
+        embed_text,
+        warm_up as warm_up_chunker,
+    )
+    from .db import (
+        async_db_connection,
+        close_async_db_pool,
+        close_db_pool,
+        db_connection,
+        get_async_db_pool,
+        get_corpus_version,
+        get_db_connection,
+        get_db_pool,
+        hybrid_match_chunks,
+        match_chunks,
+        match_chunks_batch,
+        match_chunks_lexical,
+        set_ann_search_params,
+    )
+    from .embedding_cache import embedding_cache
+    from .embedding_scheduler import EMBED_CONCURRENCY, EmbeddingScheduler
+    from .jobs import enqueue_job, get_job, list_jobs
+    from .metrics import (
+        INGEST_STAGE_SECONDS,
+        RETRIEVE_STAGE_SECONDS,
+        cache_collector,
+        update_backlog,
+    )
+    from .ocr import (
+        OCR_WORKERS,
+        VISION_DPI,
+        clear_page_images,
+        file_hash,
+        get_page_count,
+        iter_ocr_pages,
+        iter_pages_with_ocr,
+        new_page_image_key,
+        page_content_key,
+        page_has_images,
+        page_needs_ocr,
+    )
+    from .retrieval_cache import normalize_query, retrieval_cache
+    from .semantic_cache import semantic_cache
+    from .vector_index import (
+        VECTOR_INDEX_ENABLED,
+        maintain_index,
+        search_chunks,
+        search_chunks_batch,
+        vector_index,
+    )
+    from .vision import VisionCache, describe_pages
 
 load_dotenv()
 
@@ -44,15 +180,63 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database connection
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL not found in environment variables")
+# Cache hit/miss counters are read from the caches when /metrics is scraped
+cache_collector.register("retrieval", retrieval_cache.stats)
+cache_collector.register("semantic", semantic_cache.stats)
+cache_collector.register("embedding", embedding_cache.stats)
+cache_collector.register("vision", VisionCache.stats)
+
+
+@app.on_event("startup")
+async def warm_up():
+    """
+    Do the slow one-time setup before serving requests
+
+    Imports are kept side-effect free, so this is where the punkt model is
+    loaded, the splitters run once, the Gemini SDK is configured and the
+    shared connection pools are opened. Failures are logged, not fatal:
+    each piece is also initialized lazily on first use. The one exception is
+    an EMBEDDING_DIMENSION that chunks.embedding cannot store, which would
+    otherwise fail every /embed.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, warm_up_chunker)
+    except Exception as e:
+        print(f"Chunker warm-up failed: {e}")
+
+    try:
+        await loop.run_in_executor(None, get_db_pool)
+        await get_async_db_pool()
+        column_type = await loop.run_in_executor(None, read_embedding_column_type)
+    except Exception as e:
+        print(f"Could not open database pool or read chunks.embedding: {e}")
+        return
+
+    mismatch = embedding_dimension_mismatch(column_type, EMBEDDING_DIMENSION)
+    if mismatch:
+        raise RuntimeError(mismatch)
+
+
+def read_embedding_column_type() -> str:
+    with db_connection() as conn, conn.cursor() as cursor:
+        return get_embedding_column_type(cursor)
+
 
+@app.on_event("startup")
+async def start_vector_index():
+    """Load the in-memory vector index in the background (Postgres serves until ready)"""
+    if VECTOR_INDEX_ENABLED:
+        app.state.vector_index_task = asyncio.create_task(maintain_index(vector_index))
 
-def get_db_connection():
-    """Create and return a database connection"""
-    return psycopg2.connect(DATABASE_URL)
+
+@app.on_event("shutdown")
+async def shutdown_db_pools():
+    task = getattr(app.state, "vector_index_task", None)
+    if task:
+        task.cancel()
+    close_db_pool()
+    await close_async_db_pool()
 
 
 # Pydantic models
@@ -60,6 +244,7 @@ class IndexRequest(BaseModel):
     document_id: int
     file_path: str
     use_vision: bool = False
+    force: bool = False  # Re-extract even if the file content is unchanged
 
 
 class IndexResponse(BaseModel):
@@ -69,10 +254,26 @@ class IndexResponse(BaseModel):
     message: str
 
 
+RetrievalMode = Literal["vector", "lexical", "hybrid"]
+
+# Candidates each signal contributes to hybrid rank fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Two-stage (Matryoshka) vector search: coarse candidates, full-dimension rescore
+RETRIEVE_TWO_STAGE = os.getenv("RETRIEVE_TWO_STAGE", "false").lower() == "true"
+TWO_STAGE_CANDIDATES = int(os.getenv("TWO_STAGE_CANDIDATES", "100"))
+
+
 class RetrieveRequest(BaseModel):
     query: str
     top_k: int = 5
     document_id: Optional[int] = None
+    mode: RetrievalMode = "vector"  # vector, lexical (full-text) or hybrid (both, fused)
+    # ANN recall/latency knobs (default: ANN_EF_SEARCH / ANN_PROBES)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)  # HNSW index
+    probes: Optional[int] = Field(None, ge=1)  # IVFFlat index
+    two_stage: Optional[bool] = None  # Coarse + rescore vector search (default: RETRIEVE_TWO_STAGE)
 
 
 class ChunkResult(BaseModel):
@@ -80,46 +281,78 @@ class ChunkResult(BaseModel):
     document_id: int
     content: str
     chunk_index: int
-    similarity: float
+    similarity: float  # Cosine similarity, ts_rank_cd, or fused RRF score by mode
+    vector_rank: Optional[int] = None
+    lexical_rank: Optional[int] = None
 
 
 class RetrieveResponse(BaseModel):
     success: bool
     query: str
+    mode: RetrievalMode = "vector"
     results: List[ChunkResult]
+    cache: Optional[Literal["exact", "semantic"]] = None  # Set when served from a cache
+    cached_query: Optional[str] = None  # Query whose results a semantic hit reused
+    corpus_version: Optional[int] = None
 
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# Queries accepted by one /retrieve/batch call
+MAX_RETRIEVE_BATCH = 500
 
 
-# Configure Tesseract path for Windows (adjust if needed)
-pytesseract.pytesseract.tesseract_cmd = r"tesseract/tesseract.exe"
+class RetrieveBatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=MAX_RETRIEVE_BATCH)
+    top_k: int = 5
+    document_id: Optional[int] = None
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1)
+
+
+class QueryResults(BaseModel):
+    query: str
+    results: List[ChunkResult]
+
+
+class RetrieveBatchResponse(BaseModel):
+    success: bool
+    results: List[QueryResults]
 
 
 # OCR Code
-def extract_text_with_ocr(file_path: str, dpi: int = 300) -> str:
+def extract_text_with_ocr(
+    file_path: str,
+    dpi: int = 300,
+    workers: int = OCR_WORKERS,
+    share_dpi: Optional[int] = None,
+    image_key: Optional[str] = None,
+) -> str:
     """
     Extract text from PDF using OCR (for scanned/image-based PDFs)
 
+    Pages are rendered one at a time and recognized in a process pool
+    (see ocr.iter_ocr_pages), so memory stays bounded for long documents.
+
     Args:
         file_path: Path to PDF file
         dpi: Resolution for image conversion (higher = better quality, slower)
+        workers: Number of parallel OCR processes
+        share_dpi: Optional resolution to keep rendered pages at for vision
+        image_key: Page image directory key (see ocr.new_page_image_key)
 
     Returns:
         OCR-extracted text
     """
     try:
-        print(f"Converting PDF to images for OCR (DPI: {dpi})...")
+        print(f"Running OCR with {workers} workers (DPI: {dpi})...")
 
-        images = convert_from_path(file_path, dpi=dpi)
+        page_texts = []
+        for page_number, page_text in iter_ocr_pages(
+            file_path, dpi=dpi, workers=workers, share_dpi=share_dpi, image_key=image_key
+        ):
+            print(f"Processed page {page_number} with OCR")
+            page_texts.append(page_text + "\n")
 
-        ocr_text = ""
-        for i, image in enumerate(images):
-            print(f"Processing page {i+1}/{len(images)} with OCR...")
-            page_text = pytesseract.image_to_string(image, lang="eng+ind")
-            ocr_text += page_text + "\n"
+        ocr_text = "".join(page_texts)
 
         print(f"OCR extraction complete: {len(ocr_text)} characters")
         return ocr_text
@@ -129,55 +362,178 @@ def extract_text_with_ocr(file_path: str, dpi: int = 300) -> str:
         return ""
 
 
-def extract_image_descriptions_from_pdf(file_path: str, dpi: int = 150) -> List[str]:
+def extract_image_descriptions_from_pdf(
+    file_path: str,
+    dpi: int = VISION_DPI,
+    image_key: Optional[str] = None,
+    model=None,
+) -> List[str]:
     """
     Extract image descriptions from PDF using Gemini 1.5 Flash (cheapest model)
 
+    Only pages with embedded images are sent to the model, several at a
+    time, and descriptions are cached in vision_cache by an exact hash of
+    each page's content (see ocr.page_content_key).
+
     Args:
         file_path: Path to PDF file
         dpi: Resolution for image conversion (150 is sufficient for vision)
+        image_key: Page image directory key (None always renders)
+        model: Optional vision model override (default: Gemini VISION_MODEL)
 
     Returns:
         List of image descriptions
     """
-    try:
-        print(f"Converting PDF to images for vision analysis...")
+    return [
+        description
+        for _, description in extract_page_image_descriptions(
+            file_path, dpi=dpi, image_key=image_key, model=model
+        )
+    ]
 
-        images = convert_from_path(file_path, dpi=dpi)
 
-        # Use Gemini 1.5 Flash (cheapest model with vision)
-        model = genai.GenerativeModel("gemini-1.5-flash")
+def extract_page_image_descriptions(
+    file_path: str,
+    dpi: int = VISION_DPI,
+    image_key: Optional[str] = None,
+    model=None,
+) -> List[Tuple[int, str]]:
+    """
+    Image descriptions with the page each one belongs to
 
-        descriptions = []
+    Returns:
+        (page_number, "[Page N Visual]: description") tuples in page order
+    """
+    import pypdf
 
-        for i, image in enumerate(images):
-            print(f"Analyzing page {i+1}/{len(images)} for visual content...")
+    conn = None
 
-            try:
-                response = model.generate_content(
-                    [
-                        "Describe all images, diagrams, charts, graphs, and visual elements in this page. "
-                        "If no significant visual elements, respond 'No images'. Be concise.",
-                        image,
-                    ]
-                )
+    try:
+        with open(file_path, "rb") as pdf_file:
+            pdf_reader = pypdf.PdfReader(pdf_file)
+            page_count = len(pdf_reader.pages)
+            page_keys = {
+                page_number: page_content_key(page)
+                for page_number, page in enumerate(pdf_reader.pages, start=1)
+                if page_has_images(page)
+            }
+            image_pages = list(page_keys)
 
-                description = response.text.strip()
+        print(
+            f"Analyzing {len(image_pages)}/{page_count} pages with images "
+            f"for visual content..."
+        )
 
-                if description and description.lower() != "no images":
-                    descriptions.append(f"[Page {i+1} Visual]: {description}")
-                    print(f"   Found: {description[:60]}...")
+        if not image_pages:
+            return []
 
-            except Exception as e:
-                print(f"   Error on page {i+1}: {e}")
-                continue
+        try:
+            conn = get_db_connection()
+        except Exception as e:
+            print(f"   Vision cache unavailable: {e}")
+
+        descriptions = describe_pages(
+            file_path,
+            image_pages,
+            model=model,
+            conn=conn,
+            dpi=dpi,
+            image_key=image_key,
+            page_keys={n: key for n, key in page_keys.items() if key},
+        )
 
-        return descriptions
+        for description in descriptions.values():
+            print(f"   Found: {description[:60]}...")
+
+        return [
+            (page_number, f"[Page {page_number} Visual]: {description}")
+            for page_number, description in sorted(descriptions.items())
+        ]
 
     except Exception as e:
         print(f" Vision extraction error: {e}")
         return []
 
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def iter_pdf_pages(
+    file_path: str, use_ocr: bool = True, use_vision: bool = False
+) -> Iterator[Tuple[int, str]]:
+    """
+    Stream page texts from a PDF, with optional OCR and image description
+
+    Pages are classified one by one as they are read: pages with a usable
+    text layer are passed through directly, and only low-text or
+    image-heavy pages go to Tesseract (in parallel, see
+    ocr.iter_pages_with_ocr). Only a few pages are held in memory at once.
+
+    Args:
+        file_path: Path to PDF file
+        use_ocr: Use OCR for pages whose text layer yields little text
+        use_vision: Use Gemini Vision to describe images/diagrams
+
+    Yields:
+        (page_number, text) tuples in page order, followed by the
+        "[Page N Visual]: ..." descriptions when use_vision is set
+    """
+    # With vision enabled, OCR keeps a vision-sized copy of every page it
+    # renders so the vision pass does not rasterize those pages again. The
+    # directory belongs to this run alone and is removed when it ends.
+    image_key = new_page_image_key() if use_vision else None
+    share_dpi = VISION_DPI if use_vision else None
+
+    import pypdf
+
+    def text_layer_pages():
+        with open(file_path, "rb") as pdf_file:
+            pdf_reader = pypdf.PdfReader(pdf_file)
+            for page_number, page in enumerate(pdf_reader.pages, start=1):
+                with INGEST_STAGE_SECONDS.labels("pdf_text").time():
+                    page_text = page.extract_text() or ""
+                    needs_ocr = use_ocr and page_needs_ocr(page, page_text)
+                yield page_number, page_text, needs_ocr
+
+    try:
+        # Try normal text extraction first, classifying each page. Pages
+        # already handed out are not repeated if the text layer breaks later.
+        pages_done = 0
+        try:
+            for page_number, page_text in iter_pages_with_ocr(
+                file_path, text_layer_pages(), share_dpi=share_dpi, image_key=image_key
+            ):
+                yield page_number, page_text
+                pages_done = page_number
+
+        except Exception as e:
+            print(f"Error in normal PDF extraction: {e}")
+
+            # Text layer unreadable, OCR the rest of the document
+            if use_ocr:
+                print("Text extraction failed, switching to OCR for the remaining pages...")
+                remaining = list(range(pages_done + 1, get_page_count(file_path) + 1))
+                for page_number, page_text in iter_ocr_pages(
+                    file_path, pages=remaining, share_dpi=share_dpi, image_key=image_key
+                ):
+                    print(f"Processed page {page_number} with OCR")
+                    yield page_number, page_text
+
+        # Optionally add image descriptions
+        if use_vision:
+            print("️ Extracting image descriptions using Gemini Vision...")
+            image_descriptions = extract_page_image_descriptions(
+                file_path, image_key=image_key
+            )
+            yield from image_descriptions
+            if image_descriptions:
+                print(f" Added {len(image_descriptions)} image descriptions")
+
+    finally:
+        if image_key:
+            clear_page_images(image_key)
+
 
 def extract_text_from_pdf(
     file_path: str, use_ocr: bool = True, use_vision: bool = False
@@ -185,41 +541,211 @@ def extract_text_from_pdf(
     """
     Extract text from PDF with optional OCR and image description
 
+    Whole-document form of iter_pdf_pages; prefer streaming the pages into
+    chunk_pages for large documents.
+
     Args:
         file_path: Path to PDF file
-        use_ocr: Use OCR if normal extraction yields little text
+        use_ocr: Use OCR for pages whose text layer yields little text
         use_vision: Use Gemini Vision to describe images/diagrams
 
     Returns:
         Extracted text with optional image descriptions
     """
-    pdf_text = ""
+    return "".join(
+        page_text + "\n" for _, page_text in iter_pdf_pages(file_path, use_ocr, use_vision)
+    )
 
-    # Try normal text extraction first
-    try:
-        with open(file_path, "rb") as pdf_file:
-            pdf_reader = pypdf.PdfReader(pdf_file)
-            for page in pdf_reader.pages:
-                pdf_text += page.extract_text() + "\n"
-    except Exception as e:
-        print(f"Error in normal PDF extraction: {e}")
 
-    # If extracted text is too short, use OCR
-    if use_ocr and len(pdf_text.strip()) < 100:
-        print("Text extraction yielded little content, switching to OCR...")
-        pdf_text = extract_text_with_ocr(file_path)
+# Chunks written per INSERT/UPDATE while syncing a document's chunks
+CHUNK_INSERT_BATCH = int(os.getenv("CHUNK_INSERT_BATCH", "500"))
+
+
+def store_chunks(cursor, document_id: int, chunks: List[Dict[str, Any]]) -> List[int]:
+    """
+    Insert chunks WITHOUT embeddings (status = 'pending')
+
+    Returns:
+        IDs of the inserted chunks, in input order
+    """
+    if not chunks:
+        return []
+
+    chunk_data = [
+        (
+            document_id,
+            chunk["content"],
+            chunk["chunk_index"],
+            chunk.get("page_number"),
+            "pending",  # Initial status
+            content_hash(chunk["content"]),
+        )
+        for chunk in chunks
+    ]
+
+    rows = execute_values(
+        cursor,
+        """
+        INSERT INTO chunks (document_id, content, chunk_index, page_number, status, content_hash)
+        VALUES %s
+        RETURNING id
+        """,
+        chunk_data,
+        page_size=max(1, len(chunk_data)),
+        fetch=True,
+    )
+    return [row[0] for row in rows]
+
+
+def reuse_existing_embeddings(cursor, chunk_ids: List[int]) -> List[int]:
+    """
+    Copy embeddings from already-embedded chunks with identical content
+
+    Chunks shared across documents (or kept from a previous index run)
+    are marked 'embedded' without another embedding API call.
+
+    Returns:
+        IDs of the chunks that reused an embedding
+    """
+    if not chunk_ids:
+        return []
+
+    cursor.execute(
+        """
+        UPDATE chunks AS c
+        SET embedding = src.embedding,
+            status = 'embedded',
+            error_message = NULL,
+            claimed_by = NULL,
+            claimed_at = NULL,
+            updated_at = NOW()
+        FROM (
+            SELECT DISTINCT ON (e.content_hash) e.content_hash, e.embedding
+            FROM chunks e
+            WHERE e.content_hash IN (
+                SELECT content_hash FROM chunks WHERE id = ANY(%s)
+            )
+              AND e.status = 'embedded'
+              AND e.embedding IS NOT NULL
+            ORDER BY e.content_hash, e.id
+        ) AS src
+        WHERE c.id = ANY(%s)
+          AND c.content_hash = src.content_hash
+          AND c.status <> 'embedded'
+        RETURNING c.id
+        """,
+        (chunk_ids, chunk_ids),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def sync_chunks(
+    cursor,
+    document_id: int,
+    chunks: Iterable[Dict[str, Any]],
+    batch_size: int = CHUNK_INSERT_BATCH,
+) -> Dict[str, int]:
+    """
+    Bring a document's stored chunks in line with a fresh chunking result
+
+    Chunks are matched by normalized-content hash: unchanged chunks keep
+    their row and embedding (only chunk_index and page_number are updated),
+    new chunks are inserted, and chunks that disappeared are deleted. New
+    chunks whose content is already embedded anywhere reuse that embedding.
+
+    `chunks` may be a generator (e.g. chunk_pages): it is consumed once and
+    writes go out in batches of `batch_size`, so only one batch of chunk
+    contents is held in memory.
+
+    Returns:
+        Counts of kept, inserted, deleted and reused chunks
+    """
+    cursor.execute(
+        """
+        SELECT id, content_hash, chunk_index, page_number
+        FROM chunks WHERE document_id = %s ORDER BY chunk_index, id
+        """,
+        (document_id,),
+    )
+
+    # Hash -> existing chunk rows; a list because boilerplate can repeat
+    existing: Dict[str, List[Any]] = {}
+    for chunk_id, chunk_hash, chunk_index, page_number in cursor.fetchall():
+        existing.setdefault(chunk_hash, []).append((chunk_id, chunk_index, page_number))
+
+    stats = {"kept": 0, "inserted": 0, "deleted": 0, "reused_embeddings": 0}
+    moved = []
+    new_chunks = []
+
+    insert_seconds = INGEST_STAGE_SECONDS.labels("insert")
+
+    def flush_moved():
+        if not moved:
+            return
+        with insert_seconds.time():
+            execute_values(
+                cursor,
+                """
+                UPDATE chunks AS c
+                SET chunk_index = v.chunk_index, page_number = v.page_number, updated_at = NOW()
+                FROM (VALUES %s) AS v(id, chunk_index, page_number)
+                WHERE c.id = v.id
+                """,
+                moved,
+                template="(%s, %s, %s::integer)",
+                page_size=max(1, len(moved)),
+            )
+        moved.clear()
+
+    def flush_new():
+        if not new_chunks:
+            return
+        with insert_seconds.time():
+            inserted_ids = store_chunks(cursor, document_id, new_chunks)
+            stats["inserted"] += len(inserted_ids)
+            stats["reused_embeddings"] += len(reuse_existing_embeddings(cursor, inserted_ids))
+        new_chunks.clear()
+
+    for chunk in chunks:
+        matches = existing.get(content_hash(chunk["content"]))
+        if matches:
+            chunk_id, old_index, old_page = matches.pop(0)
+            stats["kept"] += 1
+            page_number = chunk.get("page_number")
+            if old_index != chunk["chunk_index"] or old_page != page_number:
+                moved.append((chunk_id, chunk["chunk_index"], page_number))
+                if len(moved) >= batch_size:
+                    flush_moved()
+        else:
+            new_chunks.append(chunk)
+            if len(new_chunks) >= batch_size:
+                flush_new()
+
+    flush_moved()
+    flush_new()
+
+    removed_ids = [chunk_id for rows in existing.values() for chunk_id, _, _ in rows]
+
+    if removed_ids:
+        cursor.execute("DELETE FROM chunks WHERE id = ANY(%s)", (removed_ids,))
+    stats["deleted"] = len(removed_ids)
 
-    # Optionally add image descriptions
-    if use_vision:
-        print("️ Extracting image descriptions using Gemini Vision...")
-        image_descriptions = extract_image_descriptions_from_pdf(file_path)
+    return stats
 
-        if image_descriptions:
-            pdf_text += "\n\n=== Visual Content Descriptions ===\n"
-            pdf_text += "\n\n".join(image_descriptions)
-            print(f" Added {len(image_descriptions)} image descriptions")
 
-    return pdf_text
+def document_unchanged(cursor, document_id: int, file_content_hash: str) -> bool:
+    """Whether a document was already chunked from a file with this content hash"""
+    cursor.execute(
+        """
+        SELECT d.content_hash = %s
+               AND EXISTS (SELECT 1 FROM chunks WHERE document_id = d.id)
+        FROM documents d
+        WHERE d.id = %s
+        """,
+        (file_content_hash, document_id),
+    )
+    row = cursor.fetchone()
+    return bool(row and row[0])
 
 
 @app.get("/")
@@ -229,14 +755,13 @@ async def root():
 
 
 @app.get("/health")
-async def health_check():
+def health_check():
     """Detailed health check with database connectivity"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
 
         return {
             "status": "healthy",
@@ -256,10 +781,14 @@ async def health_check():
 
 
 @app.post("/index", response_model=IndexResponse)
-async def index_document(request: IndexRequest):
+def index_document(request: IndexRequest):
     """
     Process a PDF document: extract text, chunk, and store to database
+
+    Declared as a plain function so FastAPI runs it in its threadpool: PDF
+    extraction, OCR and psycopg2 block, and would otherwise stall /retrieve.
     """
+    started_at = time.perf_counter()
     try:
         # Update document status to processing
         conn = get_db_connection()
@@ -277,73 +806,82 @@ async def index_document(request: IndexRequest):
                 status_code=404, detail=f"File not found: {request.file_path}"
             )
 
-        # Extract text from PDF WITH OCR and optional Vision (ONLY ONCE)
-        print(f"Extracting text from PDF: {request.file_path}")
-        pdf_text = extract_text_from_pdf(
-            request.file_path,
-            use_ocr=True,
-            use_vision=request.use_vision,  # ← Single extraction call
-        )
+        # Skip extraction entirely if this exact file was already chunked
+        file_content_hash = file_hash(request.file_path)
 
-        if not pdf_text.strip():
-            raise HTTPException(
-                status_code=400, detail="No text extracted from PDF (tried OCR)"
+        if not request.force and document_unchanged(
+            cursor, request.document_id, file_content_hash
+        ):
+            cursor.execute(
+                "UPDATE documents SET status = 'completed', updated_at = NOW() WHERE id = %s",
+                (request.document_id,),
             )
+            conn.commit()
+            cursor.close()
+            conn.close()
 
-        print(f"Extracted {len(pdf_text)} characters from PDF")
-
-        # Chunk text with semantic chunking
-        print("Chunking text with semantic splitting...")
-        chunks = chunk_text(pdf_text, chunk_size=1000, overlap=200, method="semantic")
+            print(f"Document {request.document_id} unchanged, skipping re-index")
 
-        if not chunks:
-            raise HTTPException(status_code=400, detail="No chunks created from text")
+            return IndexResponse(
+                success=True,
+                document_id=request.document_id,
+                chunks_created=0,
+                message="Document content unchanged; existing chunks kept.",
+            )
 
-        print(f"Created {len(chunks)} semantic chunks")
+        # Stream pages (OCR and optional Vision per page, ONLY ONCE) into the
+        # chunker, and diff the chunks against the stored ones in batches;
+        # only new content is inserted as 'pending'
+        print(f"Extracting and chunking PDF: {request.file_path}")
+        chunks = chunk_pages(
+            iter_pdf_pages(request.file_path, use_ocr=True, use_vision=request.use_vision),
+            chunk_size=1000,
+            overlap=200,
+            method="semantic",
+        )
+        sync_stats = sync_chunks(cursor, request.document_id, chunks)
+        chunk_count = sync_stats["kept"] + sync_stats["inserted"]
 
-        # Store chunks to database WITHOUT embeddings (status = 'pending')
-        print("Storing chunks to database...")
-        chunk_data = [
-            (
-                request.document_id,
-                chunks[i]["content"],
-                chunks[i]["chunk_index"],
-                "pending",  # Initial status
+        # Nothing is committed until here, so existing chunks survive an empty extraction
+        if not chunk_count:
+            conn.rollback()
+            raise HTTPException(
+                status_code=400, detail="No text extracted from PDF (tried OCR)"
             )
-            for i in range(len(chunks))
-        ]
 
-        execute_values(
-            cursor,
-            """
-            INSERT INTO chunks (document_id, content, chunk_index, status)
-            VALUES %s
-            """,
-            chunk_data,
-        )
+        print(f"Created {chunk_count} semantic chunks")
 
         # Update document status to completed (chunking done)
         cursor.execute(
             """
             UPDATE documents 
-            SET status = 'completed', updated_at = NOW() 
+            SET status = 'completed', content_hash = %s, updated_at = NOW() 
             WHERE id = %s
             """,
-            (request.document_id,),
+            (file_content_hash, request.document_id),
         )
 
         conn.commit()
         cursor.close()
         conn.close()
 
-        print(f"Successfully chunked document {request.document_id}")
+        print(
+            f"Successfully chunked document {request.document_id}: "
+            f"{sync_stats['inserted']} new, {sync_stats['kept']} unchanged, "
+            f"{sync_stats['deleted']} removed, "
+            f"{sync_stats['reused_embeddings']} reused embeddings"
+        )
         print(f"Note: Run /embed endpoint to generate embeddings for these chunks")
 
         return IndexResponse(
             success=True,
             document_id=request.document_id,
-            chunks_created=len(chunks),
-            message=f"Successfully chunked document with {len(chunks)} chunks. Run /embed to generate embeddings.",
+            chunks_created=sync_stats["inserted"],
+            message=(
+                f"Successfully chunked document with {chunk_count} chunks "
+                f"({sync_stats['inserted']} new, {sync_stats['kept']} unchanged, "
+                f"{sync_stats['deleted']} removed). Run /embed to generate embeddings."
+            ),
         )
 
     except Exception as e:
@@ -369,58 +907,261 @@ async def index_document(request: IndexRequest):
 
         raise HTTPException(status_code=500, detail=str(e))
 
+    finally:
+        INGEST_STAGE_SECONDS.labels("total").observe(time.perf_counter() - started_at)
 
-@app.post("/embed")
-async def embed_pending_chunks(
-    document_id: Optional[int] = None, batch_size: int = 50, max_retries: int = 3
+
+# A claim on pending chunks older than this is treated as abandoned (the
+# embedding process died) and the chunks can be claimed again
+EMBED_CLAIM_SECONDS = int(os.getenv("EMBED_CLAIM_SECONDS", "600"))
+
+
+def claim_chunks(
+    cursor,
+    claim: str,
+    document_id: Optional[int],
+    max_retries: int,
+    limit: int,
+) -> List[Tuple[int, str, int, int]]:
+    """
+    Claim up to `limit` pending/failed chunks for one embedding run
+
+    Rows are locked with FOR UPDATE SKIP LOCKED and stamped with `claim`,
+    so concurrent /embed calls and embed jobs never pick the same chunks.
+
+    Returns:
+        (id, content, retry_count, document_id) of the claimed chunks
+    """
+    document_filter = "AND document_id = %(document_id)s" if document_id else ""
+    cursor.execute(
+        f"""
+        UPDATE chunks AS c
+        SET claimed_by = %(claim)s, claimed_at = NOW()
+        WHERE c.id IN (
+            SELECT id FROM chunks
+            WHERE status IN ('pending', 'failed')
+              AND retry_count < %(max_retries)s
+              AND (claimed_by IS NULL
+                   OR claimed_at < NOW() - make_interval(secs => %(claim_seconds)s))
+              {document_filter}
+            ORDER BY id
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING c.id, c.content, c.retry_count, c.document_id
+        """,
+        {
+            "claim": claim,
+            "document_id": document_id,
+            "max_retries": max_retries,
+            "claim_seconds": EMBED_CLAIM_SECONDS,
+            "limit": limit,
+        },
+    )
+    return sorted(cursor.fetchall())
+
+
+def release_chunks(cursor, claim: str):
+    """Drop whatever is left of a claim (chunks that were neither stored nor failed)"""
+    cursor.execute(
+        "UPDATE chunks SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = %s",
+        (claim,),
+    )
+
+
+def store_chunk_embeddings(
+    cursor, chunk_ids: List[int], embeddings: List[List[float]], claim: Optional[str] = None
 ):
     """
-    Generate embeddings for chunks with status 'pending' or 'failed'
+    Write embeddings for many chunks with a single UPDATE ... FROM (VALUES ...)
+
+    With a claim, only rows still held by it are written, so a run whose
+    claim expired and was taken over cannot overwrite the new owner's work.
+    """
+    execute_values(
+        cursor,
+        """
+        UPDATE chunks AS c
+        SET embedding = v.embedding::vector,
+            status = 'embedded',
+            updated_at = NOW(),
+            error_message = NULL,
+            claimed_by = NULL,
+            claimed_at = NULL
+        FROM (VALUES %s) AS v(id, embedding, claim)
+        WHERE c.id = v.id
+          AND (v.claim IS NULL OR c.claimed_by = v.claim)
+        """,
+        [(chunk_id, embedding, claim) for chunk_id, embedding in zip(chunk_ids, embeddings)],
+        template="(%s, %s, %s::text)",
+        page_size=max(1, len(chunk_ids)),
+    )
+
+
+def mark_chunks_failed(
+    cursor, chunk_ids: List[int], error_msg: str, claim: Optional[str] = None
+):
+    """Mark chunks as failed and bump their retry count (only rows held by `claim`, if given)"""
+    cursor.execute(
+        """
+        UPDATE chunks 
+        SET status = 'failed',
+            error_message = %s,
+            retry_count = retry_count + 1,
+            claimed_by = NULL,
+            claimed_at = NULL,
+            updated_at = NOW()
+        WHERE id = ANY(%s)
+          AND (%s::text IS NULL OR claimed_by = %s)
+        """,
+        (error_msg, chunk_ids, claim, claim),
+    )
+
+
+def run_embedding(
+    document_id: Optional[int] = None,
+    batch_size: int = 50,
+    max_retries: int = 3,
+    concurrency: int = EMBED_CONCURRENCY,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Embed up to `limit` pending/failed chunks through the embedding scheduler
 
     Args:
         document_id: Optional - process only chunks from specific document
-        batch_size: Number of chunks to process in one batch (default: 50)
-        max_retries: Maximum retry count for failed chunks (default: 3)
+        batch_size: Number of chunks sent per embedding request
+        max_retries: Maximum retry count for failed chunks
+        concurrency: Number of embedding requests in flight at once
+        limit: Maximum chunks to process (default: batch_size * concurrency)
 
     Returns:
-        Status and statistics of embedding generation
+        Throughput statistics, with failed chunk IDs under "failed_keys"
     """
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+    claim = uuid.uuid4().hex
 
-        # Get pending/failed chunks (with retry limit)
-        if document_id:
-            cursor.execute(
-                """
-                SELECT id, content, retry_count 
-                FROM chunks 
-                WHERE document_id = %s 
-                  AND status IN ('pending', 'failed')
-                  AND retry_count < %s
-                ORDER BY id
-                LIMIT %s
-                """,
-                (document_id, max_retries, batch_size),
+    with db_connection() as conn, conn.cursor() as cursor:
+        try:
+            batch_size = max(1, min(batch_size, MAX_EMBED_BATCH_SIZE))
+            concurrency = max(1, concurrency)
+            limit = limit or batch_size * concurrency
+
+            # Claim pending/failed chunks (with retry limit), committed at once
+            # so other embedders skip them
+            pending_chunks = claim_chunks(cursor, claim, document_id, max_retries, limit)
+            conn.commit()
+
+            # Chunks whose content is already embedded elsewhere need no API call
+            reused_ids = set(
+                reuse_existing_embeddings(cursor, [row[0] for row in pending_chunks])
             )
-        else:
-            cursor.execute(
-                """
-                SELECT id, content, retry_count 
-                FROM chunks 
-                WHERE status IN ('pending', 'failed')
-                  AND retry_count < %s
-                ORDER BY id
-                LIMIT %s
-                """,
-                (max_retries, batch_size),
+            conn.commit()
+
+            if reused_ids:
+                print(f"Reused existing embeddings for {len(reused_ids)} chunks")
+                pending_chunks = [row for row in pending_chunks if row[0] not in reused_ids]
+
+            if not pending_chunks:
+                return {
+                    "processed": len(reused_ids),
+                    "succeeded": len(reused_ids),
+                    "failed": 0,
+                    "failed_keys": [],
+                    "reused_embeddings": len(reused_ids),
+                }
+
+            print(
+                f"Processing {len(pending_chunks)} pending chunks "
+                f"({concurrency} concurrent requests of {batch_size})..."
+            )
+
+            batches = [
+                (
+                    [row[0] for row in pending_chunks[i : i + batch_size]],
+                    [row[1] for row in pending_chunks[i : i + batch_size]],
+                )
+                for i in range(0, len(pending_chunks), batch_size)
+            ]
+
+            # Callbacks run on this thread, so they can share one connection.
+            # Each batch is committed on its own so progress survives a crash.
+            chunk_documents = {row[0]: row[3] for row in pending_chunks}
+
+            def on_success(chunk_ids, embeddings):
+                try:
+                    store_chunk_embeddings(cursor, chunk_ids, embeddings, claim)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+
+                # Committed, so the in-memory index can serve them right away
+                if vector_index.ready:
+                    vector_index.upsert(
+                        chunk_ids, [chunk_documents[i] for i in chunk_ids], embeddings
+                    )
+
+            def on_failure(chunk_ids, error):
+                mark_chunks_failed(cursor, chunk_ids, str(error), claim)
+                conn.commit()
+
+            scheduler = EmbeddingScheduler(
+                embed_fn=lambda texts: embed_batches(
+                    texts, task_type="retrieval_document", batch_size=batch_size
+                ),
+                concurrency=concurrency,
             )
+            stats = scheduler.run(batches, on_success=on_success, on_failure=on_failure)
 
-        pending_chunks = cursor.fetchall()
+            stats["processed"] += len(reused_ids)
+            stats["succeeded"] += len(reused_ids)
+            stats["reused_embeddings"] = len(reused_ids)
 
-        if not pending_chunks:
-            cursor.close()
-            conn.close()
+            print(
+                f"Embedding complete: {stats['succeeded']} succeeded, "
+                f"{stats['failed']} failed ({stats['chunks_per_second']} chunks/s)"
+            )
+            return stats
+
+        finally:
+            # After an error, chunks still claimed become claimable again
+            # right away instead of when the claim expires
+            try:
+                conn.rollback()
+                release_chunks(cursor, claim)
+                conn.commit()
+            except psycopg2.Error as e:
+                print(f"Could not release claimed chunks: {e}")
+
+
+@app.post("/embed")
+def embed_pending_chunks(
+    document_id: Optional[int] = None,
+    batch_size: int = 50,
+    max_retries: int = 3,
+    concurrency: int = EMBED_CONCURRENCY,
+    limit: Optional[int] = None,
+):
+    """
+    Generate embeddings for chunks with status 'pending' or 'failed'
+
+    Declared as a plain function so FastAPI runs it in its threadpool; the
+    blocking genai and psycopg2 calls no longer stall the event loop.
+
+    Args:
+        document_id: Optional - process only chunks from specific document
+        batch_size: Number of chunks sent per embedding request (default: 50)
+        max_retries: Maximum retry count for failed chunks (default: 3)
+        concurrency: Number of embedding requests in flight at once
+        limit: Maximum chunks to process in this call (default: batch_size * concurrency)
+
+    Returns:
+        Status and throughput statistics of embedding generation
+    """
+    try:
+        stats = run_embedding(document_id, batch_size, max_retries, concurrency, limit)
+
+        if not stats["processed"]:
             return {
                 "success": True,
                 "message": "No pending chunks to process",
@@ -429,237 +1170,592 @@ async def embed_pending_chunks(
                 "failed": 0,
             }
 
-        print(f"Processing {len(pending_chunks)} pending chunks...")
+        failed_ids = stats.pop("failed_keys")
 
-        succeeded = 0
-        failed = 0
-        failed_ids = []
+        # Newly embedded rows may have outgrown an IVFFlat index (checked and
+        # rebuilt in the background, the response does not wait for it)
+        if stats["succeeded"]:
+            maybe_rebuild_index()
 
-        # Process each chunk
-        for chunk_id, content, retry_count in pending_chunks:
-            try:
-                # Generate embedding
-                embedding = embed_text(content, task_type="retrieval_document")
+        return {
+            "success": True,
+            "message": f"Processed {stats['processed']} chunks",
+            **stats,
+            "failed_chunk_ids": failed_ids,
+        }
 
-                # Update chunk with embedding
+    except Exception as e:
+        print(f"Error in embed_pending_chunks: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/retry-failed")
+def retry_failed_chunks(document_id: Optional[int] = None):
+    """
+    Retry embedding for failed chunks (reset retry_count)
+
+    Args:
+        document_id: Optional - retry only chunks from specific document
+
+    Returns:
+        Number of chunks reset for retry
+    """
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+
+            if document_id:
                 cursor.execute(
                     """
                     UPDATE chunks 
-                    SET embedding = %s::vector, 
-                        status = 'embedded',
-                        updated_at = NOW(),
-                        error_message = NULL
-                    WHERE id = %s
+                    SET status = 'pending', 
+                        retry_count = 0, 
+                        error_message = NULL,
+                        updated_at = NOW()
+                    WHERE document_id = %s AND status = 'failed'
+                    RETURNING id
                     """,
-                    (embedding, chunk_id),
+                    (document_id,),
                 )
-                succeeded += 1
-
-            except Exception as e:
-                error_msg = str(e)
-                print(f"Error embedding chunk {chunk_id}: {error_msg}")
-
-                # Update chunk as failed with retry count
+            else:
                 cursor.execute(
                     """
                     UPDATE chunks 
-                    SET status = 'failed',
-                        error_message = %s,
-                        retry_count = retry_count + 1,
+                    SET status = 'pending', 
+                        retry_count = 0, 
+                        error_message = NULL,
                         updated_at = NOW()
-                    WHERE id = %s
-                    """,
-                    (error_msg, chunk_id),
+                    WHERE status = 'failed'
+                    RETURNING id
+                    """
                 )
-                failed += 1
-                failed_ids.append(chunk_id)
-
-        conn.commit()
-        cursor.close()
-        conn.close()
 
-        print(f"Embedding complete: {succeeded} succeeded, {failed} failed")
+            reset_chunks = cursor.fetchall()
+            conn.commit()
+            cursor.close()
 
         return {
             "success": True,
-            "message": f"Processed {len(pending_chunks)} chunks",
-            "processed": len(pending_chunks),
-            "succeeded": succeeded,
-            "failed": failed,
-            "failed_chunk_ids": failed_ids if failed > 0 else [],
+            "message": f"Reset {len(reset_chunks)} failed chunks for retry",
+            "reset_count": len(reset_chunks),
         }
 
     except Exception as e:
-        print(f"Error in embed_pending_chunks: {e}")
+        print(f"Error in retry_failed_chunks: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/retry-failed")
-async def retry_failed_chunks(document_id: Optional[int] = None):
+@app.post("/jobs/index")
+def enqueue_index_job(request: IndexRequest):
     """
-    Retry embedding for failed chunks (reset retry_count)
-
-    Args:
-        document_id: Optional - retry only chunks from specific document
+    Queue a document for background ingestion (extract -> chunk -> embed)
 
-    Returns:
-        Number of chunks reset for retry
+    Returns immediately; the work is done by worker.py processes and
+    progress can be followed with GET /jobs/{job_id}. The /jobs endpoints
+    are plain functions so their psycopg2 calls run in FastAPI's threadpool.
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        if document_id:
-            cursor.execute(
-                """
-                UPDATE chunks 
-                SET status = 'pending', 
-                    retry_count = 0, 
-                    error_message = NULL,
-                    updated_at = NOW()
-                WHERE document_id = %s AND status = 'failed'
-                RETURNING id
-                """,
-                (document_id,),
+            job_id = enqueue_job(
+                cursor,
+                request.document_id,
+                "extract",
+                {
+                    "file_path": request.file_path,
+                    "use_vision": request.use_vision,
+                    "force": request.force,
+                },
             )
-        else:
             cursor.execute(
-                """
-                UPDATE chunks 
-                SET status = 'pending', 
-                    retry_count = 0, 
-                    error_message = NULL,
-                    updated_at = NOW()
-                WHERE status = 'failed'
-                RETURNING id
-                """
+                "UPDATE documents SET status = 'pending', updated_at = NOW() WHERE id = %s",
+                (request.document_id,),
             )
 
-        reset_chunks = cursor.fetchall()
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
+            cursor.close()
 
         return {
             "success": True,
-            "message": f"Reset {len(reset_chunks)} failed chunks for retry",
-            "reset_count": len(reset_chunks),
+            "job_id": job_id,
+            "document_id": request.document_id,
+            "stage": "extract",
         }
 
     except Exception as e:
-        print(f"Error in retry_failed_chunks: {e}")
+        print(f"Error enqueueing index job: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/jobs/embed")
+def enqueue_embed_job(document_id: int):
+    """Queue embedding generation for a document's pending chunks"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+
+            job_id = enqueue_job(cursor, document_id, "embed")
+
+            conn.commit()
+            cursor.close()
+
+        return {
+            "success": True,
+            "job_id": job_id,
+            "document_id": document_id,
+            "stage": "embed",
+        }
+
+    except Exception as e:
+        print(f"Error enqueueing embed job: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/jobs")
+def get_jobs(
+    document_id: Optional[int] = None, status: Optional[str] = None, limit: int = 50
+):
+    """List recent jobs, optionally filtered by document and status"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+            jobs = list_jobs(cursor, document_id=document_id, status=status, limit=limit)
+
+            cursor.close()
+
+        return {"success": True, "jobs": jobs}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: int):
+    """Get status and progress of a single job"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+            job = get_job(cursor, job_id)
+
+            cursor.close()
+
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+        return {"success": True, "job": job}
+
+    except HTTPException:
+        raise
+    except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/retrieve", response_model=RetrieveResponse)
 async def retrieve_chunks(request: RetrieveRequest):
     """
-    Perform semantic search to retrieve relevant chunks for a query
+    Retrieve relevant chunks for a query
+
+    Modes:
+        vector: cosine similarity on embeddings (in-memory vector index when
+            enabled and loaded, otherwise match_chunks, or two-stage search
+            over the coarse Matryoshka index when two_stage is set)
+        lexical: full-text search, no embedding call (match_chunks_lexical)
+        hybrid: reciprocal rank fusion of both (hybrid_match_chunks)
+
+    Results are cached per corpus version: repeated queries are served from
+    retrieval_cache, and with SEMANTIC_CACHE_ENABLED paraphrases of a recent
+    query reuse its results from semantic_cache.
 
     Args:
         query: Search query text
         top_k: Number of top results to return (default: 5)
         document_id: Optional filter by specific document
+        mode: Retrieval signal(s) to use (default: vector)
+        ef_search: HNSW candidate list size (higher = better recall, slower)
+        probes: IVFFlat lists scanned (higher = better recall, slower)
+        two_stage: Coarse-index candidates rescored on full embeddings
 
     Returns:
         RetrieveResponse with list of similar chunks
     """
+    started_at = time.perf_counter()
     try:
-        # Generate embedding for query
-        print(f"Generating embedding for query: {request.query}")
-        query_embedding = embed_query(request.query)
+        candidates = max(HYBRID_CANDIDATES, request.top_k)
+        two_stage = (
+            request.two_stage if request.two_stage is not None else RETRIEVE_TWO_STAGE
+        ) and EMBEDDING_COARSE_DIMENSION > 0
+
+        # Repeated queries are served from the cache until the corpus changes
+        cache_key = (
+            normalize_query(request.query),
+            request.top_k,
+            request.document_id,
+            request.mode,
+            two_stage,
+            request.ef_search,
+            request.probes,
+        )
+        use_semantic_cache = semantic_cache.enabled and request.mode != "lexical"
+        corpus_version = None
+        if retrieval_cache.enabled or use_semantic_cache:
+            with RETRIEVE_STAGE_SECONDS.labels("corpus_version").time():
+                async with async_db_connection() as conn:
+                    corpus_version = await get_corpus_version(conn)
+        if corpus_version is not None and retrieval_cache.enabled:
+            cached = retrieval_cache.get(cache_key, corpus_version)
+            if cached is not None:
+                return RetrieveResponse(
+                    success=True,
+                    query=request.query,
+                    mode=request.mode,
+                    results=cached,
+                    cache="exact",
+                    corpus_version=corpus_version,
+                )
 
-        # Search database using match_chunks function
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        query_embedding = None
+        if request.mode != "lexical":
+            # Generate embedding for query (on a worker thread, the SDK is blocking)
+            print(f"Generating embedding for query: {request.query}")
+            with RETRIEVE_STAGE_SECONDS.labels("embedding").time():
+                query_embedding = await embed_query_async(request.query)
+
+        # Paraphrases of a recent query reuse its results (no search)
+        if corpus_version is not None and use_semantic_cache:
+            match = semantic_cache.get(cache_key[1:], query_embedding, corpus_version)
+            if match is not None:
+                cached_query, cached, similarity = match
+                print(f"Semantic cache hit ({similarity:.3f}): {cached_query}")
+                return RetrieveResponse(
+                    success=True,
+                    query=request.query,
+                    mode=request.mode,
+                    results=cached,
+                    cache="semantic",
+                    cached_query=cached_query,
+                    corpus_version=corpus_version,
+                )
 
-        cursor.execute(
-            """
-            SELECT * FROM match_chunks(%s::vector, %s, %s)
-            """,
-            (query_embedding, request.top_k, request.document_id),
-        )
+        search_started = time.perf_counter()
+        async with async_db_connection() as conn, conn.transaction():
+            if request.mode == "hybrid" or (request.mode == "vector" and not vector_index.ready):
+                # HNSW returns at most ef_search rows, so never go below the candidates needed
+                if request.mode == "hybrid":
+                    needed = candidates
+                elif two_stage:
+                    needed = max(TWO_STAGE_CANDIDATES, request.top_k)
+                else:
+                    needed = request.top_k
+                await set_ann_search_params(
+                    conn,
+                    ef_search=min(max(request.ef_search or ANN_EF_SEARCH, needed), 1000),
+                    probes=request.probes or ANN_PROBES,
+                )
 
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
+            if request.mode == "vector" and vector_index.ready:
+                results = await search_chunks(
+                    conn, vector_index, query_embedding, request.top_k, request.document_id
+                )
+            elif request.mode == "vector" and two_stage:
+                results = await match_chunks_two_stage(
+                    conn,
+                    query_embedding,
+                    request.top_k,
+                    request.document_id,
+                    candidate_count=max(TWO_STAGE_CANDIDATES, request.top_k),
+                )
+            elif request.mode == "vector":
+                results = await match_chunks(
+                    conn, query_embedding, request.top_k, request.document_id
+                )
+            elif request.mode == "lexical":
+                results = await match_chunks_lexical(
+                    conn, request.query, request.top_k, request.document_id
+                )
+            else:
+                results = await hybrid_match_chunks(
+                    conn,
+                    query_embedding,
+                    request.query,
+                    request.top_k,
+                    request.document_id,
+                    candidate_count=candidates,
+                    rrf_k=RRF_K,
+                )
+        RETRIEVE_STAGE_SECONDS.labels("search").observe(time.perf_counter() - search_started)
 
         # Format results
         chunk_results = [
             ChunkResult(
-                chunk_id=row[0],
-                document_id=row[1],
-                content=row[2],
-                chunk_index=row[3],
-                similarity=float(row[4]),
+                chunk_id=row["id"],
+                document_id=row["document_id"],
+                content=row["content"],
+                chunk_index=row["chunk_index"],
+                similarity=float(row["similarity"]),
+                vector_rank=row.get("vector_rank"),
+                lexical_rank=row.get("lexical_rank"),
             )
             for row in results
         ]
 
-        print(f"Found {len(chunk_results)} relevant chunks")
+        print(f"Found {len(chunk_results)} relevant chunks ({request.mode})")
+
+        if corpus_version is not None:
+            if retrieval_cache.enabled:
+                retrieval_cache.put(cache_key, corpus_version, chunk_results)
+            if use_semantic_cache:
+                semantic_cache.put(
+                    cache_key[1:],
+                    query_embedding,
+                    corpus_version,
+                    request.query,
+                    chunk_results,
+                    time.perf_counter() - search_started,
+                )
 
         return RetrieveResponse(
-            success=True, query=request.query, results=chunk_results
+            success=True,
+            query=request.query,
+            mode=request.mode,
+            results=chunk_results,
+            corpus_version=corpus_version,
         )
 
     except Exception as e:
         print(f"Error retrieving chunks: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    finally:
+        RETRIEVE_STAGE_SECONDS.labels("total").observe(time.perf_counter() - started_at)
 
-@app.get("/stats")
-async def get_stats():
-    """Get indexer statistics with chunk status breakdown"""
+
+@app.post("/retrieve/batch", response_model=RetrieveBatchResponse)
+async def retrieve_chunks_batch(request: RetrieveBatchRequest):
+    """
+    Vector search for many queries at once
+
+    All queries are embedded with batched provider calls (up to 100 per
+    request) and searched in one set-based SQL statement, or one matrix
+    multiply when the in-memory vector index is loaded.
+
+    Args:
+        queries: Search query texts
+        top_k: Number of top results per query (default: 5)
+        document_id: Optional filter by specific document
+        ef_search: HNSW candidate list size
+        probes: IVFFlat lists scanned
+
+    Returns:
+        RetrieveBatchResponse with one result list per query, in input order
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        print(f"Generating embeddings for {len(request.queries)} queries")
+        query_embeddings = await embed_queries_async(request.queries)
+
+        async with async_db_connection() as conn, conn.transaction():
+            if vector_index.ready:
+                results = await search_chunks_batch(
+                    conn, vector_index, query_embeddings, request.top_k, request.document_id
+                )
+            else:
+                await set_ann_search_params(
+                    conn,
+                    ef_search=min(max(request.ef_search or ANN_EF_SEARCH, request.top_k), 1000),
+                    probes=request.probes or ANN_PROBES,
+                )
+                results = await match_chunks_batch(
+                    conn, query_embeddings, request.top_k, request.document_id
+                )
+
+        return RetrieveBatchResponse(
+            success=True,
+            results=[
+                QueryResults(
+                    query=query,
+                    results=[
+                        ChunkResult(
+                            chunk_id=row["id"],
+                            document_id=row["document_id"],
+                            content=row["content"],
+                            chunk_index=row["chunk_index"],
+                            similarity=float(row["similarity"]),
+                        )
+                        for row in rows
+                    ],
+                )
+                for query, rows in zip(request.queries, results)
+            ],
+        )
+
+    except Exception as e:
+        print(f"Error retrieving chunks in batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 
-        # Get document counts by status
+def count_statuses(cursor, exact: bool = False) -> Dict[str, Any]:
+    """
+    Document and chunk counts per status
+
+    By default these come from status_count_totals, which triggers keep up
+    to date (a few rows, no table scan). With exact=True, or before
+    migration_add_status_counts.sql, they are counted from the tables.
+
+    Returns:
+        {"documents": {status: n}, "chunks": {total, with_embeddings, by_status}}
+    """
+    rows = None
+    if not exact:
+        try:
+            cursor.execute("SELECT compact_status_counts()")
+            cursor.execute(
+                "SELECT table_name, status, with_embedding, count FROM status_count_totals"
+            )
+            rows = cursor.fetchall()
+            cursor.connection.commit()
+        except psycopg2.Error as e:
+            print(f"Maintained status counts unavailable, counting rows: {e}")
+            cursor.connection.rollback()
+
+    if rows is None:
         cursor.execute(
             """
-            SELECT status, COUNT(*) 
-            FROM documents 
-            GROUP BY status
+            SELECT 'documents', COALESCE(status, 'unknown'), FALSE, COUNT(*)
+            FROM documents
+            GROUP BY 2
             """
         )
-        doc_stats = dict(cursor.fetchall())
-
-        # Get chunk counts by status
+        rows = cursor.fetchall()
         cursor.execute(
             """
-            SELECT status, COUNT(*) 
-            FROM chunks 
-            GROUP BY status
+            SELECT 'chunks', COALESCE(status, 'unknown'), embedding IS NOT NULL, COUNT(*)
+            FROM chunks
+            GROUP BY 2, 3
             """
         )
-        chunk_stats = dict(cursor.fetchall())
+        rows += cursor.fetchall()
+
+    documents: Dict[str, int] = {}
+    chunks = {"total": 0, "with_embeddings": 0, "by_status": {}}
+    for table_name, status, with_embedding, count in rows:
+        if not count:
+            continue
+        if table_name == "documents":
+            documents[status] = documents.get(status, 0) + count
+        else:
+            chunks["total"] += count
+            chunks["by_status"][status] = chunks["by_status"].get(status, 0) + count
+            if with_embedding:
+                chunks["with_embeddings"] += count
+
+    return {"documents": documents, "chunks": chunks}
+
+
+def count_drift(maintained: Dict[str, Any], exact: Dict[str, Any]) -> Dict[str, int]:
+    """Exact minus maintained count for every count that disagrees"""
+    pairs = [
+        ("chunks.total", maintained["chunks"]["total"], exact["chunks"]["total"]),
+        (
+            "chunks.with_embeddings",
+            maintained["chunks"]["with_embeddings"],
+            exact["chunks"]["with_embeddings"],
+        ),
+    ]
+    for group, counts in (
+        ("documents", lambda c: c["documents"]),
+        ("chunks.by_status", lambda c: c["chunks"]["by_status"]),
+    ):
+        for status in sorted(set(counts(maintained)) | set(counts(exact))):
+            pairs.append(
+                (f"{group}.{status}", counts(maintained).get(status, 0), counts(exact).get(status, 0))
+            )
 
-        # Get total chunks
-        cursor.execute("SELECT COUNT(*) FROM chunks")
-        total_chunks = cursor.fetchone()[0]
+    return {name: exact_count - count for name, count, exact_count in pairs if exact_count != count}
 
-        # Get chunks with embeddings
-        cursor.execute("SELECT COUNT(*) FROM chunks WHERE embedding IS NOT NULL")
-        chunks_with_embeddings = cursor.fetchone()[0]
 
-        cursor.close()
-        conn.close()
+@app.get("/stats")
+def get_stats(exact: bool = False):
+    """
+    Get indexer statistics with chunk status breakdown
 
-        return {
-            "documents": doc_stats,
-            "chunks": {
-                "total": total_chunks,
-                "with_embeddings": chunks_with_embeddings,
-                "by_status": chunk_stats,
-            },
+    Counts are read from the trigger-maintained status counters, so the
+    cost does not grow with the chunks table. exact=true recounts with full
+    table scans (for audits) and reports any drift from the counters.
+    """
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+
+            counts = count_statuses(cursor)
+            drift = None
+            if exact:
+                recounted = count_statuses(cursor, exact=True)
+                drift = count_drift(counts, recounted)
+                counts = recounted
+
+            ann_index = get_index_status(cursor)
+
+            cursor.close()
+
+        stats = {
+            **counts,
+            "embedding_cache": embedding_cache.stats(),
+            "ann_index": ann_index,
+            "vector_index": vector_index.stats(),
+            "retrieval_cache": retrieval_cache.stats(),
+            "semantic_cache": semantic_cache.stats(),
         }
+        if drift is not None:
+            # Non-zero drift means the counters need recount_status_counts()
+            stats["counter_drift"] = drift
+        return stats
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus metrics: stage latency histograms, provider/OCR/cache
+    counters and chunk/job backlog gauges (queried at scrape time)
+    """
+    try:
+        with db_connection() as conn, conn.cursor() as cursor:
+            update_backlog(cursor, count_statuses(cursor)["chunks"]["by_status"])
+    except Exception as e:
+        # Serve the in-process metrics even when the database is down
+        print(f"Could not update backlog metrics: {e}")
+
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.post("/ann-index/rebuild")
+def rebuild_ann_index(index_type: str = ANN_INDEX_TYPE, force: bool = False):
+    """
+    Rebuild the ANN index on chunks.embedding if it needs it
+
+    Args:
+        index_type: hnsw or ivfflat (default: ANN_INDEX_TYPE)
+        force: Rebuild even if the current index is fine
+
+    Returns:
+        Whether the index was rebuilt, why, and its resulting status
+    """
+    if index_type not in INDEX_TYPES:
+        raise HTTPException(status_code=400, detail=f"index_type must be one of {INDEX_TYPES}")
+
+    try:
+        return {"success": True, **rebuild_index(index_type, force)}
+    except Exception as e:
+        print(f"Error rebuilding ANN index: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/chunks/{chunk_id}")
-async def get_chunk_details(chunk_id: int):
+def get_chunk_details(chunk_id: int):
     """
     Get detailed information about a specific chunk including its embedding
 
@@ -670,31 +1766,31 @@ async def get_chunk_details(chunk_id: int):
         Chunk details with embedding vector
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute(
-            """
-            SELECT 
-                id, 
-                document_id, 
-                content, 
-                chunk_index, 
-                status,
-                embedding,
-                retry_count,
-                error_message,
-                created_at,
-                updated_at
-            FROM chunks 
-            WHERE id = %s
-            """,
-            (chunk_id,),
-        )
+            cursor.execute(
+                """
+                SELECT 
+                    id, 
+                    document_id, 
+                    content, 
+                    chunk_index, 
+                    status,
+                    embedding,
+                    retry_count,
+                    error_message,
+                    created_at,
+                    updated_at,
+                    page_number
+                FROM chunks 
+                WHERE id = %s
+                """,
+                (chunk_id,),
+            )
 
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+            result = cursor.fetchone()
+            cursor.close()
 
         if not result:
             raise HTTPException(status_code=404, detail=f"Chunk {chunk_id} not found")
@@ -711,6 +1807,7 @@ async def get_chunk_details(chunk_id: int):
             "document_id": result[1],
             "content": result[2],
             "chunk_index": result[3],
+            "page_number": result[10],
             "status": result[4],
             "embedding": {
                 "exists": result[5] is not None,
@@ -735,7 +1832,7 @@ async def get_chunk_details(chunk_id: int):
 
 
 @app.get("/chunks/{chunk_id}/embedding")
-async def get_chunk_embedding_only(chunk_id: int):
+def get_chunk_embedding_only(chunk_id: int):
     """
     Get ONLY the embedding vector for a chunk (for inspection)
 
@@ -746,14 +1843,13 @@ async def get_chunk_embedding_only(chunk_id: int):
         Raw embedding vector as array of floats
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("SELECT embedding FROM chunks WHERE id = %s", (chunk_id,))
+            cursor.execute("SELECT embedding FROM chunks WHERE id = %s", (chunk_id,))
 
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+            result = cursor.fetchone()
+            cursor.close()
 
         if not result:
             raise HTTPException(status_code=404, detail=f"Chunk {chunk_id} not found")
@@ -790,7 +1886,7 @@ async def get_chunk_embedding_only(chunk_id: int):
 
 
 @app.get("/compare-embeddings")
-async def compare_embeddings(chunk_id1: int, chunk_id2: int):
+def compare_embeddings(chunk_id1: int, chunk_id2: int):
     """
     Compare embeddings of two chunks to see their similarity
 
@@ -804,18 +1900,17 @@ async def compare_embeddings(chunk_id1: int, chunk_id2: int):
     try:
         import numpy as np
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        # Get both embeddings
-        cursor.execute(
-            "SELECT id, content, embedding FROM chunks WHERE id IN (%s, %s)",
-            (chunk_id1, chunk_id2),
-        )
+            # Get both embeddings
+            cursor.execute(
+                "SELECT id, content, embedding FROM chunks WHERE id IN (%s, %s)",
+                (chunk_id1, chunk_id2),
+            )
 
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
+            results = cursor.fetchall()
+            cursor.close()
 
         if len(results) != 2:
             raise HTTPException(status_code=404, detail="One or both chunks not found")
@@ -0,0 +1,286 @@
+"""
+Durable job queue for TutorAI ingestion
+Postgres-backed queue (jobs table) claimed with SELECT ... FOR UPDATE SKIP LOCKED
+"""
+
+from typing import Any, Dict, List, Optional
+
+from psycopg2.extras import Json, RealDictCursor
+
+# Pipeline stages, in order. Completing a stage enqueues the next one.
+JOB_STAGES = ["extract", "chunk", "embed"]
+
+NEXT_STAGE = {"extract": "chunk", "chunk": "embed", "embed": None}
+
+# Jobs whose heartbeat is older than this are considered abandoned by a crashed worker
+STALE_JOB_SECONDS = 300
+
+
+class JobLostError(Exception):
+    """
+    The worker no longer owns its job
+
+    Raised when a job was re-queued as stale (and possibly claimed by
+    another worker) while this worker was still running it. The worker must
+    roll back and drop the job: the current owner records its outcome.
+    """
+
+
+JOB_COLUMNS = """
+    id, document_id, stage, status, payload, progress, progress_total,
+    attempts, max_attempts, locked_by, heartbeat_at, run_after,
+    error_message, created_at, updated_at
+"""
+
+
+def enqueue_job(
+    cursor,
+    document_id: int,
+    stage: str,
+    payload: Optional[Dict[str, Any]] = None,
+    max_attempts: int = 3,
+) -> int:
+    """
+    Add a job to the queue (caller commits)
+
+    Args:
+        cursor: Database cursor
+        document_id: Document the job belongs to
+        stage: One of JOB_STAGES
+        payload: Stage parameters (e.g. file_path, use_vision)
+        max_attempts: Attempts before the job is marked failed
+
+    Returns:
+        New job ID
+    """
+    if stage not in JOB_STAGES:
+        raise ValueError(f"Unknown job stage: {stage}")
+
+    cursor.execute(
+        """
+        INSERT INTO jobs (document_id, stage, payload, max_attempts)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+        """,
+        (document_id, stage, Json(payload or {}), max_attempts),
+    )
+    return cursor.fetchone()[0]
+
+
+def claim_job(conn, stages: List[str], worker_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Atomically claim the oldest runnable job for the given stages
+
+    SKIP LOCKED lets any number of workers, on any number of nodes, poll
+    the same table without blocking each other or claiming the same job.
+
+    Returns:
+        The claimed job as a dict, or None if the queue is empty
+    """
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(
+            f"""
+            UPDATE jobs
+            SET status = 'running',
+                attempts = attempts + 1,
+                locked_by = %s,
+                heartbeat_at = NOW(),
+                error_message = NULL,
+                updated_at = NOW()
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE status = 'queued'
+                  AND stage = ANY(%s)
+                  AND run_after <= NOW()
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING {JOB_COLUMNS}
+            """,
+            (worker_id, stages),
+        )
+        job = cursor.fetchone()
+    conn.commit()
+    return dict(job) if job else None
+
+
+def _check_owned(cursor, job: Dict[str, Any]):
+    """Raise JobLostError if the last UPDATE matched no job held by this worker"""
+    if cursor.rowcount != 1:
+        raise JobLostError(
+            f"Job {job['id']} is no longer held by {job['locked_by']} "
+            "(re-queued after its heartbeat lapsed)"
+        )
+
+
+def heartbeat_job(cursor, job: Dict[str, Any]):
+    """
+    Record that the worker holding a job is still alive
+
+    Raises:
+        JobLostError: If the job was re-queued or claimed by another worker
+    """
+    cursor.execute(
+        """
+        UPDATE jobs SET heartbeat_at = NOW()
+        WHERE id = %s AND status = 'running' AND locked_by = %s
+        """,
+        (job["id"], job["locked_by"]),
+    )
+    _check_owned(cursor, job)
+
+
+def update_job_progress(cursor, job: Dict[str, Any], progress: int, total: Optional[int]):
+    """
+    Store progress for a running job (also counts as a heartbeat)
+
+    Raises:
+        JobLostError: If the job was re-queued or claimed by another worker
+    """
+    cursor.execute(
+        """
+        UPDATE jobs
+        SET progress = %s, progress_total = %s, heartbeat_at = NOW(), updated_at = NOW()
+        WHERE id = %s AND status = 'running' AND locked_by = %s
+        """,
+        (progress, total, job["id"], job["locked_by"]),
+    )
+    _check_owned(cursor, job)
+
+
+def complete_job(
+    cursor,
+    job: Dict[str, Any],
+    next_payload: Optional[Dict] = None,
+    next_stage: Optional[str] = None,
+):
+    """
+    Mark a job completed and enqueue the next pipeline stage (caller commits)
+
+    Doing both in one transaction means a crash can never lose the hand-off
+    between stages or enqueue the next stage twice. Only the worker that
+    holds the job can complete it, so a job re-queued as stale and claimed
+    again is never completed (and its next stage enqueued) by both workers.
+
+    Args:
+        cursor: Database cursor
+        job: The claimed job
+        next_payload: Payload for the next job (default: this job's payload)
+        next_stage: Stage to jump to instead of the usual next stage
+
+    Returns:
+        ID of the next stage's job, or None after the last stage
+
+    Raises:
+        JobLostError: If the job was re-queued or claimed by another worker
+            (the caller must roll back its stage's writes)
+    """
+    cursor.execute(
+        """
+        UPDATE jobs
+        SET status = 'completed', locked_by = NULL, updated_at = NOW()
+        WHERE id = %s AND status = 'running' AND locked_by = %s
+        """,
+        (job["id"], job["locked_by"]),
+    )
+    _check_owned(cursor, job)
+
+    next_stage = next_stage or NEXT_STAGE[job["stage"]]
+    if next_stage:
+        return enqueue_job(
+            cursor,
+            job["document_id"],
+            next_stage,
+            next_payload if next_payload is not None else job["payload"],
+            job["max_attempts"],
+        )
+    return None
+
+
+def fail_job(cursor, job: Dict[str, Any], error_msg: str, retry_delay: int = 30) -> bool:
+    """
+    Record a job failure, re-queueing it with a delay while attempts remain
+
+    Returns:
+        True if the job was re-queued, False if it is now permanently failed
+
+    Raises:
+        JobLostError: If the job was re-queued or claimed by another worker
+    """
+    retry = job["attempts"] < job["max_attempts"]
+
+    cursor.execute(
+        """
+        UPDATE jobs
+        SET status = %s,
+            error_message = %s,
+            locked_by = NULL,
+            run_after = NOW() + make_interval(secs => %s),
+            updated_at = NOW()
+        WHERE id = %s AND status = 'running' AND locked_by = %s
+        """,
+        (
+            "queued" if retry else "failed",
+            error_msg,
+            retry_delay * job["attempts"],
+            job["id"],
+            job["locked_by"],
+        ),
+    )
+    _check_owned(cursor, job)
+    return retry
+
+
+def requeue_stale_jobs(cursor, stale_seconds: int = STALE_JOB_SECONDS) -> int:
+    """
+    Return jobs abandoned by crashed workers to the queue
+
+    Running jobs without a recent heartbeat are re-queued, or marked failed
+    if they have used up their attempts. Stages are idempotent, so a job
+    that is resumed from the start produces the same result.
+
+    Returns:
+        Number of jobs recovered
+    """
+    cursor.execute(
+        """
+        UPDATE jobs
+        SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+            error_message = 'Worker stopped responding',
+            locked_by = NULL,
+            updated_at = NOW()
+        WHERE status = 'running'
+          AND heartbeat_at < NOW() - make_interval(secs => %s)
+        RETURNING id
+        """,
+        (stale_seconds,),
+    )
+    return len(cursor.fetchall())
+
+
+def get_job(cursor, job_id: int) -> Optional[Dict[str, Any]]:
+    """Fetch a single job by ID (cursor must be a RealDictCursor)"""
+    cursor.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s", (job_id,))
+    job = cursor.fetchone()
+    return dict(job) if job else None
+
+
+def list_jobs(
+    cursor,
+    document_id: Optional[int] = None,
+    status: Optional[str] = None,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    """List recent jobs, optionally filtered (cursor must be a RealDictCursor)"""
+    cursor.execute(
+        f"""
+        SELECT {JOB_COLUMNS} FROM jobs
+        WHERE (%s::int IS NULL OR document_id = %s)
+          AND (%s::text IS NULL OR status = %s)
+        ORDER BY id DESC
+        LIMIT %s
+        """,
+        (document_id, document_id, status, status, limit),
+    )
+    return [dict(row) for row in cursor.fetchall()]
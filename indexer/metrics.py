@@ -0,0 +1,190 @@
+"""
+Prometheus metrics for TutorAI indexer
+Per-stage latency histograms, provider/OCR counters and backlog gauges
+
+The API serves these at /metrics; worker processes serve their own with
+`python worker.py --metrics-port`. Observing a histogram or bumping a
+counter is a lock and an add, so instrumentation stays off the profile.
+Cache counters are not incremented here at all: CacheCollector reads the
+caches' own stats() when Prometheus scrapes.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Seconds; from a cached lookup (~1 ms) up to OCR of a dense page or a full document
+STAGE_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+)
+
+INGEST_STAGE_SECONDS = Histogram(
+    "tutorai_ingest_stage_seconds",
+    "Time spent per ingestion stage: pdf_text and ocr per page, vision per "
+    "described page, chunking per window, embedding per provider batch, "
+    "insert per chunk batch, page_store per page batch, total per /index call",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+
+RETRIEVE_STAGE_SECONDS = Histogram(
+    "tutorai_retrieve_stage_seconds",
+    "Time spent per /retrieve stage: corpus_version, embedding, search, total",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+
+JOB_SECONDS = Histogram(
+    "tutorai_job_seconds",
+    "Duration of ingestion worker jobs by outcome (completed, failed, lost)",
+    ["stage", "outcome"],
+    buckets=STAGE_BUCKETS,
+)
+
+PROVIDER_REQUESTS = Counter(
+    "tutorai_provider_requests_total",
+    "Gemini API calls by operation (embed_document, embed_query, vision) "
+    "and outcome (ok, rate_limited, error)",
+    ["operation", "outcome"],
+)
+
+PROVIDER_RETRIES = Counter(
+    "tutorai_provider_retries_total",
+    "Provider calls retried after a 429 / quota error",
+    ["operation"],
+)
+
+OCR_PAGES = Counter(
+    "tutorai_ocr_pages_total",
+    "Pages sent to Tesseract, by outcome (ok, error)",
+    ["outcome"],
+)
+
+CHUNK_BACKLOG = Gauge(
+    "tutorai_chunk_backlog",
+    "Chunks waiting for an embedding, by status (pending, failed); "
+    "refreshed on every /metrics scrape",
+    ["status"],
+)
+
+JOB_BACKLOG = Gauge(
+    "tutorai_job_backlog",
+    "Ingestion jobs by stage and status (queued, running, failed); "
+    "refreshed on every /metrics scrape",
+    ["stage", "status"],
+)
+
+
+def provider_outcome(error: Exception) -> str:
+    """Outcome label for a failed provider call"""
+    # Imported here: embedding_scheduler itself imports this module
+    try:
+        from embedding_scheduler import is_rate_limit_error
+    except ImportError:
+        from .embedding_scheduler import is_rate_limit_error
+
+    return "rate_limited" if is_rate_limit_error(error) else "error"
+
+
+def timed_provider_call(
+    operation: str, stage_histogram: Optional[Any], fn: Callable, *args, **kwargs
+):
+    """
+    Call the provider, counting the outcome and observing its latency
+
+    Args:
+        operation: PROVIDER_REQUESTS operation label
+        stage_histogram: Histogram child the call duration is observed in
+            (None when the caller times the stage itself)
+        fn: Provider call
+    """
+    started_at = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        PROVIDER_REQUESTS.labels(operation, provider_outcome(e)).inc()
+        raise
+    finally:
+        if stage_histogram is not None:
+            stage_histogram.observe(time.perf_counter() - started_at)
+    PROVIDER_REQUESTS.labels(operation, "ok").inc()
+    return result
+
+
+def update_backlog(cursor, chunk_counts: Dict[str, int]):
+    """
+    Refresh the backlog gauges
+
+    Args:
+        cursor: Database cursor, for the job counts (the jobs table stays
+            small, completed jobs are not counted)
+        chunk_counts: Chunk counts by status, from the maintained counters
+    """
+    for status in ("pending", "failed"):
+        CHUNK_BACKLOG.labels(status).set(chunk_counts.get(status, 0))
+
+    cursor.execute(
+        """
+        SELECT stage, status, COUNT(*) FROM jobs
+        WHERE status IN ('queued', 'running', 'failed')
+        GROUP BY stage, status
+        """
+    )
+    JOB_BACKLOG.clear()
+    for stage, status, count in cursor.fetchall():
+        JOB_BACKLOG.labels(stage, status).set(count)
+
+
+class CacheCollector:
+    """
+    Exports cache counters from each cache's stats() at scrape time
+
+    The caches already count hits and misses under their own locks, so the
+    lookup path does no extra work for metrics.
+    """
+
+    def __init__(self):
+        self.sources: Dict[str, Callable[[], Dict]] = {}
+        self.lock = threading.Lock()
+
+    def register(self, name: str, stats: Callable[[], Dict]):
+        with self.lock:
+            self.sources[name] = stats
+
+    def collect(self) -> Iterator:
+        lookups = CounterMetricFamily(
+            "tutorai_cache_lookups",
+            "Cache lookups by cache and result",
+            labels=["cache", "result"],
+        )
+        entries = GaugeMetricFamily(
+            "tutorai_cache_entries", "Entries held in memory per cache", labels=["cache"]
+        )
+
+        with self.lock:
+            sources = list(self.sources.items())
+
+        for name, stats in sources:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Could not read {name} cache stats: {e}")
+                continue
+            for key, value in values.items():
+                if key == "hits" or key.endswith("_hits"):
+                    lookups.add_metric([name, key[:-1]], value)
+                elif key == "misses":
+                    lookups.add_metric([name, "miss"], value)
+            held = values.get("entries", values.get("memory_entries"))
+            if held is not None:
+                entries.add_metric([name], held)
+
+        yield lookups
+        yield entries
+
+
+cache_collector = CacheCollector()
+REGISTRY.register(cache_collector)
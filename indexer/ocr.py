@@ -0,0 +1,564 @@
+"""
+OCR module for TutorAI
+Classifies PDF pages for OCR and recognizes them in parallel worker processes
+
+Kept free of FastAPI/database imports so spawned worker processes start quickly;
+pytesseract, pdf2image and PIL are imported by the functions that need them.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    from metrics import INGEST_STAGE_SECONDS, OCR_PAGES
+except ImportError:
+    from .metrics import INGEST_STAGE_SECONDS, OCR_PAGES
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+load_dotenv()
+
+# Configure Tesseract path for Windows (adjust if needed)
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", r"tesseract/tesseract.exe")
+
+OCR_LANG = "eng+ind"
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+
+# Page classification thresholds for hybrid extraction
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "50"))
+OCR_IMAGE_PAGE_CHARS = int(os.getenv("OCR_IMAGE_PAGE_CHARS", "500"))
+OCR_IMAGE_COVERAGE = float(os.getenv("OCR_IMAGE_COVERAGE", "0.5"))
+
+IDENTITY_MATRIX = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+
+# Rendered pages shared between OCR and vision, one directory per extraction run
+# (see new_page_image_key), holding one file per page and DPI
+PAGE_IMAGE_CACHE_DIR = os.getenv(
+    "PAGE_IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tutorai_page_images")
+)
+VISION_DPI = 150
+
+
+def _tesseract():
+    """pytesseract, imported and pointed at TESSERACT_CMD on first use"""
+    import pytesseract
+
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    return pytesseract
+
+
+def _init_ocr_worker():
+    """Keep each Tesseract process single-threaded; parallelism comes from the pool"""
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    _tesseract()
+
+
+def file_hash(file_path: str) -> str:
+    """SHA-256 of a file's content, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def new_page_image_key() -> str:
+    """
+    Key of a fresh page image directory for one extraction run
+
+    Unique per run rather than derived from the file, so two runs over the
+    same file (a re-upload, or /index alongside a worker) never share a
+    directory and clear_page_images cannot remove images another run is
+    still reading.
+    """
+    return uuid.uuid4().hex
+
+
+def _page_image_path(image_key: str, page_number: int, dpi: int) -> str:
+    return os.path.join(PAGE_IMAGE_CACHE_DIR, image_key, f"page-{page_number:05d}-{dpi}.jpg")
+
+
+def save_page_image(image: "Image.Image", image_key: str, page_number: int, dpi: int):
+    """Store a rendered page in the page image cache"""
+    path = _page_image_path(image_key, page_number, dpi)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    image.convert("RGB").save(tmp_path, "JPEG", quality=90)
+    os.replace(tmp_path, path)
+
+
+def downscale_image(image: "Image.Image", from_dpi: int, to_dpi: int) -> "Image.Image":
+    """Resize a page rendered at `from_dpi` to what `to_dpi` would have produced"""
+    if to_dpi >= from_dpi:
+        return image
+    if from_dpi % to_dpi == 0:
+        return image.reduce(from_dpi // to_dpi)
+    from PIL import Image
+
+    scale = to_dpi / from_dpi
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.BILINEAR)
+
+
+def load_page_image(
+    file_path: str, page_number: int, dpi: int, image_key: Optional[str] = None
+) -> "Image.Image":
+    """
+    Get a page image, from the page image cache if another stage already rendered it
+
+    Args:
+        file_path: Path to PDF file
+        page_number: 1-based page number
+        dpi: Resolution wanted
+        image_key: Page image directory to use (None renders without caching)
+
+    Returns:
+        PIL image of the page
+    """
+    from pdf2image import convert_from_path
+    from PIL import Image
+
+    if image_key:
+        path = _page_image_path(image_key, page_number, dpi)
+        if os.path.exists(path):
+            with Image.open(path) as cached:
+                return cached.convert("RGB")
+
+    images = convert_from_path(
+        file_path, dpi=dpi, first_page=page_number, last_page=page_number
+    )
+    image = images[0]
+
+    if image_key:
+        save_page_image(image, image_key, page_number, dpi)
+    return image
+
+
+def clear_page_images(image_key: str):
+    """Remove the page images of one extraction run"""
+    shutil.rmtree(os.path.join(PAGE_IMAGE_CACHE_DIR, image_key), ignore_errors=True)
+
+
+def ocr_page(
+    file_path: str,
+    page_number: int,
+    dpi: int = 300,
+    lang: str = OCR_LANG,
+    share_dpi: Optional[int] = None,
+    image_key: Optional[str] = None,
+) -> str:
+    """
+    Render a single PDF page and run Tesseract on it
+
+    Only this page is rasterized, so a worker holds one page image at a time.
+    With `share_dpi` and `image_key`, a downscaled copy of the render is put
+    in the page image cache so vision extraction does not rasterize again.
+
+    Args:
+        file_path: Path to PDF file
+        page_number: 1-based page number
+        dpi: Resolution for image conversion
+        lang: Tesseract language codes
+        share_dpi: Optional resolution to cache the page at for other stages
+        image_key: Page image directory key (see new_page_image_key)
+
+    Returns:
+        OCR-extracted text of the page
+    """
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(
+        file_path, dpi=dpi, first_page=page_number, last_page=page_number
+    )
+    if not images:
+        return ""
+
+    image = images[0]
+    text = _tesseract().image_to_string(image, lang=lang)
+
+    if share_dpi and image_key:
+        save_page_image(downscale_image(image, dpi, share_dpi), image_key, page_number, share_dpi)
+
+    return text
+
+
+def _timed_ocr_page(*args) -> Tuple[str, float]:
+    """ocr_page in a worker process, with its duration for the parent's metrics"""
+    started_at = time.perf_counter()
+    text = ocr_page(*args)
+    return text, time.perf_counter() - started_at
+
+
+def _ocr_result(future) -> str:
+    """Text of a finished _timed_ocr_page future, counted in OCR_PAGES"""
+    try:
+        text, seconds = future.result()
+    except Exception:
+        OCR_PAGES.labels("error").inc()
+        raise
+    OCR_PAGES.labels("ok").inc()
+    INGEST_STAGE_SECONDS.labels("ocr").observe(seconds)
+    return text
+
+
+def _multiply_matrix(m: List[float], n: List[float]) -> List[float]:
+    """Multiply two PDF transformation matrices [a b c d e f]"""
+    return [
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    ]
+
+
+def _image_xobject_names(page) -> set:
+    """Resource names of the image XObjects a pypdf page can draw"""
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if not xobjects:
+        return set()
+
+    return {
+        name
+        for name, xobject in xobjects.get_object().items()
+        if xobject.get_object().get("/Subtype") == "/Image"
+    }
+
+
+def _iter_xobjects(resources, seen: Optional[set] = None) -> Iterator[Tuple[str, Any]]:
+    """
+    (name, XObject) pairs reachable from a resource dictionary
+
+    Descends into Form XObjects, whose own /Resources can draw further
+    images (slide templates and grouped diagrams are often wrapped this
+    way). Each object is visited once, so shared or cyclic forms are safe.
+    """
+    if seen is None:
+        seen = set()
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if not xobjects:
+        return
+
+    for name, reference in xobjects.get_object().items():
+        object_id = (getattr(reference, "idnum", None), getattr(reference, "generation", None))
+        if object_id[0] is None:
+            object_id = ("direct", id(reference))
+        if object_id in seen:
+            continue
+        seen.add(object_id)
+
+        xobject = reference.get_object()
+        yield name, xobject
+        if xobject.get("/Subtype") == "/Form":
+            yield from _iter_xobjects(xobject.get("/Resources"), seen)
+
+
+def page_has_images(page) -> bool:
+    """
+    Whether a pypdf page has embedded images (checked without rendering)
+
+    Images drawn through Form XObjects count too.
+    """
+    try:
+        return any(
+            xobject.get("/Subtype") == "/Image"
+            for _, xobject in _iter_xobjects(page.get("/Resources"))
+        )
+    except Exception as e:
+        print(f"   Could not inspect page images: {e}")
+        return True  # Unknown, let the caller look at the page
+
+
+def page_content_key(page) -> Optional[str]:
+    """
+    Exact key of what a pypdf page draws, computed without rendering
+
+    SHA-256 over the page geometry, its content stream and the data of
+    every XObject it can reach (images and nested forms). Pages that share
+    a template but differ in a label, number or diagram get different keys;
+    the same page in a re-uploaded or duplicated file gets the same one.
+
+    Returns:
+        "sha256:<hex>", or None if the page cannot be read
+    """
+    try:
+        digest = hashlib.sha256()
+        digest.update(repr([float(x) for x in page.mediabox]).encode())
+        digest.update(str(page.get("/Rotate", 0)).encode())
+
+        contents = page.get_contents()
+        if contents is not None:
+            digest.update(contents.get_data())
+
+        for name, xobject in _iter_xobjects(page.get("/Resources")):
+            digest.update(str(name).encode())
+            digest.update(xobject.get_data())
+
+        return f"sha256:{digest.hexdigest()}"
+    except Exception as e:
+        print(f"   Could not hash page content: {e}")
+        return None
+
+
+def page_image_coverage(page) -> float:
+    """
+    Fraction of a pypdf page's area covered by drawn images
+
+    Images are found through the page's /XObject resources; their placed
+    size comes from the transformation matrix in effect at each `Do`
+    operator, so nothing is rendered. Pages without image XObjects return
+    immediately without parsing the content stream.
+
+    Args:
+        page: pypdf PageObject
+
+    Returns:
+        Coverage between 0.0 and 1.0
+    """
+    try:
+        image_names = _image_xobject_names(page)
+        if not image_names:
+            return 0.0
+
+        contents = page.get_contents()
+        page_area = float(page.mediabox.width) * float(page.mediabox.height)
+        if contents is None or page_area <= 0:
+            return 0.0
+
+        ctm = IDENTITY_MATRIX
+        stack = []
+        covered = 0.0
+
+        for operands, operator in contents.operations:
+            if operator == b"q":
+                stack.append(ctm)
+            elif operator == b"Q":
+                ctm = stack.pop() if stack else IDENTITY_MATRIX
+            elif operator == b"cm":
+                ctm = _multiply_matrix([float(x) for x in operands], ctm)
+            elif operator == b"Do" and operands and operands[0] in image_names:
+                # Images are drawn into the unit square, so the area is |det(ctm)|
+                covered += abs(ctm[0] * ctm[3] - ctm[1] * ctm[2])
+
+        return min(1.0, covered / page_area)
+
+    except Exception as e:
+        print(f"   Could not inspect page images: {e}")
+        return 0.0
+
+
+def page_needs_ocr(page, page_text: str) -> bool:
+    """
+    Decide whether a page should be OCR'd instead of using its text layer
+
+    A page needs OCR when its text layer is (almost) empty, or when it is
+    mostly covered by images and has only a little text, e.g. a scanned
+    page with a digital header.
+
+    Args:
+        page: pypdf PageObject
+        page_text: Text already extracted from the page's text layer
+
+    Returns:
+        True if the page should be sent to Tesseract
+    """
+    text_length = len(page_text.strip())
+
+    if text_length < OCR_MIN_PAGE_CHARS:
+        return True
+
+    if text_length < OCR_IMAGE_PAGE_CHARS:
+        return page_image_coverage(page) >= OCR_IMAGE_COVERAGE
+
+    return False
+
+
+def get_page_count(file_path: str) -> int:
+    """Number of pages in a PDF (read from metadata, nothing is rendered)"""
+    from pdf2image import pdfinfo_from_path
+
+    return int(pdfinfo_from_path(file_path)["Pages"])
+
+
+def iter_ocr_pages(
+    file_path: str,
+    dpi: int = 300,
+    workers: int = OCR_WORKERS,
+    pages: Optional[List[int]] = None,
+    lang: str = OCR_LANG,
+    share_dpi: Optional[int] = None,
+    image_key: Optional[str] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    OCR pages in a process pool and yield their text in page order
+
+    At most `2 * workers` pages are queued at once and only `workers` are
+    being rendered, so peak memory stays around `workers` page images no
+    matter how long the document is.
+
+    Args:
+        file_path: Path to PDF file
+        dpi: Resolution for image conversion
+        workers: Number of OCR processes
+        pages: Optional 1-based page numbers to OCR (default: all pages)
+        lang: Tesseract language codes
+        share_dpi: Optional resolution to cache rendered pages at (see ocr_page)
+        image_key: Page image directory key (see new_page_image_key)
+
+    Yields:
+        (page_number, text) tuples, in the order of `pages`
+    """
+    if pages is None:
+        pages = list(range(1, get_page_count(file_path) + 1))
+
+    if not pages:
+        return
+
+    workers = max(1, min(workers, len(pages)))
+    max_in_flight = workers * 2
+    page_iter = iter(pages)
+    in_flight = deque()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker) as executor:
+
+        def submit_next() -> bool:
+            page_number = next(page_iter, None)
+            if page_number is None:
+                return False
+            in_flight.append(
+                (
+                    page_number,
+                    executor.submit(
+                        _timed_ocr_page, file_path, page_number, dpi, lang, share_dpi, image_key
+                    ),
+                )
+            )
+            return True
+
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+
+        while in_flight:
+            page_number, future = in_flight.popleft()
+            submit_next()
+
+            try:
+                yield page_number, _ocr_result(future)
+            except Exception as e:
+                print(f"   OCR error on page {page_number}: {e}")
+                yield page_number, ""
+
+
+def iter_pages_with_ocr(
+    file_path: str,
+    pages: Iterable[Tuple[int, str, bool]],
+    dpi: int = 300,
+    workers: int = OCR_WORKERS,
+    lang: str = OCR_LANG,
+    share_dpi: Optional[int] = None,
+    image_key: Optional[str] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Merge a stream of text-layer pages with OCR of the pages that need it
+
+    Pages flagged for OCR are recognized in a process pool (started on the
+    first such page) while later pages are read ahead. At most `2 * workers`
+    pages are held at once, so memory does not grow with document length.
+    For OCR'd pages, whichever source recovered more text is kept.
+
+    Args:
+        file_path: Path to PDF file
+        pages: (page_number, text_layer_text, needs_ocr) tuples in page order
+        dpi: Resolution for image conversion
+        workers: Number of OCR processes
+        lang: Tesseract language codes
+        share_dpi: Optional resolution to cache rendered pages at (see ocr_page)
+        image_key: Page image directory key (see new_page_image_key)
+
+    Yields:
+        (page_number, text) tuples, in input order
+    """
+    max_ahead = max(1, workers) * 2
+    pending = deque()
+    executor = None
+
+    def resolve(page_number, text, future):
+        if future is None:
+            return page_number, text
+        try:
+            ocr_text = _ocr_result(future)
+        except Exception as e:
+            print(f"   OCR error on page {page_number}: {e}")
+            return page_number, text
+        return page_number, ocr_text if len(ocr_text.strip()) > len(text.strip()) else text
+
+    try:
+        for page_number, text, needs_ocr in pages:
+            future = None
+            if needs_ocr:
+                if executor is None:
+                    executor = ProcessPoolExecutor(
+                        max_workers=max(1, workers), initializer=_init_ocr_worker
+                    )
+                future = executor.submit(
+                    _timed_ocr_page, file_path, page_number, dpi, lang, share_dpi, image_key
+                )
+            pending.append((page_number, text, future))
+
+            # Hand back every page that is ready, and block once too far ahead
+            while pending and (
+                pending[0][2] is None or pending[0][2].done() or len(pending) >= max_ahead
+            ):
+                yield resolve(*pending.popleft())
+
+        while pending:
+            yield resolve(*pending.popleft())
+
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark parallel OCR throughput")
+    parser.add_argument("pdf", help="Scanned PDF to OCR")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--pages", type=int, default=None, help="Limit to first N pages")
+    args = parser.parse_args()
+
+    page_count = get_page_count(args.pdf)
+    if args.pages:
+        page_count = min(page_count, args.pages)
+    page_numbers = list(range(1, page_count + 1))
+
+    print(f"OCR benchmark: {args.pdf} ({page_count} pages, {args.dpi} DPI)")
+
+    for worker_count in args.workers:
+        started_at = time.perf_counter()
+        characters = sum(
+            len(text)
+            for _, text in iter_ocr_pages(
+                args.pdf, dpi=args.dpi, workers=worker_count, pages=page_numbers
+            )
+        )
+        elapsed = time.perf_counter() - started_at
+        print(
+            f"workers={worker_count:<3} {elapsed:8.2f}s  "
+            f"{page_count / elapsed:6.2f} pages/s  {characters} chars"
+        )
@@ -0,0 +1,128 @@
+"""
+Retrieval result cache for TutorAI
+In-process LRU of /retrieve results, invalidated by the corpus version
+"""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1000"))  # 0 disables
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "600"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a query: NFKC, case-folded, whitespace collapsed"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", query)).strip().casefold()
+
+
+class RetrievalCache:
+    """
+    LRU cache of retrieval results tagged with the corpus version
+
+    The corpus version (see get_corpus_version) moves whenever chunks are
+    inserted, deleted or (re-)embedded. Every lookup passes the version it
+    just read; when it differs from the one the cached entries were computed
+    at, the whole cache is dropped, so results never outlive the chunks they
+    came from. Entries also expire after ttl_seconds, which bounds staleness
+    if the version cannot be read.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RETRIEVAL_CACHE_SIZE,
+        ttl_seconds: float = RETRIEVAL_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.version: Optional[int] = None
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _observe(self, version: int):
+        """
+        Drop every entry if the corpus changed (lock held)
+
+        Any difference counts, not just a newer version: the version goes
+        down when corpus_state is restored from a backup or reset.
+        """
+        if version != self.version:
+            if self.entries:
+                self.entries.clear()
+                self.counters["invalidations"] += 1
+            self.version = version
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """Cached value for key at this corpus version, or None"""
+        with self.lock:
+            self._observe(version)
+
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self.entries[key]
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return value
+
+    def put(self, key: Hashable, version: int, value: Any):
+        """
+        Store a value computed at this corpus version
+
+        Only lookups move the cache to a new version. A value computed at
+        any other version than the last lookup saw (e.g. by a slow request
+        that started before the corpus changed) is discarded.
+        """
+        with self.lock:
+            if self.version is None:
+                self._observe(version)
+            if version != self.version:
+                return
+
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters since process start"""
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "corpus_version": self.version,
+            }
+
+
+retrieval_cache = RetrievalCache()
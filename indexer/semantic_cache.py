@@ -0,0 +1,165 @@
+"""
+Semantic query cache for TutorAI
+Reuses retrieval results for paraphrased queries by query-embedding similarity
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    from chunker_embedder import EMBEDDING_DIMENSION
+except ImportError:
+    from .chunker_embedder import EMBEDDING_DIMENSION
+
+load_dotenv()
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+# Cosine similarity a new query needs to a cached one to reuse its results
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "600"))
+
+
+class SemanticCache:
+    """
+    Fixed-capacity matrix of recent query embeddings and their results
+
+    A lookup is one matrix-vector product over the cached unit vectors,
+    restricted to entries computed with the same parameters (top_k,
+    document filter, mode, ...). The closest entry is returned if its
+    cosine similarity reaches the threshold. When full, the least recently
+    used slot is overwritten; like RetrievalCache, everything is dropped
+    when the corpus version moves.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = SEMANTIC_CACHE_SIZE,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+        dimension: int = EMBEDDING_DIMENSION,
+    ):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.dimension = dimension
+
+        self.lock = threading.Lock()
+        self.version: Optional[int] = None
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "saved_seconds": 0.0,
+        }
+        self._reset()
+
+    def _reset(self):
+        capacity = max(self.max_entries, 0)
+        self.matrix = np.zeros((capacity, self.dimension), dtype=np.float32)
+        self.stored_at = np.full(capacity, -np.inf)
+        self.last_used = np.full(capacity, -np.inf)
+        self.keys: List[Optional[Hashable]] = [None] * capacity
+        # (original query, results, seconds it took to compute them)
+        self.values: List[Optional[Tuple[str, Any, float]]] = [None] * capacity
+
+    @property
+    def enabled(self) -> bool:
+        return SEMANTIC_CACHE_ENABLED and self.max_entries > 0
+
+    def _observe(self, version: int):
+        """Drop every entry if the corpus version changed, up or down (lock held)"""
+        if version != self.version:
+            if any(key is not None for key in self.keys):
+                self._reset()
+                self.counters["invalidations"] += 1
+            self.version = version
+
+    def _unit(self, embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(
+        self, key: Hashable, embedding: Sequence[float], version: int
+    ) -> Optional[Tuple[str, Any, float]]:
+        """
+        Closest cached entry for these parameters, if similar enough
+
+        Returns:
+            (cached query, results, similarity) or None
+        """
+        with self.lock:
+            self._observe(version)
+
+            now = time.monotonic()
+            live = np.array(
+                [entry_key == key for entry_key in self.keys], dtype=bool
+            ) & (now - self.stored_at <= self.ttl_seconds)
+            slots = np.flatnonzero(live)
+            if not len(slots):
+                self.counters["misses"] += 1
+                return None
+
+            scores = self.matrix[slots] @ self._unit(embedding)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.counters["misses"] += 1
+                return None
+
+            slot = slots[best]
+            query, results, compute_seconds = self.values[slot]
+            self.last_used[slot] = now
+            self.counters["hits"] += 1
+            self.counters["saved_seconds"] += compute_seconds
+            return query, results, float(scores[best])
+
+    def put(
+        self,
+        key: Hashable,
+        embedding: Sequence[float],
+        version: int,
+        query: str,
+        results: Any,
+        compute_seconds: float,
+    ):
+        """Cache results computed at the corpus version the last lookup saw"""
+        with self.lock:
+            if self.version is None:
+                self._observe(version)
+            if version != self.version or not len(self.keys):
+                return
+
+            # Empty and expired slots have the oldest last_used, so this
+            # fills the cache first and then evicts least recently used
+            now = time.monotonic()
+            expired = now - self.stored_at > self.ttl_seconds
+            slot = int(np.argmin(np.where(expired, -np.inf, self.last_used)))
+
+            self.matrix[slot] = self._unit(embedding)
+            self.stored_at[slot] = now
+            self.last_used[slot] = now
+            self.keys[slot] = key
+            self.values[slot] = (query, results, compute_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and saved retrieval time since process start"""
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                "enabled": self.enabled,
+                **self.counters,
+                "saved_seconds": round(self.counters["saved_seconds"], 3),
+                "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": sum(key is not None for key in self.keys),
+                "threshold": self.threshold,
+                "corpus_version": self.version,
+            }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,14 @@
+"""
+Shared pytest setup for the indexer tests
+
+The indexer modules import each other as top-level modules (the way
+uvicorn and worker.py load them), so the indexer directory goes on sys.path.
+"""
+
+import os
+import sys
+
+INDEXER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if INDEXER_DIR not in sys.path:
+    sys.path.insert(0, INDEXER_DIR)
@@ -0,0 +1,85 @@
+"""
+Minimal PDF writer for tests
+
+Each page's drawing is spelled out, so tests know exactly which text and
+images a page has without shipping binary fixtures.
+"""
+
+FONT = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+TEMPLATE_IMAGE = bytes(range(64))
+
+
+def stream(dictionary: bytes, data: bytes) -> bytes:
+    return b"<< %s /Length %d >>\nstream\n%s\nendstream" % (dictionary, len(data), data)
+
+
+def image_object(data: bytes = TEMPLATE_IMAGE) -> bytes:
+    return stream(
+        b"/Type /XObject /Subtype /Image /Width 8 /Height 8 "
+        b"/ColorSpace /DeviceGray /BitsPerComponent 8",
+        data,
+    )
+
+
+def text(label: str) -> bytes:
+    return b"BT /F1 24 Tf 72 700 Td (%s) Tj ET" % label.encode()
+
+
+def write_pdf(path, pages):
+    """
+    Write a PDF from page specs
+
+    Each page is (content_stream, xobjects) where xobjects maps a resource
+    name to an object body; bodies that are themselves (body, xobjects)
+    tuples become Form XObjects with their own resources.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, FONT]
+
+    def add(body) -> int:
+        objects.append(body)
+        return len(objects)
+
+    def resources(xobjects) -> bytes:
+        entries = []
+        for name, body in xobjects.items():
+            if isinstance(body, tuple):
+                form_content, form_xobjects = body
+                body = stream(
+                    b"/Type /XObject /Subtype /Form /BBox [0 0 612 792] /Resources %s"
+                    % resources(form_xobjects),
+                    form_content,
+                )
+            entries.append(b"/%s %d 0 R" % (name.encode(), add(body)))
+        return b"<< /Font << /F1 3 0 R >> /XObject << %s >> >>" % b" ".join(entries)
+
+    page_ids = []
+    for content, xobjects in pages:
+        content_id = add(stream(b"", content))
+        page_ids.append(
+            add(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                b"/Resources %s /Contents %d 0 R >>" % (resources(xobjects), content_id)
+            )
+        )
+    objects[1] = b"<< /Type /Pages /Count %d /Kids [%s] >>" % (
+        len(page_ids),
+        b" ".join(b"%d 0 R" % i for i in page_ids),
+    )
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref_at = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, xref_at)
+        )
+
+
+DRAW_IMAGE = b"q 200 0 0 200 100 300 cm /Im1 Do Q "
@@ -0,0 +1,101 @@
+"""
+Coarse index status checks and the embedding column type
+"""
+
+import asyncio
+
+import pytest
+
+import ann_index
+from ann_index import _parse_coarse_indexdef, coarse_rebuild_reason
+
+VECTOR_INDEXDEF = (
+    "CREATE INDEX idx_chunks_embedding_coarse ON public.chunks USING hnsw "
+    "(((subvector(embedding, 1, 256))::vector(256)) vector_cosine_ops) "
+    "WITH (m='16', ef_construction='64')"
+)
+HALFVEC_INDEXDEF = VECTOR_INDEXDEF.replace("vector(256)", "halfvec(256)").replace(
+    "vector_cosine_ops", "halfvec_cosine_ops"
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_column_type():
+    yield
+    ann_index.reset_embedding_column_type()
+
+
+def coarse_status(indexdef, column_type):
+    dimension, index_type = _parse_coarse_indexdef(indexdef)
+    return {
+        "column_type": column_type,
+        "coarse_dimension": dimension,
+        "coarse_type": index_type,
+        "coarse_valid": True,
+    }
+
+
+def test_parse_coarse_indexdef():
+    assert _parse_coarse_indexdef(VECTOR_INDEXDEF) == (256, "vector")
+    assert _parse_coarse_indexdef(HALFVEC_INDEXDEF) == (256, "halfvec")
+
+
+def test_coarse_index_matching_the_column_is_kept():
+    assert coarse_rebuild_reason(coarse_status(VECTOR_INDEXDEF, "vector(768)"), 256) is None
+    assert coarse_rebuild_reason(coarse_status(HALFVEC_INDEXDEF, "halfvec(768)"), 256) is None
+
+
+def test_vector_coarse_index_on_halfvec_column_is_rebuilt():
+    status = coarse_status(VECTOR_INDEXDEF, "halfvec(768)")
+
+    assert coarse_rebuild_reason(status, 256) == "type vector -> halfvec"
+
+
+def test_dimension_change_is_rebuilt():
+    status = coarse_status(VECTOR_INDEXDEF, "vector(768)")
+
+    assert coarse_rebuild_reason(status, 128) == "dimension 256 -> 128"
+    assert coarse_rebuild_reason(status, 0) is None
+
+
+class ColumnTypeConnection:
+    def __init__(self, column_type):
+        self.column_type = column_type
+        self.reads = 0
+
+    async def fetchval(self, query):
+        self.reads += 1
+        return self.column_type
+
+
+def test_embedding_column_type_is_re_read(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(ann_index.time, "monotonic", lambda: clock[0])
+    ann_index.reset_embedding_column_type()
+    conn = ColumnTypeConnection("vector(768)")
+
+    assert asyncio.run(ann_index._get_embedding_column_type(conn)) == "vector(768)"
+    conn.column_type = "halfvec(768)"
+    assert asyncio.run(ann_index._get_embedding_column_type(conn)) == "vector(768)"
+    assert conn.reads == 1
+
+    # After the TTL, or straight after a rebuild in this process
+    clock[0] += ann_index.COLUMN_TYPE_TTL_SECONDS + 1
+    assert asyncio.run(ann_index._get_embedding_column_type(conn)) == "halfvec(768)"
+
+    conn.column_type = "vector(768)"
+    ann_index.reset_embedding_column_type()
+    assert asyncio.run(ann_index._get_embedding_column_type(conn)) == "vector(768)"
+    assert conn.reads == 3
+
+
+def test_embedding_dimension_must_match_the_column():
+    assert ann_index.embedding_dimension_mismatch("vector(768)", 768) is None
+    assert ann_index.embedding_dimension_mismatch("halfvec(1536)", 1536) is None
+    # No typmod: any dimension fits
+    assert ann_index.embedding_dimension_mismatch("vector", 1536) is None
+
+    reason = ann_index.embedding_dimension_mismatch("halfvec(768)", 1536)
+
+    assert "halfvec(768)" in reason
+    assert "1536" in reason
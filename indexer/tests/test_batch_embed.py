@@ -0,0 +1,91 @@
+"""
+Batched document embedding against a stub embedder
+
+Counts embed_content round trips: embedding N chunks must cost
+ceil(N / MAX_EMBED_BATCH_SIZE) requests, not N.
+"""
+
+import math
+
+import pytest
+
+import chunker_embedder
+from embedding_cache import EmbeddingCache
+
+
+class StubGenai:
+    """Stands in for google.generativeai; records every embed_content call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_content(self, model, content, task_type, output_dimensionality):
+        self.calls.append(content)
+        texts = content if isinstance(content, list) else [content]
+        embeddings = [
+            [float(len(text))] + [0.0] * (output_dimensionality - 1) for text in texts
+        ]
+        return {"embedding": embeddings if isinstance(content, list) else embeddings[0]}
+
+
+@pytest.fixture
+def stub_genai(monkeypatch):
+    stub = StubGenai()
+    monkeypatch.setattr(chunker_embedder, "get_genai", lambda: stub)
+    # Memory-only cache, empty for every test
+    monkeypatch.setattr(chunker_embedder, "embedding_cache", EmbeddingCache())
+    return stub
+
+
+def chunk_texts(count):
+    return [f"chunk {i} " + "x" * (i % 17) for i in range(count)]
+
+
+def test_round_trips_drop_by_batch_size(stub_genai):
+    texts = chunk_texts(1000)
+
+    per_chunk_calls = len(texts)  # What embedding one chunk per request cost
+    embeddings = chunker_embedder.embed_batches(texts)
+
+    assert len(embeddings) == len(texts)
+    assert len(stub_genai.calls) == math.ceil(len(texts) / chunker_embedder.MAX_EMBED_BATCH_SIZE)
+    assert per_chunk_calls / len(stub_genai.calls) == 100
+    assert all(isinstance(call, list) for call in stub_genai.calls)
+    assert max(len(call) for call in stub_genai.calls) == chunker_embedder.MAX_EMBED_BATCH_SIZE
+
+
+def test_embeddings_keep_input_order(stub_genai):
+    texts = chunk_texts(250)
+
+    embeddings = chunker_embedder.embed_batches(texts, batch_size=64)
+
+    assert len(stub_genai.calls) == 4
+    assert [embedding[0] for embedding in embeddings] == [float(len(text)) for text in texts]
+    assert all(len(e) == chunker_embedder.EMBEDDING_DIMENSION for e in embeddings)
+
+
+def test_batch_size_is_capped_at_api_limit(stub_genai):
+    chunker_embedder.embed_batches(chunk_texts(300), batch_size=1000)
+
+    assert [len(call) for call in stub_genai.calls] == [100, 100, 100]
+
+
+def test_repeated_and_cached_texts_are_not_resent(stub_genai):
+    texts = chunk_texts(150)
+
+    chunker_embedder.embed_batches(texts + texts)
+    assert sum(len(call) for call in stub_genai.calls) == 150
+
+    stub_genai.calls.clear()
+    chunker_embedder.embed_batches(texts)
+    assert stub_genai.calls == []
+
+
+def test_short_batch_response_raises(stub_genai, monkeypatch):
+    def truncated(model, content, task_type, output_dimensionality):
+        return {"embedding": [[0.0] * output_dimensionality] * (len(content) - 1)}
+
+    monkeypatch.setattr(stub_genai, "embed_content", truncated)
+
+    with pytest.raises(ValueError, match="Expected 10 embeddings"):
+        chunker_embedder.embed_batches(chunk_texts(10))
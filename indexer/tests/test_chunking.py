@@ -0,0 +1,167 @@
+"""
+Text splitters and streaming chunking
+
+The splitters are checked for exact offsets, bounded overlap and chunk
+size; the semantic method runs on a regex sentence tokenizer standing in
+for punkt, which need not be installed. chunk_pages is compared with
+chunk_text on the whole document.
+"""
+
+import bisect
+import random
+import re
+
+import pytest
+
+import chunker_embedder
+from chunker_embedder import chunk_pages, chunk_text, clean_text
+
+WORDS = (
+    "fotosintesis adalah proses tumbuhan membuat makanan dari cahaya matahari "
+    "air dan karbon dioksida klorofil daun menyerap energi"
+).split()
+
+
+def make_pages(seed, count=25):
+    """Pages of sentences that run on across page boundaries, some pages empty"""
+    rng = random.Random(seed)
+    pages = []
+    for page_number in range(1, count + 1):
+        sentences = []
+        for _ in range(rng.choice([0, 3, 10, 30])):
+            words = rng.choices(WORDS, k=rng.choice([4, 12, 30, 90]))
+            sentences.append(" ".join(words).capitalize() + rng.choice(".....!?;,"))
+        # Drop the end of the last sentence: it continues on the next page
+        text = " ".join(sentences)
+        pages.append((page_number, text[: len(text) - rng.randrange(0, 40)]))
+    return pages
+
+
+class RegexSentences:
+    """Sentence spans ending at . ! or ?, like PunktTokenizer.span_tokenize"""
+
+    def span_tokenize(self, text):
+        for match in re.finditer(r"\S[^.!?]*(?:[.!?]+|$)", text):
+            yield match.span()
+
+
+@pytest.fixture
+def punkt(monkeypatch):
+    """Semantic splits use RegexSentences"""
+    monkeypatch.setattr(chunker_embedder, "_sentence_tokenizer", lambda: RegexSentences())
+
+
+@pytest.fixture
+def no_punkt(monkeypatch):
+    """punkt is neither installed nor downloadable; counts download attempts"""
+    downloads = []
+
+    def missing(language):
+        raise LookupError(f"punkt_tab/{language} not found")
+
+    monkeypatch.setattr("nltk.tokenize.punkt.PunktTokenizer", missing)
+    monkeypatch.setattr("nltk.download", lambda *args, **kwargs: downloads.append(args))
+    monkeypatch.setattr(chunker_embedder, "NLTK_AUTO_DOWNLOAD", True)
+    monkeypatch.setattr(chunker_embedder, "_punkt_unavailable", {})
+    chunker_embedder._sentence_tokenizer.cache_clear()
+    yield downloads
+    chunker_embedder._sentence_tokenizer.cache_clear()
+
+
+def document(seed=0):
+    return " ".join(text for _, text in make_pages(seed))
+
+
+@pytest.mark.parametrize("method", ["semantic", "recursive", "simple"])
+def test_spans_index_the_cleaned_text(punkt, method):
+    text = document()
+    cleaned = clean_text(text)
+
+    chunks = chunk_text(text, chunk_size=300, overlap=60, method=method)
+
+    assert len(chunks) > 10
+    for chunk in chunks:
+        assert chunk["content"] == cleaned[chunk["start_char"] : chunk["end_char"]]
+        assert chunk["content"] == chunk["content"].strip()
+    assert [chunk["chunk_index"] for chunk in chunks] == list(range(len(chunks)))
+
+
+@pytest.mark.parametrize("method", ["semantic", "recursive", "simple"])
+@pytest.mark.parametrize("overlap", [0, 60])
+def test_overlap_stays_within_chunk_overlap(punkt, method, overlap):
+    chunks = chunk_text(document(), chunk_size=300, overlap=overlap, method=method)
+
+    overlaps = [
+        previous["end_char"] - chunk["start_char"] for previous, chunk in zip(chunks, chunks[1:])
+    ]
+    assert max(overlaps) <= overlap
+    # Chunks move forward and together cover the text
+    assert all(b["start_char"] > a["start_char"] for a, b in zip(chunks, chunks[1:]))
+    assert all(gap >= -1 for gap in overlaps)
+
+
+@pytest.mark.parametrize("method", ["semantic", "recursive"])
+def test_chunks_stay_within_chunk_size(punkt, method):
+    # Includes sentences of 90 words, longer than a chunk
+    chunks = chunk_text(document(seed=1), chunk_size=200, overlap=40, method=method)
+
+    assert max(len(chunk["content"]) for chunk in chunks) <= 200
+
+
+def test_token_limit(punkt):
+    chunks = chunk_text(document(), chunk_size=1000, overlap=0, method="recursive", max_tokens=25)
+
+    assert max(chunker_embedder.count_tokens(chunk["content"]) for chunk in chunks) <= 25
+
+
+def test_missing_punkt_falls_back_to_recursive(no_punkt):
+    text = document()
+
+    first = chunk_text(text, chunk_size=300, overlap=60, method="semantic")
+    second = chunk_text(text, chunk_size=300, overlap=60, method="semantic")
+
+    assert first == second == chunk_text(text, chunk_size=300, overlap=60, method="recursive")
+    # The failed download is not retried on every split
+    assert len(no_punkt) == 1
+
+
+def without_pages(chunks):
+    return [{k: v for k, v in chunk.items() if k != "page_number"} for chunk in chunks]
+
+
+@pytest.mark.parametrize("method", ["recursive", "simple"])
+@pytest.mark.parametrize("window_chunks", [2, 8])
+@pytest.mark.parametrize("max_tokens", [None, 40])
+@pytest.mark.parametrize("seed", range(3))
+def test_chunk_pages_matches_chunk_text(method, window_chunks, max_tokens, seed):
+    pages = make_pages(seed)
+    options = dict(chunk_size=300, overlap=60, method=method, max_tokens=max_tokens)
+
+    streamed = list(chunk_pages(pages, window_chunks=window_chunks, **options))
+    whole = chunk_text(" ".join(text for _, text in pages), **options)
+
+    assert without_pages(streamed) == whole
+
+
+def test_chunks_are_attributed_to_the_page_they_start_on():
+    pages = make_pages(seed=7)
+    # Offsets of each non-empty page in the cleaned document text
+    starts, numbers, offset = [], [], 0
+    for page_number, text in pages:
+        cleaned = clean_text(text)
+        if cleaned:
+            starts.append(offset)
+            numbers.append(page_number)
+            offset += len(cleaned) + 1
+
+    chunks = list(chunk_pages(pages, chunk_size=300, overlap=60, method="recursive"))
+
+    def page_at(offset):
+        return numbers[bisect.bisect_right(starts, offset) - 1]
+
+    assert [chunk["page_number"] for chunk in chunks] == [
+        page_at(chunk["start_char"]) for chunk in chunks
+    ]
+    # Some chunks run across a page boundary
+    assert any(page_at(chunk["end_char"] - 1) != chunk["page_number"] for chunk in chunks)
+    assert {chunk["page_number"] for chunk in chunks} == set(numbers)
@@ -0,0 +1,41 @@
+"""
+Corpus version read from corpus_state plus pending corpus_changes rows
+"""
+
+import asyncio
+
+import db
+
+
+class CorpusConnection:
+    """corpus_state and corpus_changes as two numbers"""
+
+    def __init__(self, version, pending):
+        self.version = version
+        self.pending = pending
+        self.executed = []
+
+    async def fetchrow(self, query):
+        return {"version": self.version, "pending": self.pending}
+
+    async def execute(self, query):
+        self.executed.append(query)
+        if "compact_corpus_version" in query:
+            self.version += self.pending
+            self.pending = 0
+
+
+def test_version_counts_uncompacted_changes():
+    conn = CorpusConnection(version=40, pending=2)
+
+    assert asyncio.run(db.get_corpus_version(conn)) == 42
+    assert conn.executed == []
+
+
+def test_compaction_keeps_the_version():
+    pending = db.CORPUS_VERSION_COMPACT_ROWS + 1
+    conn = CorpusConnection(version=40, pending=pending)
+
+    assert asyncio.run(db.get_corpus_version(conn)) == 40 + pending
+    assert conn.executed == ["SELECT compact_corpus_version()"]
+    assert asyncio.run(db.get_corpus_version(conn)) == 40 + pending
@@ -0,0 +1,77 @@
+"""
+Embedding cache tiers and store failure handling
+
+The Postgres tier is exercised through db_connection failures only; no
+database is needed.
+"""
+
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+from psycopg2.pool import PoolError
+
+import embedding_cache
+from embedding_cache import EmbeddingCache
+
+KEY = ("model", "retrieval_query", 768)
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Make every pooled connection attempt fail with the error in failures[0]"""
+    attempts = []
+    failures = [psycopg2.OperationalError("connection refused")]
+
+    @contextmanager
+    def failing_connection(timeout=None):
+        attempts.append(timeout)
+        raise failures[0]
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(embedding_cache, "db_connection", failing_connection)
+    return attempts, failures
+
+
+def test_memory_tier_is_an_lru():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put_many(*KEY, ["a", "b"], [[1.0], [2.0]])
+    cache.get_many(*KEY, ["a"])
+    cache.put_many(*KEY, ["c"], [[3.0]])
+
+    assert cache.get_many(*KEY, ["a", "b", "c"]) == [[1.0], None, [3.0]]
+    assert cache.stats()["memory_hits"] == 3
+    assert cache.stats()["misses"] == 1
+
+
+def test_store_failure_backs_off_instead_of_disabling(connections, monkeypatch):
+    attempts, _ = connections
+    clock = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: clock[0])
+    cache = EmbeddingCache(use_store=True)
+
+    assert cache.get_many(*KEY, ["q"]) == [None]
+    assert len(attempts) == 1
+    assert cache.stats()["store_backing_off"]
+
+    # Within the backoff window the store is not touched
+    cache.get_many(*KEY, ["q"])
+    assert len(attempts) == 1
+
+    # Afterwards it is tried again, and stays enabled
+    clock[0] += embedding_cache.STORE_RETRY_MAX_SECONDS
+    cache.get_many(*KEY, ["q"])
+    assert len(attempts) == 2
+    assert cache.stats()["store_enabled"]
+
+
+def test_saturated_pool_is_a_miss_without_backoff(connections):
+    attempts, failures = connections
+    failures[0] = PoolError("No pooled connection free within 0.5s")
+    cache = EmbeddingCache(use_store=True, pool_timeout=0.5)
+
+    cache.get_many(*KEY, ["q"])
+    cache.get_many(*KEY, ["q"])
+
+    assert attempts == [0.5, 0.5]
+    assert not cache.stats()["store_backing_off"]
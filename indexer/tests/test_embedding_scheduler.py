@@ -0,0 +1,186 @@
+"""
+Embedding scheduler against a local fake throttling API
+
+The fake provider enforces its own tokens-per-second quota over a sliding
+window and answers 429 when a request would exceed it, like Gemini does.
+"""
+
+import threading
+import time
+from collections import deque
+
+import pytest
+
+import embedding_scheduler
+from embedding_scheduler import (
+    EmbeddingScheduler,
+    RateLimiter,
+    TokenBucket,
+    estimate_tokens,
+)
+
+# Test-sized quota: 4000 tokens/s with a 500 token burst
+TOKENS_PER_SECOND = 4000
+BURST_SECONDS = 0.125
+
+# 100 estimated tokens per text, 10 texts per batch: every batch is twice
+# the bucket's capacity
+TEXT = "x" * 396
+BATCH_TEXTS = 10
+BATCH_TOKENS = BATCH_TEXTS * estimate_tokens(TEXT)
+
+
+class RateLimitError(Exception):
+    code = 429
+
+
+class FakeThrottlingAPI:
+    """Embeds anything, but rejects requests beyond its token quota with a 429"""
+
+    def __init__(self, tokens_per_second, window=1.0, slack_tokens=0, fail_first=0):
+        self.limit = tokens_per_second * window + slack_tokens
+        self.window = window
+        self.fail_first = fail_first
+        self.sent = deque()
+        self.accepted_tokens = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def embed(self, texts):
+        tokens = sum(estimate_tokens(text) for text in texts)
+        now = time.monotonic()
+        with self.lock:
+            while self.sent and self.sent[0][0] <= now - self.window:
+                self.sent.popleft()
+            in_window = sum(sent_tokens for _, sent_tokens in self.sent)
+
+            if self.fail_first > 0 or in_window + tokens > self.limit:
+                self.fail_first = max(0, self.fail_first - 1)
+                self.rejected += 1
+                raise RateLimitError("429 Resource has been exhausted (e.g. check quota).")
+
+            self.sent.append((now, tokens))
+            self.accepted_tokens += tokens
+        return [[0.0] for _ in texts]
+
+
+def make_limiter(rpm=600000):
+    return RateLimiter(rpm=rpm, tpm=TOKENS_PER_SECOND * 60, burst_seconds=BURST_SECONDS)
+
+
+def make_batches(count, prefix=""):
+    return [
+        ([f"{prefix}{i}-{j}" for j in range(BATCH_TEXTS)], [TEXT] * BATCH_TEXTS)
+        for i in range(count)
+    ]
+
+
+def run_scheduler(scheduler, batches):
+    succeeded, failed = [], []
+    stats = scheduler.run(
+        batches,
+        on_success=lambda keys, embeddings: succeeded.extend(keys),
+        on_failure=lambda keys, error: failed.extend(keys),
+    )
+    return stats, succeeded, failed
+
+
+def minimum_seconds(total_tokens):
+    """
+    Shortest time a limiter honouring the quota can take to send total_tokens
+
+    Everything but the last batch has to be paid for at the refill rate; the
+    last one goes out on a full bucket and leaves its excess as debt.
+    """
+    return (total_tokens - BATCH_TOKENS) / TOKENS_PER_SECOND
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_sleep(monkeypatch):
+    monkeypatch.setattr(embedding_scheduler, "backoff_delay", lambda attempt: 0.0)
+
+
+def test_oversized_acquire_is_charged_in_full():
+    bucket = TokenBucket(rate_per_minute=6000, burst_seconds=0.1)  # 100/s, capacity 10
+
+    assert bucket.acquire(50) == 0.0
+    waited = bucket.acquire(50)
+
+    # The first request left 40 tokens of debt; the second waits for it and
+    # for its own (capped) 10 tokens
+    assert waited == pytest.approx(0.5, abs=0.05)
+
+
+def test_scheduler_stays_within_token_quota():
+    api = FakeThrottlingAPI(TOKENS_PER_SECOND, slack_tokens=BATCH_TOKENS)
+    scheduler = EmbeddingScheduler(api.embed, concurrency=4, rate_limiter=make_limiter())
+    batches = make_batches(8)
+
+    started_at = time.monotonic()
+    stats, succeeded, failed = run_scheduler(scheduler, batches)
+    elapsed = time.monotonic() - started_at
+
+    assert failed == []
+    assert len(succeeded) == 8 * BATCH_TEXTS
+    assert api.rejected == 0
+    assert stats["rate_limited"] == 0
+    assert elapsed >= minimum_seconds(api.accepted_tokens) * 0.98
+
+
+def test_concurrent_schedulers_share_one_quota(monkeypatch):
+    monkeypatch.setattr(embedding_scheduler, "embedding_rate_limiter", make_limiter())
+    api = FakeThrottlingAPI(TOKENS_PER_SECOND, slack_tokens=BATCH_TOKENS)
+
+    # Two /embed calls (or an /embed call and a worker job) at once
+    schedulers = [EmbeddingScheduler(api.embed, concurrency=4) for _ in range(2)]
+    assert schedulers[0].rate_limiter is schedulers[1].rate_limiter
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda s=scheduler, p=prefix: results.append(
+                run_scheduler(s, make_batches(4, p))
+            )
+        )
+        for prefix, scheduler in zip("ab", schedulers)
+    ]
+
+    started_at = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started_at
+
+    assert all(failed == [] for _, _, failed in results)
+    assert api.rejected == 0
+    assert api.accepted_tokens == 8 * BATCH_TOKENS
+    assert elapsed >= minimum_seconds(api.accepted_tokens) * 0.98
+
+
+def test_rate_limited_batches_are_retried_and_slow_the_limiter():
+    api = FakeThrottlingAPI(TOKENS_PER_SECOND, slack_tokens=BATCH_TOKENS, fail_first=2)
+    limiter = make_limiter()
+    scheduler = EmbeddingScheduler(api.embed, concurrency=1, rate_limiter=limiter)
+
+    stats, succeeded, failed = run_scheduler(scheduler, make_batches(1))
+
+    assert failed == []
+    assert len(succeeded) == BATCH_TEXTS
+    assert stats["rate_limited"] == 2
+    assert stats["requests"] == 3
+    assert limiter.tokens.rate < limiter.tokens.max_rate
+
+
+def test_batch_fails_after_max_rate_limit_retries():
+    api = FakeThrottlingAPI(TOKENS_PER_SECOND, fail_first=100)
+    scheduler = EmbeddingScheduler(
+        api.embed, concurrency=1, rate_limiter=make_limiter(), max_rate_limit_retries=2
+    )
+
+    stats, succeeded, failed = run_scheduler(scheduler, make_batches(1))
+
+    assert succeeded == []
+    assert len(failed) == BATCH_TEXTS
+    assert stats["requests"] == 3
+    assert api.accepted_tokens == 0
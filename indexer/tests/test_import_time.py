@@ -0,0 +1,23 @@
+"""
+Import-time budget of the service, as `benchmark.py import-time` measures it
+
+Runs `python -X importtime -c "import indexer_rag"` in a fresh interpreter
+with GEMINI_API_KEY and DATABASE_URL blanked.
+"""
+
+from benchmark import IMPORT_BUDGET_MS, LAZY_MODULES, measure_import
+
+
+def test_indexer_rag_imports_within_budget():
+    # Best of 3, like the benchmark, so one slow run on a busy machine is ignored
+    result = measure_import("indexer_rag", repeat=3)
+
+    assert "error" not in result, result.get("error")
+    assert result["cumulative_ms"] <= IMPORT_BUDGET_MS, result["slowest"]
+
+
+def test_heavy_modules_stay_lazy():
+    result = measure_import("indexer_rag")
+
+    assert "error" not in result, result.get("error")
+    assert result["eager_lazy_modules"] == [], f"imported at startup, expected lazy: {LAZY_MODULES}"
@@ -0,0 +1,131 @@
+"""
+Per-page OCR decisions and the OCR process pool
+
+Pages are synthetic PDFs (see pdf_builder): text only, full-page scans,
+scans with a digital header, and text pages with a small figure. The pool
+tests swap Tesseract for a stub, so neither tesseract nor poppler is needed.
+"""
+
+import time
+
+import pytest
+
+import ocr
+from ocr import iter_ocr_pages, iter_pages_with_ocr, page_image_coverage, page_needs_ocr
+from pdf_builder import image_object, text, write_pdf
+
+pypdf = pytest.importorskip("pypdf")
+
+LETTER = b"612 0 0 792 0 0 cm"  # Scale the unit square to the whole page
+
+BODY = "Fotosintesis adalah proses tumbuhan membuat makanan. " * 12
+HEADER = "Scanned by the library, chapter 3 of the course notes"
+
+PAGES = {
+    "text_only": (text(BODY), {}),
+    "scanned": (b"q " + LETTER + b" /Im1 Do Q", {"Im1": image_object()}),
+    "scan_with_header": (
+        b"q " + LETTER + b" /Im1 Do Q " + text(HEADER),
+        {"Im1": image_object()},
+    ),
+    "text_with_figure": (
+        b"q 150 0 0 150 72 72 cm /Im1 Do Q " + text(BODY),
+        {"Im1": image_object()},
+    ),
+    "short_text_small_figure": (
+        b"q 150 0 0 150 72 72 cm /Im1 Do Q " + text(HEADER),
+        {"Im1": image_object()},
+    ),
+    "quarter_page_twice": (
+        b"q 306 0 0 396 0 0 cm /Im1 Do Q q 1 0 0 1 306 396 cm q 306 0 0 396 0 0 cm /Im1 Do Q Q",
+        {"Im1": image_object()},
+    ),
+}
+
+
+@pytest.fixture(scope="module")
+def pages(tmp_path_factory):
+    path = tmp_path_factory.mktemp("ocr") / "pages.pdf"
+    write_pdf(path, list(PAGES.values()))
+    reader = pypdf.PdfReader(str(path))
+    return {
+        name: (page, page.extract_text()) for name, page in zip(PAGES, reader.pages)
+    }
+
+
+def test_image_coverage(pages):
+    assert page_image_coverage(pages["text_only"][0]) == 0.0
+    assert page_image_coverage(pages["scanned"][0]) == pytest.approx(1.0)
+    assert page_image_coverage(pages["text_with_figure"][0]) == pytest.approx(
+        150 * 150 / (612 * 792)
+    )
+    # Nested q/cm/Q: two quarter-page images
+    assert page_image_coverage(pages["quarter_page_twice"][0]) == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize(
+    "name, needs_ocr",
+    [
+        ("text_only", False),
+        ("scanned", True),
+        ("scan_with_header", True),
+        ("text_with_figure", False),
+        ("short_text_small_figure", False),
+    ],
+)
+def test_page_classification(pages, name, needs_ocr):
+    page, page_text = pages[name]
+
+    assert page_needs_ocr(page, page_text) is needs_ocr
+
+
+def fake_ocr_page(file_path, page_number, dpi, lang, share_dpi, image_key):
+    """Stands in for _timed_ocr_page in the worker processes"""
+    # Later pages finish first, so results have to be put back in order
+    time.sleep(0.02 * (5 - page_number % 5))
+    if page_number == 7:
+        raise RuntimeError("tesseract crashed")
+    return f"ocr text of page {page_number} " * 3, 0.01
+
+
+@pytest.fixture
+def stub_tesseract(monkeypatch):
+    # Worker processes are forked, so they see the patched module
+    monkeypatch.setattr(ocr, "_timed_ocr_page", fake_ocr_page)
+    monkeypatch.setattr(ocr, "_init_ocr_worker", lambda: None)
+
+
+def test_pool_yields_pages_in_order(stub_tesseract):
+    results = list(iter_ocr_pages("scan.pdf", workers=3, pages=list(range(1, 11))))
+
+    assert [page for page, _ in results] == list(range(1, 11))
+    assert results[0][1].startswith("ocr text of page 1")
+    # A failed page comes back empty instead of failing the document
+    assert results[6] == (7, "")
+
+
+def test_only_flagged_pages_are_ocrd_and_longer_text_wins(stub_tesseract):
+    stream = [
+        (1, "digital text layer " * 20, False),
+        (2, "", True),
+        (3, "a much longer text layer than the OCR result " * 5, True),
+        (7, "header", True),  # OCR fails: the text layer is kept
+    ]
+
+    results = dict(iter_pages_with_ocr("mixed.pdf", stream, workers=2))
+
+    assert list(results) == [1, 2, 3, 7]
+    assert results[1] == stream[0][1]
+    assert results[2].startswith("ocr text of page 2")
+    assert results[3] == stream[2][1]
+    assert results[7] == "header"
+
+
+def test_text_only_documents_start_no_pool(monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("process pool started for a text-only document")
+
+    monkeypatch.setattr(ocr, "ProcessPoolExecutor", no_pool)
+    stream = [(n, f"page {n} text", False) for n in range(1, 4)]
+
+    assert list(iter_pages_with_ocr("text.pdf", stream)) == [(n, t) for n, t, _ in stream]
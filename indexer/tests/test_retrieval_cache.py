@@ -0,0 +1,75 @@
+"""
+Retrieval result cache: LRU, TTL and corpus version invalidation
+"""
+
+import pytest
+
+import retrieval_cache
+from retrieval_cache import RetrievalCache, normalize_query
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(retrieval_cache.time, "monotonic", lambda: clock[0])
+    return clock
+
+
+def test_normalize_query():
+    assert normalize_query("  Apa itu\tFOTOSINTESIS?\n") == "apa itu fotosintesis?"
+    assert normalize_query("ﬁsika") == normalize_query("fisika")
+
+
+def test_hits_misses_and_lru_eviction(clock):
+    cache = RetrievalCache(max_entries=2)
+    cache.put("a", 1, ["chunk a"])
+    cache.put("b", 1, ["chunk b"])
+
+    assert cache.get("a", 1) == ["chunk a"]
+    cache.put("c", 1, ["chunk c"])  # Evicts b, the least recently used
+
+    assert cache.get("b", 1) is None
+    assert cache.get("c", 1) == ["chunk c"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 2)
+
+
+def test_entries_expire(clock):
+    cache = RetrievalCache(ttl_seconds=60)
+    cache.put("a", 1, ["chunk a"])
+
+    clock[0] += 61
+
+    assert cache.get("a", 1) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_new_corpus_version_drops_everything(clock):
+    cache = RetrievalCache()
+    cache.put("a", 1, ["chunk a"])
+
+    assert cache.get("a", 2) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_lower_corpus_version_also_invalidates(clock):
+    # e.g. corpus_state restored from a backup
+    cache = RetrievalCache()
+    cache.put("a", 5, ["chunk a"])
+
+    assert cache.get("a", 3) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["corpus_version"] == 3
+
+
+def test_results_from_another_version_are_not_stored(clock):
+    cache = RetrievalCache()
+    assert cache.get("a", 1) is None
+
+    # A slow request finishes after a lookup has seen the corpus change
+    assert cache.get("b", 2) is None
+    cache.put("a", 1, ["stale chunk a"])
+
+    assert cache.get("a", 2) is None
+    assert cache.stats()["corpus_version"] == 2
@@ -0,0 +1,82 @@
+"""
+Semantic query cache: similarity threshold, parameter keys, LRU slots,
+TTL and corpus version invalidation
+"""
+
+import pytest
+
+import semantic_cache
+from semantic_cache import SemanticCache
+
+KEY = (5, None, "vector")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "monotonic", lambda: clock[0])
+    return clock
+
+
+@pytest.fixture
+def cache(clock):
+    return SemanticCache(max_entries=2, threshold=0.9, ttl_seconds=60, dimension=3)
+
+
+def test_paraphrase_hits_and_unrelated_query_misses(cache):
+    cache.put(KEY, [1.0, 0.0, 0.0], 1, "apa itu fotosintesis", ["chunk"], 0.25)
+
+    query, results, similarity = cache.get(KEY, [2.0, 0.2, 0.0], 1)
+
+    assert (query, results) == ("apa itu fotosintesis", ["chunk"])
+    assert similarity == pytest.approx(0.995, abs=1e-3)
+    assert cache.get(KEY, [0.0, 1.0, 0.0], 1) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["saved_seconds"]) == (1, 1, 0.25)
+
+
+def test_other_parameters_do_not_match(cache):
+    cache.put(KEY, [1.0, 0.0, 0.0], 1, "q", ["chunk"], 0.1)
+
+    assert cache.get((10, None, "vector"), [1.0, 0.0, 0.0], 1) is None
+
+
+def test_least_recently_used_slot_is_overwritten(cache, clock):
+    cache.put(KEY, [1.0, 0.0, 0.0], 1, "x", ["x"], 0.1)
+    clock[0] += 1
+    cache.put(KEY, [0.0, 1.0, 0.0], 1, "y", ["y"], 0.1)
+    clock[0] += 1
+    cache.get(KEY, [1.0, 0.0, 0.0], 1)
+    clock[0] += 1
+
+    cache.put(KEY, [0.0, 0.0, 1.0], 1, "z", ["z"], 0.1)
+
+    assert cache.get(KEY, [0.0, 1.0, 0.0], 1) is None
+    assert cache.get(KEY, [1.0, 0.0, 0.0], 1)[0] == "x"
+    assert cache.get(KEY, [0.0, 0.0, 1.0], 1)[0] == "z"
+
+
+def test_entries_expire(cache, clock):
+    cache.put(KEY, [1.0, 0.0, 0.0], 1, "q", ["chunk"], 0.1)
+
+    clock[0] += 61
+
+    assert cache.get(KEY, [1.0, 0.0, 0.0], 1) is None
+
+
+@pytest.mark.parametrize("new_version", [2, 0])
+def test_any_corpus_version_change_drops_everything(cache, new_version):
+    cache.put(KEY, [1.0, 0.0, 0.0], 1, "q", ["chunk"], 0.1)
+
+    assert cache.get(KEY, [1.0, 0.0, 0.0], new_version) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_results_from_another_version_are_not_stored(cache):
+    assert cache.get(KEY, [1.0, 0.0, 0.0], 2) is None
+
+    cache.put(KEY, [1.0, 0.0, 0.0], 1, "q", ["stale chunk"], 0.1)
+
+    assert cache.get(KEY, [1.0, 0.0, 0.0], 2) is None
+    assert cache.stats()["entries"] == 0
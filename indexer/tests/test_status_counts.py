@@ -0,0 +1,178 @@
+"""
+Trigger-maintained status counts against COUNT(*) ... GROUP BY status
+
+The fake cursor keeps documents and chunks in memory and, like the
+statement-level triggers in migration_add_status_counts.sql, appends one
+status_count_deltas row per (status, has embedding) group a write changes.
+compact_status_counts() and the status_count_totals view are modelled on
+top, so count_statuses and count_drift run without a database.
+"""
+
+from collections import Counter
+
+import pytest
+
+indexer_rag = pytest.importorskip("indexer_rag")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class StatusCountsCursor:
+    def __init__(self):
+        self.connection = FakeConnection()
+        self.tables = {"documents": {}, "chunks": {}}  # id -> (status, with_embedding)
+        self.counts = Counter()  # status_counts
+        self.deltas = []  # status_count_deltas: (table, status, with_embedding, delta)
+        self.result = []
+
+    # Writes, one statement each
+
+    def _fire(self, table, old_rows, new_rows):
+        """count_document_statuses / count_chunk_statuses"""
+        net = Counter()
+        for status, with_embedding in new_rows:
+            net[(status or "unknown", with_embedding)] += 1
+        for status, with_embedding in old_rows:
+            net[(status or "unknown", with_embedding)] -= 1
+        # Groups that net to zero (e.g. re-indexed chunks) add no row
+        self.deltas.extend((table, *group, delta) for group, delta in net.items() if delta)
+
+    def insert(self, table, rows):
+        """rows: {id: status} for documents, {id: (status, has embedding)} for chunks"""
+        new_rows = {
+            row_id: value if table == "chunks" else (value, False)
+            for row_id, value in rows.items()
+        }
+        self.tables[table].update(new_rows)
+        self._fire(table, [], list(new_rows.values()))
+
+    def update(self, table, ids, status=None, embedded=None):
+        old_rows, new_rows = [], []
+        for row_id in ids:
+            old = self.tables[table][row_id]
+            new = (status or old[0], old[1] if embedded is None else embedded)
+            self.tables[table][row_id] = new
+            old_rows.append(old)
+            new_rows.append(new)
+        self._fire(table, old_rows, new_rows)
+
+    def delete(self, table, ids):
+        old_rows = [self.tables[table].pop(row_id) for row_id in ids]
+        self._fire(table, old_rows, [])
+
+    # Reads issued by count_statuses
+
+    def execute(self, sql, params=None):
+        if "compact_status_counts()" in sql:
+            for table, status, with_embedding, delta in self.deltas:
+                self.counts[(table, status, with_embedding)] += delta
+            self.deltas = []
+            self.result = []
+        elif "FROM status_count_totals" in sql:
+            totals = Counter(self.counts)
+            for table, status, with_embedding, delta in self.deltas:
+                totals[(table, status, with_embedding)] += delta
+            self.result = [(*group, count) for group, count in totals.items()]
+        elif "FROM documents" in sql:
+            self.result = self._group_by("documents")
+        elif "FROM chunks" in sql:
+            self.result = self._group_by("chunks")
+        else:
+            raise AssertionError(f"unexpected SQL: {sql}")
+
+    def _group_by(self, table):
+        groups = Counter(
+            (status or "unknown", with_embedding if table == "chunks" else False)
+            for status, with_embedding in self.tables[table].values()
+        )
+        return [(table, *group, count) for group, count in groups.items()]
+
+    def fetchall(self):
+        return list(self.result)
+
+
+def assert_counts_match(cursor):
+    maintained = indexer_rag.count_statuses(cursor)
+    exact = indexer_rag.count_statuses(cursor, exact=True)
+
+    assert maintained == exact
+    assert indexer_rag.count_drift(maintained, exact) == {}
+    return maintained
+
+
+@pytest.fixture
+def cursor():
+    cursor = StatusCountsCursor()
+    cursor.insert("documents", {1: "completed", 2: "processing", 3: None})
+    cursor.insert("chunks", {i: ("pending", False) for i in range(1, 11)})
+    return cursor
+
+
+def test_counts_after_inserts(cursor):
+    counts = assert_counts_match(cursor)
+
+    assert counts["documents"] == {"completed": 1, "processing": 1, "unknown": 1}
+    assert counts["chunks"] == {"total": 10, "with_embeddings": 0, "by_status": {"pending": 10}}
+
+
+def test_counts_after_status_updates(cursor):
+    cursor.update("chunks", range(1, 7), status="embedded", embedded=True)
+    cursor.update("chunks", [7, 8], status="failed")
+    cursor.update("documents", [2], status="completed")
+    assert_counts_match(cursor)
+
+    # Counted before the deltas are compacted too
+    cursor.update("chunks", [7], status="pending")
+    counts = assert_counts_match(cursor)
+
+    assert counts["chunks"]["by_status"] == {"embedded": 6, "failed": 1, "pending": 3}
+    assert counts["chunks"]["with_embeddings"] == 6
+    assert counts["documents"] == {"completed": 2, "unknown": 1}
+
+
+def test_unchanged_statuses_add_no_deltas(cursor):
+    indexer_rag.count_statuses(cursor)
+
+    # Re-indexing rewrites chunk_index and page_number only
+    cursor.update("chunks", range(1, 11))
+
+    assert cursor.deltas == []
+    assert_counts_match(cursor)
+
+
+def test_counts_after_deletes(cursor):
+    cursor.update("chunks", [1, 2], status="embedded", embedded=True)
+    cursor.delete("chunks", [1, 3, 4])
+    cursor.delete("documents", [3])
+    counts = assert_counts_match(cursor)
+
+    assert counts["chunks"] == {
+        "total": 7,
+        "with_embeddings": 1,
+        "by_status": {"embedded": 1, "pending": 6},
+    }
+
+    # Statuses that drop to zero disappear from the counts
+    cursor.delete("chunks", [2])
+    assert "embedded" not in assert_counts_match(cursor)["chunks"]["by_status"]
+
+
+def test_drift_is_reported(cursor):
+    indexer_rag.count_statuses(cursor)
+    # A write that bypassed the triggers (e.g. session_replication_role = replica)
+    cursor.tables["chunks"][11] = ("pending", False)
+
+    drift = indexer_rag.count_drift(
+        indexer_rag.count_statuses(cursor), indexer_rag.count_statuses(cursor, exact=True)
+    )
+
+    assert drift == {"chunks.total": 1, "chunks.by_status.pending": 1}
@@ -0,0 +1,182 @@
+"""
+Re-indexing a document with sync_chunks against an in-memory chunks table
+
+The fake cursor understands just the statements sync_chunks issues
+(directly and through store_chunks, reuse_existing_embeddings and
+execute_values), so the content-hash diffing runs without a database.
+"""
+
+import itertools
+
+import pytest
+
+indexer_rag = pytest.importorskip("indexer_rag")
+content_hash = indexer_rag.content_hash
+
+DOCUMENT_ID = 1
+OTHER_DOCUMENT_ID = 2
+
+
+class FakeChunksCursor:
+    def __init__(self):
+        self.rows = {}
+        self.ids = itertools.count(1)
+        self.result = []
+        self.deleted = []
+
+    def add(self, document_id, content, chunk_index, embedded=True, page_number=None):
+        chunk_id = next(self.ids)
+        self.rows[chunk_id] = {
+            "document_id": document_id,
+            "content": content,
+            "chunk_index": chunk_index,
+            "page_number": page_number,
+            "status": "embedded" if embedded else "pending",
+            "content_hash": content_hash(content),
+            "embedding": [float(chunk_id)] if embedded else None,
+        }
+        return chunk_id
+
+    def document(self, document_id=DOCUMENT_ID):
+        """{content: row} of a document's chunks, row including its id"""
+        return {
+            row["content"]: {**row, "id": chunk_id}
+            for chunk_id, row in self.rows.items()
+            if row["document_id"] == document_id
+        }
+
+    def execute(self, sql, params=None):
+        if sql.lstrip().startswith("SELECT id, content_hash"):
+            (document_id,) = params
+            self.result = sorted(
+                (
+                    (chunk_id, row["content_hash"], row["chunk_index"], row["page_number"])
+                    for chunk_id, row in self.rows.items()
+                    if row["document_id"] == document_id
+                ),
+                key=lambda r: (r[2], r[0]),
+            )
+        elif "SET embedding = src.embedding" in sql:
+            self.result = self._reuse(params[0])
+        elif sql.startswith("DELETE FROM chunks WHERE id = ANY"):
+            for chunk_id in params[0]:
+                del self.rows[chunk_id]
+                self.deleted.append(chunk_id)
+        else:
+            raise AssertionError(f"unexpected SQL: {sql}")
+
+    def _reuse(self, chunk_ids):
+        embedded = {}
+        for chunk_id in sorted(self.rows):
+            row = self.rows[chunk_id]
+            if row["status"] == "embedded":
+                embedded.setdefault(row["content_hash"], row["embedding"])
+        reused = []
+        for chunk_id in chunk_ids:
+            row = self.rows[chunk_id]
+            if row["status"] != "embedded" and row["content_hash"] in embedded:
+                row.update(status="embedded", embedding=embedded[row["content_hash"]])
+                reused.append((chunk_id,))
+        return reused
+
+    def fetchall(self):
+        return self.result
+
+    def execute_values(self, sql, argslist, fetch):
+        if "INSERT INTO chunks" in sql:
+            ids = []
+            for document_id, content, chunk_index, page_number, status, _ in argslist:
+                chunk_id = self.add(document_id, content, chunk_index, embedded=False)
+                self.rows[chunk_id]["page_number"] = page_number
+                ids.append((chunk_id,))
+            return ids
+        if "SET chunk_index = v.chunk_index" in sql:
+            for chunk_id, chunk_index, page_number in argslist:
+                self.rows[chunk_id].update(chunk_index=chunk_index, page_number=page_number)
+            return None
+        raise AssertionError(f"unexpected SQL: {sql}")
+
+
+@pytest.fixture
+def cursor(monkeypatch):
+    def fake_execute_values(cursor, sql, argslist, template=None, page_size=100, fetch=False):
+        return cursor.execute_values(sql, list(argslist), fetch)
+
+    monkeypatch.setattr(indexer_rag, "execute_values", fake_execute_values)
+    cursor = FakeChunksCursor()
+    for index, content in enumerate(["Intro", "Body v1", "Summary"]):
+        cursor.add(DOCUMENT_ID, content, index)
+    return cursor
+
+
+def chunks(*contents):
+    return ({"content": content, "chunk_index": i} for i, content in enumerate(contents))
+
+
+def test_unchanged_chunks_keep_ids_and_embeddings(cursor):
+    before = cursor.document()
+
+    stats = indexer_rag.sync_chunks(cursor, DOCUMENT_ID, chunks("Intro", "Body v1", "Summary"))
+
+    assert stats == {"kept": 3, "inserted": 0, "deleted": 0, "reused_embeddings": 0}
+    assert cursor.document() == before
+
+
+def test_edited_chunk_is_replaced_by_a_pending_chunk(cursor):
+    before = cursor.document()
+
+    stats = indexer_rag.sync_chunks(cursor, DOCUMENT_ID, chunks("Intro", "Body v2", "Summary"))
+    after = cursor.document()
+
+    assert stats == {"kept": 2, "inserted": 1, "deleted": 1, "reused_embeddings": 0}
+    for content in ["Intro", "Summary"]:
+        assert after[content]["id"] == before[content]["id"]
+        assert after[content]["embedding"] == before[content]["embedding"]
+    assert after["Body v2"]["status"] == "pending"
+    assert after["Body v2"]["embedding"] is None
+    assert after["Body v2"]["chunk_index"] == 1
+    assert cursor.deleted == [before["Body v1"]["id"]]
+
+
+def test_removed_chunks_are_deleted_and_kept_ones_renumbered(cursor):
+    before = cursor.document()
+
+    stats = indexer_rag.sync_chunks(cursor, DOCUMENT_ID, chunks("Intro", "Summary"))
+    after = cursor.document()
+
+    assert stats["deleted"] == 1
+    assert set(after) == {"Intro", "Summary"}
+    assert after["Summary"]["id"] == before["Summary"]["id"]
+    assert after["Summary"]["chunk_index"] == 1
+
+
+def test_whitespace_only_edits_count_as_unchanged(cursor):
+    stats = indexer_rag.sync_chunks(
+        cursor, DOCUMENT_ID, chunks("Intro", "Body   v1\n", "Summary")
+    )
+
+    assert stats["kept"] == 3
+    assert stats["inserted"] == 0
+
+
+def test_new_chunk_reuses_an_embedding_from_another_document(cursor):
+    shared_id = cursor.add(OTHER_DOCUMENT_ID, "Shared glossary", 0)
+
+    stats = indexer_rag.sync_chunks(
+        cursor, DOCUMENT_ID, chunks("Intro", "Body v1", "Summary", "Shared glossary")
+    )
+    glossary = cursor.document()["Shared glossary"]
+
+    assert stats["reused_embeddings"] == 1
+    assert glossary["status"] == "embedded"
+    assert glossary["embedding"] == cursor.rows[shared_id]["embedding"]
+    assert glossary["id"] != shared_id
+
+
+def test_generator_input_is_written_in_batches(cursor):
+    contents = ["Intro", "Body v1", "Summary"] + [f"New section {i}" for i in range(7)]
+
+    stats = indexer_rag.sync_chunks(cursor, DOCUMENT_ID, chunks(*contents), batch_size=2)
+
+    assert stats == {"kept": 3, "inserted": 7, "deleted": 0, "reused_embeddings": 0}
+    assert [cursor.document()[c]["chunk_index"] for c in contents] == list(range(10))
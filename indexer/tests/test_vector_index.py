@@ -0,0 +1,166 @@
+"""
+In-memory vector index refresh against a fake chunks table
+
+The fake connection answers vector_index's queries from Python state:
+chunk rows stamped with a change_xid, chunk_deletions rows, and the xmin
+of the current snapshot. No database is needed.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from vector_index import VectorIndex
+
+DIMENSION = 4
+
+
+def unit(axis):
+    vector = [0.0] * DIMENSION
+    vector[axis] = 1.0
+    return vector
+
+
+class FakeConnection:
+    """Just enough of an asyncpg connection for VectorIndex.load/refresh"""
+
+    def __init__(self):
+        self.chunks = {}  # id -> row dict
+        self.deletions = []  # (chunk_id, deleted_xid)
+        self.xmin = 1
+        self.vector_fetches = []
+
+    def write(self, chunk_id, xid, status="embedded", axis=0, document_id=1):
+        self.chunks[chunk_id] = {
+            "id": chunk_id,
+            "document_id": document_id,
+            "status": status,
+            "embedding": unit(axis) if status == "embedded" else None,
+            "change_xid": xid,
+        }
+
+    def delete(self, chunk_id, xid):
+        del self.chunks[chunk_id]
+        self.deletions.append((chunk_id, xid))
+
+    @asynccontextmanager
+    async def transaction(self, **options):
+        yield
+
+    async def fetchval(self, query, *args):
+        if "pg_snapshot_xmin" in query:
+            return self.xmin
+        if "COUNT(*)" in query:
+            return len(self.embedded())
+        raise AssertionError(query)
+
+    async def fetch(self, query, *args):
+        if "FROM chunk_deletions" in query:
+            since = int(args[0])
+            return [{"chunk_id": c} for c, xid in self.deletions if xid >= since]
+        if "change_xid >=" in query:
+            since = int(args[0])
+            return [
+                {"id": row["id"], "change_xid": row["change_xid"]}
+                for row in self.chunks.values()
+                if row["change_xid"] >= since
+            ]
+        if "id = ANY" in query:
+            self.vector_fetches.append(sorted(args[0]))
+            return [self.chunks[i] for i in args[0] if i in self.chunks]
+        raise AssertionError(query)
+
+    async def execute(self, query, *args):
+        return "DELETE 0"
+
+    def embedded(self):
+        return [row for row in self.chunks.values() if row["status"] == "embedded"]
+
+    async def _rows(self):
+        for row in self.embedded():
+            yield (row["id"], row["document_id"], row["embedding"])
+
+    def cursor(self, query, prefetch=None):
+        return self._rows()
+
+
+@pytest.fixture
+def conn():
+    return FakeConnection()
+
+
+@pytest.fixture
+def index(conn):
+    index = VectorIndex(dimension=DIMENSION, dtype="float32")
+    conn.write(1, xid=5, axis=0)
+    conn.xmin = 10
+    asyncio.run(index.load(conn))
+    return index
+
+
+def indexed_ids(index):
+    return set(index.positions)
+
+
+def test_rows_committed_after_a_long_transaction_are_picked_up(conn, index):
+    # Transaction 10 was running when the index loaded; it commits later,
+    # long after its start time
+    conn.write(2, xid=10, axis=1)
+    conn.xmin = 20
+
+    asyncio.run(index.refresh(conn))
+
+    assert indexed_ids(index) == {1, 2}
+    assert index.search(unit(1), 1)[0][0] == 2
+
+
+def test_deleted_chunks_are_removed(conn, index):
+    conn.write(2, xid=12, axis=1)
+    conn.xmin = 20
+    asyncio.run(index.refresh(conn))
+
+    conn.delete(1, xid=21)
+    conn.delete(2, xid=21)
+    conn.xmin = 30
+    asyncio.run(index.refresh(conn))
+
+    assert indexed_ids(index) == set()
+    assert index.search(unit(0), 5) == []
+
+
+def test_chunks_leaving_embedded_status_are_removed(conn, index):
+    conn.write(1, xid=15, status="pending")
+    conn.xmin = 20
+
+    asyncio.run(index.refresh(conn))
+
+    assert indexed_ids(index) == set()
+
+
+def test_applied_rows_are_not_refetched_while_xmin_is_held_back(conn, index):
+    # A long /index transaction keeps the snapshot xmin at 10
+    conn.write(2, xid=11, axis=1)
+    asyncio.run(index.refresh(conn))
+    asyncio.run(index.refresh(conn))
+
+    assert conn.vector_fetches == [[2]]
+
+    # A new version of the same row is fetched again
+    conn.write(2, xid=12, axis=2)
+    asyncio.run(index.refresh(conn))
+
+    assert conn.vector_fetches == [[2], [2]]
+    assert index.search(unit(2), 1)[0][0] == 2
+
+
+def test_truncate_reloads(conn, index):
+    conn.chunks.clear()
+    conn.write(7, xid=12, axis=3)
+    conn.deletions.append((None, 12))
+    conn.xmin = 20
+
+    asyncio.run(index.refresh(conn))
+
+    assert indexed_ids(index) == {7}
+    assert index.watermark == 20
@@ -0,0 +1,187 @@
+"""
+Vision page descriptions against a stub vision model
+
+PDFs are written by hand so each page's drawing is known exactly: text
+only, a direct image, an image nested in a Form XObject, and two slides
+sharing a template image but with different labels. Rendering is replaced
+by a fixed image per page, so no poppler install is needed.
+"""
+
+import threading
+import time
+import types
+
+import pytest
+from PIL import Image
+
+import vision
+from ocr import page_content_key, page_has_images
+from pdf_builder import DRAW_IMAGE, image_object, text, write_pdf
+
+pypdf = pytest.importorskip("pypdf")
+
+PAGES = [
+    # 1: text only
+    (text("Just text"), {}),
+    # 2: image drawn directly
+    (DRAW_IMAGE, {"Im1": image_object()}),
+    # 3: image only reachable through a Form XObject
+    (
+        b"q /Fm1 Do Q",
+        {"Fm1": (b"q 100 0 0 100 0 0 cm /Im1 Do Q", {"Im1": image_object()})},
+    ),
+    # 4 and 5: same template image, different labels
+    (DRAW_IMAGE + text("Revenue 2023"), {"Im1": image_object()}),
+    (DRAW_IMAGE + text("Revenue 2024"), {"Im1": image_object()}),
+    # 6: duplicate of slide 4
+    (DRAW_IMAGE + text("Revenue 2023"), {"Im1": image_object()}),
+]
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = tmp_path / "slides.pdf"
+    write_pdf(path, PAGES)
+    return str(path)
+
+
+@pytest.fixture
+def pdf_pages(pdf_path):
+    return list(pypdf.PdfReader(pdf_path).pages)
+
+
+class StubVisionModel:
+    """Describes the page it was shown; tracks calls and concurrency"""
+
+    model_name = "stub-vision"
+
+    def __init__(self, latency=0.0, no_images_pages=()):
+        self.latency = latency
+        self.no_images_pages = set(no_images_pages)
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, parts):
+        page_number = parts[-1].info["page"]
+        with self.lock:
+            self.calls.append(page_number)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self.lock:
+            self.in_flight -= 1
+        if page_number in self.no_images_pages:
+            return types.SimpleNamespace(text="No images")
+        return types.SimpleNamespace(text=f"Diagram on page {page_number}")
+
+
+class MemoryVisionCache(vision.VisionCache):
+    """vision_cache table stand-in, shared by every instance in a test"""
+
+    rows = {}
+
+    def get(self, key):
+        return self.rows.get((key, self.model_name))
+
+    def put(self, key, description):
+        self.rows[(key, self.model_name)] = description
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Replace page rendering with a fixed image per page; records renders"""
+    rendered = []
+
+    def load_page_image(file_path, page_number, dpi, image_key=None):
+        rendered.append(page_number)
+        image = Image.new("L", (32, 32), page_number * 20)
+        image.info["page"] = page_number
+        return image
+
+    MemoryVisionCache.rows = {}
+    monkeypatch.setattr(vision, "load_page_image", load_page_image)
+    monkeypatch.setattr(vision, "VisionCache", MemoryVisionCache)
+    return rendered
+
+
+def test_page_has_images_finds_direct_and_nested_images(pdf_pages):
+    assert [page_has_images(page) for page in pdf_pages] == [
+        False, True, True, True, True, True,
+    ]
+
+
+def test_content_key_is_exact(pdf_pages):
+    keys = [page_content_key(page) for page in pdf_pages]
+
+    assert all(key and key.startswith("sha256:") for key in keys)
+    # Same template, different label
+    assert keys[3] != keys[4]
+    # Duplicate slide
+    assert keys[3] == keys[5]
+    assert len(set(keys)) == 5
+
+
+def test_pixel_hash_tells_apart_single_pixel_changes():
+    image = Image.new("L", (64, 64), 255)
+    changed = image.copy()
+    changed.putpixel((40, 40), 0)
+
+    assert vision.image_hash(image) == vision.image_hash(image.copy())
+    assert vision.image_hash(image) != vision.image_hash(changed)
+
+
+def test_describe_pages_runs_concurrently_up_to_the_limit(pdf_path, renders):
+    model = StubVisionModel(latency=0.05)
+
+    descriptions = vision.describe_pages(pdf_path, [2, 3, 4, 5], model=model, concurrency=2)
+
+    assert descriptions == {n: f"Diagram on page {n}" for n in [2, 3, 4, 5]}
+    assert model.max_in_flight == 2
+
+
+def test_cached_pages_skip_the_model_and_rendering(pdf_path, pdf_pages, renders):
+    page_keys = {n: page_content_key(pdf_pages[n - 1]) for n in [4, 5, 6]}
+    model = StubVisionModel(no_images_pages={5})
+
+    first = vision.describe_pages(pdf_path, [4, 5], model=model, page_keys=page_keys)
+    assert first == {4: "Diagram on page 4"}
+    assert sorted(model.calls) == [4, 5]
+
+    # Re-index: the duplicate slide and the cached "No images" answer cost nothing
+    model.calls.clear()
+    renders.clear()
+    second = vision.describe_pages(pdf_path, [5, 6], model=model, page_keys=page_keys)
+
+    assert second == {6: "Diagram on page 4"}
+    assert model.calls == []
+    assert renders == []
+
+
+def test_template_slides_get_their_own_descriptions(pdf_path, pdf_pages, renders):
+    page_keys = {n: page_content_key(pdf_pages[n - 1]) for n in [4, 5]}
+    model = StubVisionModel()
+
+    vision.describe_pages(pdf_path, [4], model=model, page_keys=page_keys)
+    descriptions = vision.describe_pages(pdf_path, [5], model=model, page_keys=page_keys)
+
+    assert descriptions == {5: "Diagram on page 5"}
+    assert model.calls == [4, 5]
+
+
+def test_text_only_pages_are_never_sent(pdf_path, renders, monkeypatch):
+    indexer_rag = pytest.importorskip("indexer_rag")
+
+    def no_database():
+        raise RuntimeError("no database in tests")
+
+    monkeypatch.setattr(indexer_rag, "get_db_connection", no_database)
+    model = StubVisionModel()
+
+    descriptions = indexer_rag.extract_page_image_descriptions(pdf_path, model=model)
+
+    assert 1 not in model.calls
+    assert 1 not in renders
+    assert [page for page, _ in descriptions] == [2, 3, 4, 5, 6]
+    assert sorted(model.calls) == [2, 3, 4, 5]  # Page 6 duplicates page 4
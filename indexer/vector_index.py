@@ -0,0 +1,398 @@
+"""
+In-process vector index for TutorAI
+Exact top-k retrieval over a NumPy matrix of normalized chunk embeddings
+
+Postgres stays the source of truth: the index only holds chunk IDs,
+document IDs and vectors, and is kept in sync by the embedding pipeline
+(same process) and by polling for chunk changes (other processes, such as
+workers). Chunk contents are always read back from Postgres.
+
+Changes are found by transaction ID, not by time: a trigger stamps every
+inserted or updated chunk with the writing transaction's ID
+(chunks.change_xid) and records every deleted chunk in chunk_deletions.
+Each load/refresh remembers the oldest transaction still running when its
+snapshot was taken (the snapshot's xmin); everything older is visible to
+that snapshot, so the next refresh only has to look at rows stamped by
+that transaction or a later one, however long they took to commit.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    from chunker_embedder import EMBEDDING_DIMENSION
+    from db import async_db_connection
+except ImportError:
+    from .chunker_embedder import EMBEDDING_DIMENSION
+    from .db import async_db_connection
+
+load_dotenv()
+
+VECTOR_INDEX_ENABLED = os.getenv("VECTOR_INDEX_ENABLED", "false").lower() == "true"
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")  # or float16 (half the RAM)
+VECTOR_INDEX_REFRESH_SECONDS = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "5"))
+
+# chunk_deletions rows older than this are pruned. An index that has not
+# refreshed for half as long reloads instead, so it never misses a delete.
+DELETION_RETENTION = timedelta(days=1)
+DELETION_PRUNE_SECONDS = 3600
+
+# Above this many rows a search is moved off the event loop
+INLINE_SEARCH_ROWS = 50_000
+
+LOAD_BATCH_ROWS = 10_000
+
+# Oldest transaction still running when the snapshot was taken
+SNAPSHOT_XMIN = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row (zero rows stay zero)"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """
+    Contiguous (capacity, dimension) matrix of unit vectors with parallel
+    chunk ID and document ID arrays
+
+    Dot products of unit vectors are cosine similarities, so a search is
+    one matrix-vector product followed by argpartition. Rows are appended
+    into spare capacity and removed by moving the last row into the gap.
+    """
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, dtype: str = VECTOR_INDEX_DTYPE):
+        self.dimension = dimension
+        self.dtype = np.dtype(dtype)
+        self.lock = threading.Lock()
+        self.ready = False
+        # xmin of the last load/refresh snapshot, as an integer xid8
+        self.watermark: Optional[int] = None
+        # change_xid of rows at or above the watermark already applied, so a
+        # long-running writer does not make every refresh re-read its vectors
+        self.applied: Dict[int, int] = {}
+        self.refreshed_at = 0.0
+        self.pruned_at = 0.0
+        self._reset(0)
+
+    def _reset(self, capacity: int):
+        self.matrix = np.zeros((capacity, self.dimension), dtype=self.dtype)
+        self.chunk_ids = np.zeros(capacity, dtype=np.int64)
+        self.document_ids = np.zeros(capacity, dtype=np.int64)
+        self.positions: Dict[int, int] = {}
+        self.size = 0
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self.chunk_ids):
+            return
+        capacity = max(capacity, 2 * len(self.chunk_ids), 1024)
+        matrix = np.zeros((capacity, self.dimension), dtype=self.dtype)
+        matrix[: self.size] = self.matrix[: self.size]
+        self.matrix = matrix
+        self.chunk_ids = np.resize(self.chunk_ids, capacity)
+        self.document_ids = np.resize(self.document_ids, capacity)
+
+    def upsert(
+        self,
+        chunk_ids: Sequence[int],
+        document_ids: Sequence[int],
+        embeddings: Sequence[Sequence[float]],
+    ):
+        """Insert or replace vectors for the given chunks"""
+        if not len(chunk_ids):
+            return
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32)).astype(self.dtype)
+
+        with self.lock:
+            self._reserve(self.size + len(chunk_ids))
+            for chunk_id, document_id, vector in zip(chunk_ids, document_ids, vectors):
+                position = self.positions.get(chunk_id)
+                if position is None:
+                    position = self.size
+                    self.positions[chunk_id] = position
+                    self.size += 1
+                self.matrix[position] = vector
+                self.chunk_ids[position] = chunk_id
+                self.document_ids[position] = document_id
+
+    def remove(self, chunk_ids: Sequence[int]):
+        """Drop chunks from the index (unknown IDs are ignored)"""
+        with self.lock:
+            for chunk_id in chunk_ids:
+                position = self.positions.pop(chunk_id, None)
+                if position is None:
+                    continue
+                last = self.size - 1
+                if position != last:
+                    moved_id = int(self.chunk_ids[last])
+                    self.matrix[position] = self.matrix[last]
+                    self.chunk_ids[position] = moved_id
+                    self.document_ids[position] = self.document_ids[last]
+                    self.positions[moved_id] = position
+                self.size = last
+
+    def search(
+        self, query: Sequence[float], top_k: int, document_id: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Exact top-k by cosine similarity
+
+        Returns:
+            (chunk_id, similarity) pairs, most similar first
+        """
+        return self.search_batch([query], top_k, document_id)[0]
+
+    def search_batch(
+        self,
+        queries: Sequence[Sequence[float]],
+        top_k: int,
+        document_id: Optional[int] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Exact top-k for several queries with one matrix multiply
+
+        Returns:
+            One list of (chunk_id, similarity) pairs per query, most similar first
+        """
+        q = normalize_rows(np.asarray(queries, dtype=np.float32)).astype(self.dtype)
+
+        with self.lock:
+            if document_id is None:
+                rows = None
+                scores = self.matrix[: self.size] @ q.T
+            else:
+                rows = np.flatnonzero(self.document_ids[: self.size] == document_id)
+                scores = self.matrix[rows] @ q.T
+
+            k = min(top_k, scores.shape[0])
+            if k <= 0:
+                return [[] for _ in range(len(q))]
+
+            # (k, queries) unordered winners per column, then sort each column
+            top = np.argpartition(-scores, k - 1, axis=0)[:k]
+            results = []
+            for column in range(scores.shape[1]):
+                winners = top[:, column]
+                winners = winners[np.argsort(-scores[winners, column])]
+                positions = rows[winners] if rows is not None else winners
+                results.append(
+                    [
+                        (int(self.chunk_ids[position]), float(score))
+                        for position, score in zip(positions, scores[winners, column])
+                    ]
+                )
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "enabled": VECTOR_INDEX_ENABLED,
+                "ready": self.ready,
+                "entries": self.size,
+                "dtype": self.dtype.name,
+                "memory_bytes": int(self.matrix.nbytes + self.chunk_ids.nbytes + self.document_ids.nbytes),
+            }
+
+    # Sync with Postgres
+
+    async def load(self, conn):
+        """Replace the index contents with every embedded chunk"""
+        fresh = VectorIndex(self.dimension, self.dtype.name)
+
+        # One snapshot for the watermark and the rows it covers
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            watermark = await conn.fetchval(SNAPSHOT_XMIN)
+            count = await conn.fetchval(
+                "SELECT COUNT(*) FROM chunks WHERE status = 'embedded' AND embedding IS NOT NULL"
+            )
+            fresh._reserve(count)
+
+            # embedding::vector first, so halfvec columns decode the same way
+            batch: List[Any] = []
+            async for row in conn.cursor(
+                """
+                SELECT id, document_id, embedding::vector::real[] AS embedding
+                FROM chunks
+                WHERE status = 'embedded' AND embedding IS NOT NULL
+                """,
+                prefetch=LOAD_BATCH_ROWS,
+            ):
+                batch.append(row)
+                if len(batch) >= LOAD_BATCH_ROWS:
+                    fresh.upsert(*zip(*batch))
+                    batch = []
+            if batch:
+                fresh.upsert(*zip(*batch))
+
+        with self.lock:
+            self.matrix = fresh.matrix
+            self.chunk_ids = fresh.chunk_ids
+            self.document_ids = fresh.document_ids
+            self.positions = fresh.positions
+            self.size = fresh.size
+            self.watermark = int(watermark)
+            self.applied = {}
+            self.refreshed_at = time.monotonic()
+            self.ready = True
+
+        print(f"Vector index loaded: {self.size} chunks ({self.dtype.name})")
+
+    async def refresh(self, conn):
+        """Apply chunk changes and deletions since the last load/refresh"""
+        if time.monotonic() - self.refreshed_at > DELETION_RETENTION.total_seconds() / 2:
+            # Deletions from that long ago may already be pruned
+            await self.load(conn)
+            return
+
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            watermark = int(await conn.fetchval(SNAPSHOT_XMIN))
+            changes = await conn.fetch(
+                """
+                SELECT id, change_xid::text::bigint AS change_xid
+                FROM chunks
+                WHERE change_xid >= $1::text::xid8
+                """,
+                str(self.watermark),
+            )
+            deletions = await conn.fetch(
+                "SELECT chunk_id FROM chunk_deletions WHERE deleted_xid >= $1::text::xid8",
+                str(self.watermark),
+            )
+            # A NULL chunk_id marks a TRUNCATE
+            truncated = any(row["chunk_id"] is None for row in deletions)
+            changed = [
+                row["id"] for row in changes if self.applied.get(row["id"]) != row["change_xid"]
+            ]
+            rows = []
+            if changed and not truncated:
+                rows = await conn.fetch(
+                    """
+                    SELECT id, document_id, status, embedding::vector::real[] AS embedding
+                    FROM chunks
+                    WHERE id = ANY($1::int[])
+                    """,
+                    changed,
+                )
+
+        if truncated:
+            await self.load(conn)
+            return
+
+        embedded = [row for row in rows if row["status"] == "embedded" and row["embedding"]]
+        self.upsert(
+            [row["id"] for row in embedded],
+            [row["document_id"] for row in embedded],
+            [row["embedding"] for row in embedded],
+        )
+        self.remove([row["id"] for row in rows if row["status"] != "embedded"])
+        self.remove([row["chunk_id"] for row in deletions])
+
+        # Rows at or above the new watermark are seen again next time; skip
+        # the ones whose version was applied here
+        self.applied = {
+            row["id"]: row["change_xid"] for row in changes if row["change_xid"] >= watermark
+        }
+        self.watermark = watermark
+        self.refreshed_at = time.monotonic()
+
+        if time.monotonic() - self.pruned_at > DELETION_PRUNE_SECONDS:
+            self.pruned_at = time.monotonic()
+            await conn.execute(
+                "DELETE FROM chunk_deletions WHERE deleted_at < NOW() - $1::interval",
+                DELETION_RETENTION,
+            )
+
+
+async def search_chunks_batch(
+    conn,
+    index: VectorIndex,
+    query_embeddings: Sequence[Sequence[float]],
+    top_k: int,
+    document_id: Optional[int] = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Top-k chunks per query from the in-memory index, with contents read
+    from Postgres in one query
+
+    Hits whose rows were deleted or re-chunked since the last refresh are
+    dropped from the index and the search is repeated.
+
+    Returns:
+        One list of rows shaped like match_chunks results per query
+    """
+    loop = asyncio.get_running_loop()
+
+    for attempt in range(3):
+        if index.size * len(query_embeddings) > INLINE_SEARCH_ROWS:
+            hits = await loop.run_in_executor(
+                None, index.search_batch, query_embeddings, top_k, document_id
+            )
+        else:
+            hits = index.search_batch(query_embeddings, top_k, document_id)
+
+        chunk_ids = list({chunk_id for query_hits in hits for chunk_id, _ in query_hits})
+        rows = await conn.fetch(
+            """
+            SELECT id, document_id, content, chunk_index FROM chunks
+            WHERE id = ANY($1::int[]) AND status = 'embedded'
+            """,
+            chunk_ids,
+        )
+        found = {row["id"]: row for row in rows}
+
+        stale = [chunk_id for chunk_id in chunk_ids if chunk_id not in found]
+        if stale and attempt < 2:
+            index.remove(stale)
+            continue
+
+        return [
+            [
+                {**dict(found[chunk_id]), "similarity": similarity}
+                for chunk_id, similarity in query_hits
+                if chunk_id in found
+            ]
+            for query_hits in hits
+        ]
+
+
+async def search_chunks(
+    conn,
+    index: VectorIndex,
+    query_embedding: Sequence[float],
+    top_k: int,
+    document_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Single-query search_chunks_batch"""
+    results = await search_chunks_batch(conn, index, [query_embedding], top_k, document_id)
+    return results[0]
+
+
+async def maintain_index(index: VectorIndex, refresh_seconds: float = VECTOR_INDEX_REFRESH_SECONDS):
+    """Load the index, then poll for changes until cancelled"""
+    while not index.ready:
+        try:
+            async with async_db_connection() as conn:
+                await index.load(conn)
+        except Exception as e:
+            print(f"Vector index load failed, retrying: {e}")
+            await asyncio.sleep(refresh_seconds)
+
+    while True:
+        await asyncio.sleep(refresh_seconds)
+        try:
+            async with async_db_connection() as conn:
+                await index.refresh(conn)
+        except Exception as e:
+            print(f"Vector index refresh failed: {e}")
+
+
+vector_index = VectorIndex()
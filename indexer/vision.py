@@ -0,0 +1,232 @@
+"""
+Vision module for TutorAI
+Describes PDF page visuals with Gemini Vision, concurrently and with a persistent cache
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+try:
+    from chunker_embedder import get_genai
+    from metrics import INGEST_STAGE_SECONDS, timed_provider_call
+    from ocr import VISION_DPI, load_page_image
+except ImportError:
+    from .chunker_embedder import get_genai
+    from .metrics import INGEST_STAGE_SECONDS, timed_provider_call
+    from .ocr import VISION_DPI, load_page_image
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+load_dotenv()
+
+# Gemini 1.5 Flash (cheapest model with vision)
+VISION_MODEL = "gemini-1.5-flash"
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", "4"))
+
+_vision_seconds = INGEST_STAGE_SECONDS.labels("vision")
+
+VISION_PROMPT = (
+    "Describe all images, diagrams, charts, graphs, and visual elements in this page. "
+    "If no significant visual elements, respond 'No images'. Be concise."
+)
+
+
+def image_hash(image: "Image.Image") -> str:
+    """
+    Exact key of a rendered page image: SHA-256 of its mode, size and pixels
+
+    Used when the page's content key cannot be computed from the PDF. Any
+    pixel difference (a changed label or number) gives a different key.
+
+    Returns:
+        "pixels-sha256:<hex>"
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.width}x{image.height}".encode())
+    digest.update(image.tobytes())
+    return f"pixels-sha256:{digest.hexdigest()}"
+
+
+class VisionCache:
+    """
+    Page description cache in the vision_cache table
+
+    Thread-safe wrapper around one connection. Without a connection it is
+    a no-op, so vision extraction still works if the database is unavailable.
+    Hit/miss counters are shared by all instances (one per describe_pages).
+    """
+
+    counters = {"hits": 0, "misses": 0}
+    counters_lock = threading.Lock()
+
+    def __init__(self, conn=None, model_name: str = VISION_MODEL):
+        self.conn = conn
+        self.model_name = model_name
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        if self.conn is None:
+            return None
+        try:
+            with self.lock, self.conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT description FROM vision_cache WHERE image_hash = %s AND model = %s",
+                    (key, self.model_name),
+                )
+                row = cursor.fetchone()
+                self.conn.commit()
+            with self.counters_lock:
+                self.counters["hits" if row else "misses"] += 1
+            return row[0] if row else None
+        except Exception as e:
+            print(f"   Vision cache lookup failed: {e}")
+            self.conn.rollback()
+            return None
+
+    def put(self, key: str, description: str):
+        if self.conn is None:
+            return
+        try:
+            with self.lock, self.conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO vision_cache (image_hash, model, description)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (image_hash, model) DO UPDATE
+                    SET description = EXCLUDED.description, created_at = NOW()
+                    """,
+                    (key, self.model_name, description),
+                )
+                self.conn.commit()
+        except Exception as e:
+            print(f"   Vision cache write failed: {e}")
+            self.conn.rollback()
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        """Hit/miss counters since process start"""
+        with cls.counters_lock:
+            return dict(cls.counters)
+
+
+def describe_page(
+    file_path: str,
+    page_number: int,
+    model,
+    cache: VisionCache,
+    dpi: int = VISION_DPI,
+    image_key: Optional[str] = None,
+    content_key: Optional[str] = None,
+) -> str:
+    """
+    Describe the visual content of one page, using the cache when possible
+
+    With a content_key (ocr.page_content_key), a cached page is answered
+    without rendering it; otherwise the rendered pixels are hashed.
+
+    Returns:
+        Description, or "" if the page has no significant visuals
+    """
+    image = None
+    key = content_key
+    if key is None:
+        image = load_page_image(file_path, page_number, dpi, image_key)
+        key = image_hash(image)
+
+    cached = cache.get(key)
+    if cached is not None:
+        print(f"   Page {page_number}: cached description")
+        return cached
+
+    if image is None:
+        image = load_page_image(file_path, page_number, dpi, image_key)
+
+    response = timed_provider_call(
+        "vision", _vision_seconds, model.generate_content, [VISION_PROMPT, image]
+    )
+    description = response.text.strip()
+
+    if description.lower() == "no images":
+        description = ""
+
+    # "No images" answers are cached too so they are never asked again
+    cache.put(key, description)
+    return description
+
+
+def describe_pages(
+    file_path: str,
+    page_numbers: List[int],
+    model=None,
+    conn=None,
+    dpi: int = VISION_DPI,
+    image_key: Optional[str] = None,
+    concurrency: int = VISION_CONCURRENCY,
+    page_keys: Optional[Dict[int, str]] = None,
+) -> Dict[int, str]:
+    """
+    Describe several pages with up to `concurrency` vision calls in flight
+
+    Args:
+        file_path: Path to PDF file
+        page_numbers: 1-based pages to describe
+        model: Object with generate_content (default: Gemini VISION_MODEL)
+        conn: Optional database connection for the description cache
+        dpi: Resolution for page images
+        image_key: Page image directory key (see ocr.new_page_image_key)
+        concurrency: Maximum concurrent vision calls
+        page_keys: Optional page number -> ocr.page_content_key cache keys
+
+    Returns:
+        Dict of page number -> description, for pages with visual content
+    """
+    model = model or get_genai().GenerativeModel(VISION_MODEL)
+    cache = VisionCache(conn, getattr(model, "model_name", VISION_MODEL))
+    page_keys = page_keys or {}
+
+    # Pages with the same content key (duplicate slides) are described once
+    first_page: Dict[str, int] = {}
+    for page_number in page_numbers:
+        key = page_keys.get(page_number)
+        if key is not None:
+            first_page.setdefault(key, page_number)
+    unique_pages = [
+        page_number
+        for page_number in page_numbers
+        if first_page.get(page_keys.get(page_number), page_number) == page_number
+    ]
+
+    def describe(page_number: int) -> str:
+        print(f"Analyzing page {page_number} for visual content...")
+        try:
+            return describe_page(
+                file_path,
+                page_number,
+                model,
+                cache,
+                dpi,
+                image_key,
+                page_keys.get(page_number),
+            )
+        except Exception as e:
+            print(f"   Error on page {page_number}: {e}")
+            return ""
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        described = dict(zip(unique_pages, executor.map(describe, unique_pages)))
+
+    descriptions = {
+        page_number: described[first_page.get(page_keys.get(page_number), page_number)]
+        for page_number in page_numbers
+    }
+    return {
+        page_number: description
+        for page_number, description in descriptions.items()
+        if description
+    }
@@ -0,0 +1,436 @@
+"""
+TutorAI Ingestion Worker
+Claims jobs from the Postgres queue and runs the extract, chunk and embed stages
+
+Usage:
+    python worker.py                              # all stages, one process
+    python worker.py --stage extract --processes 4
+    python worker.py --stage embed
+    python worker.py --metrics-port 9100          # Prometheus metrics on 9100, 9101, ...
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import start_http_server
+from psycopg2.extras import execute_values
+
+try:
+    from ann_index import maybe_rebuild_index
+    from chunker_embedder import chunk_pages
+    from indexer_rag import (
+        document_unchanged,
+        get_db_connection,
+        iter_pdf_pages,
+        run_embedding,
+        sync_chunks,
+    )
+    from jobs import (
+        JOB_STAGES,
+        JobLostError,
+        claim_job,
+        complete_job,
+        fail_job,
+        heartbeat_job,
+        requeue_stale_jobs,
+        update_job_progress,
+    )
+    from metrics import INGEST_STAGE_SECONDS, JOB_SECONDS
+    from ocr import file_hash, get_page_count
+except ImportError:
+    from .ann_index import maybe_rebuild_index
+    from .chunker_embedder import chunk_pages
+    from .indexer_rag import (
+        document_unchanged,
+        get_db_connection,
+        iter_pdf_pages,
+        run_embedding,
+        sync_chunks,
+    )
+    from .jobs import (
+        JOB_STAGES,
+        JobLostError,
+        claim_job,
+        complete_job,
+        fail_job,
+        heartbeat_job,
+        requeue_stale_jobs,
+        update_job_progress,
+    )
+    from .metrics import INGEST_STAGE_SECONDS, JOB_SECONDS
+    from .ocr import file_hash, get_page_count
+
+HEARTBEAT_SECONDS = 30
+STALE_CHECK_SECONDS = 60
+
+# Pages written to / read from document_pages per round trip
+PAGE_BATCH_SIZE = 50
+
+
+class JobContext:
+    """
+    Keeps a running job alive and records its progress
+
+    Uses a dedicated autocommit connection so heartbeats and progress are
+    visible immediately, independent of the stage's own transaction.
+    """
+
+    def __init__(self, job: Dict[str, Any]):
+        self.job = job
+        self.conn = get_db_connection()
+        self.conn.autocommit = True
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.conn.close()
+
+    def _heartbeat_loop(self):
+        while not self.stopped.wait(HEARTBEAT_SECONDS):
+            try:
+                with self.lock, self.conn.cursor() as cursor:
+                    heartbeat_job(cursor, self.job)
+            except JobLostError as e:
+                # The stage notices at its next progress report or completion
+                print(f"Stopping heartbeat: {e}")
+                return
+            except Exception as e:
+                print(f"Heartbeat failed for job {self.job['id']}: {e}")
+
+    def report_progress(self, progress: int, total: Optional[int] = None):
+        """Record progress; raises JobLostError if the job was taken over"""
+        with self.lock, self.conn.cursor() as cursor:
+            update_job_progress(cursor, self.job, progress, total)
+
+
+def run_extract_stage(conn, job: Dict[str, Any], ctx: JobContext):
+    """Extract text from the PDF and hand it to the chunk stage"""
+    document_id = job["document_id"]
+    file_path = job["payload"].get("file_path")
+    use_vision = job["payload"].get("use_vision", False)
+
+    if not file_path or not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    file_content_hash = file_hash(file_path)
+
+    with conn.cursor() as cursor:
+        # Unchanged file: keep its chunks and only embed whatever is still pending
+        if not job["payload"].get("force") and document_unchanged(
+            cursor, document_id, file_content_hash
+        ):
+            cursor.execute(
+                "UPDATE documents SET status = 'completed', updated_at = NOW() WHERE id = %s",
+                (document_id,),
+            )
+            complete_job(cursor, job, next_stage="embed")
+            conn.commit()
+            print(f"Document {document_id} unchanged, skipping extraction")
+            return
+
+        cursor.execute(
+            "UPDATE documents SET status = 'processing', updated_at = NOW() WHERE id = %s",
+            (document_id,),
+        )
+    conn.commit()
+
+    print(f"Extracting text from PDF: {file_path}")
+
+    # Pages are written in batches as they are extracted; the chunk job is
+    # only queued once all of them are committed
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM document_pages WHERE document_id = %s", (document_id,))
+    conn.commit()
+
+    page_count = get_page_count(file_path)
+    batch = []
+    seq = 0
+    characters = 0
+
+    def flush_pages():
+        with INGEST_STAGE_SECONDS.labels("page_store").time():
+            with conn.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    "INSERT INTO document_pages (document_id, seq, page_number, content) VALUES %s",
+                    batch,
+                )
+            conn.commit()
+        batch.clear()
+
+    for page_number, page_text in iter_pdf_pages(file_path, use_ocr=True, use_vision=use_vision):
+        seq += 1
+        characters += len(page_text.strip())
+        batch.append((document_id, seq, page_number, page_text))
+        if len(batch) >= PAGE_BATCH_SIZE:
+            flush_pages()
+            ctx.report_progress(min(page_number, page_count), page_count)
+    if batch:
+        flush_pages()
+
+    if not characters:
+        raise ValueError("No text extracted from PDF (tried OCR)")
+
+    with conn.cursor() as cursor:
+        complete_job(
+            cursor, job, next_payload={**job["payload"], "content_hash": file_content_hash}
+        )
+    conn.commit()
+
+    print(f"Extracted {characters} characters ({seq} pages) from document {document_id}")
+
+
+def iter_document_pages(conn, document_id: int) -> Iterator[Tuple[Optional[int], str]]:
+    """Stream a document's extracted pages in order through a server-side cursor"""
+    with conn.cursor(name=f"document_pages_{document_id}") as cursor:
+        cursor.itersize = PAGE_BATCH_SIZE
+        cursor.execute(
+            "SELECT page_number, content FROM document_pages WHERE document_id = %s ORDER BY seq",
+            (document_id,),
+        )
+        for page_number, content in cursor:
+            yield page_number, content
+
+
+def run_chunk_stage(conn, job: Dict[str, Any], ctx: JobContext):
+    """Chunk the extracted pages and store chunks as 'pending'"""
+    document_id = job["document_id"]
+
+    chunks = chunk_pages(
+        iter_document_pages(conn, document_id), chunk_size=1000, overlap=200, method="semantic"
+    )
+
+    # Sync chunks in the same transaction as completing the job, so a
+    # retried or resumed chunk stage never leaves duplicates behind
+    with conn.cursor() as cursor:
+        sync_stats = sync_chunks(cursor, document_id, chunks)
+
+        if not sync_stats["kept"] + sync_stats["inserted"]:
+            raise ValueError(f"No chunks created from extracted text of document {document_id}")
+
+        cursor.execute("DELETE FROM document_pages WHERE document_id = %s", (document_id,))
+        cursor.execute(
+            """
+            UPDATE documents
+            SET status = 'completed', content_hash = %s, updated_at = NOW()
+            WHERE id = %s
+            """,
+            (job["payload"].get("content_hash"), document_id),
+        )
+        complete_job(cursor, job)
+    conn.commit()
+
+    print(
+        f"Chunked document {document_id}: {sync_stats['inserted']} new, "
+        f"{sync_stats['kept']} unchanged, {sync_stats['deleted']} removed"
+    )
+
+
+def run_embed_stage(conn, job: Dict[str, Any], ctx: JobContext):
+    """
+    Embed the document's pending chunks until none are left
+
+    The job only completes once every chunk is embedded. Chunks that used up
+    their retries fail the job, and each retry of the job gives them a fresh
+    retry budget (after fail_job's growing delay).
+    """
+    document_id = job["document_id"]
+
+    if job["attempts"] > 1:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE chunks SET retry_count = 0, updated_at = NOW()
+                WHERE document_id = %s AND status = 'failed'
+                """,
+                (document_id,),
+            )
+        conn.commit()
+
+    def count_chunks():
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT COUNT(*), COUNT(*) FILTER (WHERE status = 'embedded')
+                FROM chunks WHERE document_id = %s
+                """,
+                (document_id,),
+            )
+            total, embedded = cursor.fetchone()
+        conn.commit()
+        return total, embedded
+
+    total, embedded = count_chunks()
+    ctx.report_progress(embedded, total)
+
+    # Each round commits per batch, so a crash resumes with the chunks still pending
+    while run_embedding(document_id=document_id)["processed"]:
+        total, embedded = count_chunks()
+        ctx.report_progress(embedded, total)
+
+    total, embedded = count_chunks()
+    if embedded < total:
+        raise RuntimeError(
+            f"{total - embedded} of {total} chunks for document {document_id} "
+            "could not be embedded"
+        )
+
+    with conn.cursor() as cursor:
+        complete_job(cursor, job)
+    conn.commit()
+
+    print(f"Embedded {embedded}/{total} chunks for document {document_id}")
+
+    # After a document's bulk ingestion, rebuild IVFFlat in the background if
+    # the corpus outgrew it
+    maybe_rebuild_index()
+
+
+STAGE_HANDLERS: Dict[str, Callable] = {
+    "extract": run_extract_stage,
+    "chunk": run_chunk_stage,
+    "embed": run_embed_stage,
+}
+
+
+def process_job(conn, job: Dict[str, Any]):
+    """Run one claimed job and record its outcome"""
+    print(f"Running {job['stage']} job {job['id']} for document {job['document_id']}")
+    started_at = time.perf_counter()
+
+    try:
+        with JobContext(job) as ctx:
+            STAGE_HANDLERS[job["stage"]](conn, job, ctx)
+        JOB_SECONDS.labels(job["stage"], "completed").observe(time.perf_counter() - started_at)
+
+    except JobLostError as e:
+        # Another worker owns the job now; its outcome is theirs to record
+        JOB_SECONDS.labels(job["stage"], "lost").observe(time.perf_counter() - started_at)
+        conn.rollback()
+        print(f"Dropping job: {e}")
+
+    except Exception as e:
+        JOB_SECONDS.labels(job["stage"], "failed").observe(time.perf_counter() - started_at)
+        conn.rollback()
+        error_msg = str(e)
+        print(f"Job {job['id']} failed: {error_msg}")
+
+        try:
+            with conn.cursor() as cursor:
+                retried = fail_job(cursor, job, error_msg)
+
+                if not retried:
+                    cursor.execute(
+                        """
+                        UPDATE documents
+                        SET status = 'failed', error_message = %s, updated_at = NOW()
+                        WHERE id = %s
+                        """,
+                        (error_msg, job["document_id"]),
+                    )
+            conn.commit()
+        except JobLostError as lost:
+            conn.rollback()
+            print(f"Not recording failure: {lost}")
+
+
+def run_worker(
+    stages: List[str], poll_interval: float = 2.0, metrics_port: Optional[int] = None
+):
+    """
+    Poll the queue and process jobs for the given stages until stopped
+
+    SIGINT/SIGTERM let the current job finish before the worker exits.
+    With metrics_port, this process serves its Prometheus metrics there.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    if metrics_port:
+        start_http_server(metrics_port)
+        print(f"Worker {worker_id} serving metrics on port {metrics_port}")
+    stopping = threading.Event()
+
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    conn = get_db_connection()
+    last_stale_check = 0.0
+
+    print(f"Worker {worker_id} started for stages: {', '.join(stages)}")
+
+    while not stopping.is_set():
+        if time.monotonic() - last_stale_check > STALE_CHECK_SECONDS:
+            with conn.cursor() as cursor:
+                recovered = requeue_stale_jobs(cursor)
+            conn.commit()
+            if recovered:
+                print(f"Recovered {recovered} abandoned jobs")
+            last_stale_check = time.monotonic()
+
+        job = claim_job(conn, stages, worker_id)
+
+        if not job:
+            stopping.wait(poll_interval)
+            continue
+
+        process_job(conn, job)
+
+    conn.close()
+    print(f"Worker {worker_id} stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TutorAI ingestion worker")
+    parser.add_argument(
+        "--stage",
+        action="append",
+        choices=JOB_STAGES,
+        help="Stage to process (repeatable, default: all stages)",
+    )
+    parser.add_argument(
+        "--processes", type=int, default=1, help="Worker processes to start"
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=2.0, help="Seconds between polls"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics here (process N uses port + N)",
+    )
+    args = parser.parse_args()
+
+    stages = args.stage or JOB_STAGES
+
+    if args.processes <= 1:
+        run_worker(stages, args.poll_interval, args.metrics_port)
+    else:
+        processes = [
+            multiprocessing.Process(
+                target=run_worker,
+                args=(
+                    stages,
+                    args.poll_interval,
+                    args.metrics_port + i if args.metrics_port else None,
+                ),
+            )
+            for i in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
@@ -73,28 +73,33 @@ router.post("/upload", upload.single("document"), async (req, res) => {
     const document = result.rows[0];
     documentId = document.id;
 
-    // Trigger indexing (call indexer service)
+    // Queue indexing (workers run extract -> chunk -> embed in the background)
     const indexerUrl = process.env.INDEXER_URL || "http://localhost:8000";
     const absolutePath = path.resolve(filePath);
 
-    // Call indexer asynchronously
-    axios
-      .post(`${indexerUrl}/index`, {
+    let jobId = null;
+    try {
+      const jobResponse = await axios.post(`${indexerUrl}/jobs/index`, {
         document_id: documentId,
         file_path: absolutePath,
-      })
-      .then(() => {
-        console.log(`Document ${documentId} indexed successfully`);
-      })
-      .catch((error) => {
-        console.error(`Error indexing document ${documentId}:`, error.message);
       });
+      jobId = jobResponse.data.job_id;
+      console.log(`Document ${documentId} queued for indexing (job ${jobId})`);
+    } catch (error) {
+      console.error(
+        `Error queueing indexing for document ${documentId}:`,
+        error.message
+      );
+    }
 
     res.status(201).json({
       success: true,
-      message: "Document uploaded successfully. Indexing in progress.",
+      message: jobId
+        ? "Document uploaded successfully. Indexing in progress."
+        : "Document uploaded, but indexing could not be queued. Use reindex to retry.",
       data: {
         document,
+        job_id: jobId,
       },
     });
   } catch (error) {
@@ -239,6 +244,42 @@ router.get("/:id", async (req, res) => {
   }
 });
 
+/**
+ * GET /api/admin/documents/:id/jobs
+ * Get ingestion job progress for a document
+ */
+router.get("/:id/jobs", async (req, res) => {
+  try {
+    const documentId = parseInt(req.params.id);
+
+    if (isNaN(documentId)) {
+      return res.status(400).json({
+        success: false,
+        message: "Invalid document ID",
+      });
+    }
+
+    const indexerUrl = process.env.INDEXER_URL || "http://localhost:8000";
+    const response = await axios.get(`${indexerUrl}/jobs`, {
+      params: { document_id: documentId },
+    });
+
+    res.json({
+      success: true,
+      data: {
+        jobs: response.data.jobs,
+      },
+    });
+  } catch (error) {
+    console.error("Get document jobs error:", error);
+    res.status(500).json({
+      success: false,
+      message: "Failed to get document jobs",
+      error: error.message,
+    });
+  }
+});
+
 /**
  * DELETE /api/admin/documents/:id
  * Delete document and its chunks
@@ -325,37 +366,42 @@ router.post("/:id/reindex", async (req, res) => {
 
     const document = result.rows[0];
 
-    // Delete existing chunks
-    await pool.query("DELETE FROM chunks WHERE document_id = $1", [documentId]);
+    // Existing chunks are kept: the indexer diffs them by content hash and
+    // only re-embeds chunks that changed
 
-    // Update status to pending
+    // Update status to pending. Set before queueing, since a worker may pick
+    // the job up (and mark the document processing) as soon as it is queued
     await pool.query(
       "UPDATE documents SET status = $1, updated_at = NOW() WHERE id = $2",
       ["pending", documentId]
     );
 
-    // Trigger indexing
+    // Queue indexing
     const indexerUrl = process.env.INDEXER_URL || "http://localhost:8000";
     const absolutePath = path.resolve(document.file_path);
 
-    axios
-      .post(`${indexerUrl}/index`, {
+    let jobResponse;
+    try {
+      jobResponse = await axios.post(`${indexerUrl}/jobs/index`, {
         document_id: documentId,
         file_path: absolutePath,
-      })
-      .then(() => {
-        console.log(`Document ${documentId} re-indexed successfully`);
-      })
-      .catch((error) => {
-        console.error(
-          `Error re-indexing document ${documentId}:`,
-          error.message
-        );
       });
+    } catch (error) {
+      // Nothing will pick the document up, so don't leave it pending forever
+      await pool.query(
+        `UPDATE documents SET status = $1, updated_at = NOW()
+         WHERE id = $2 AND status = 'pending'`,
+        [document.status, documentId]
+      );
+      throw error;
+    }
 
     res.json({
       success: true,
-      message: "Document re-indexing triggered",
+      message: "Document re-indexing queued",
+      data: {
+        job_id: jobResponse.data.job_id,
+      },
     });
   } catch (error) {
     console.error("Reindex error:", error);
@@ -395,29 +441,19 @@ router.post("/:id/embed", async (req, res) => {
       });
     }
 
-    // Trigger embedding
+    // Queue embedding for this document's chunks
     const indexerUrl = process.env.INDEXER_URL || "http://localhost:8000";
 
-    // Send document_id as query param so indexer will process only that document
-    axios
-      .post(`${indexerUrl}/embed`, null, {
-        params: { document_id: documentId },
-      })
-      .then(() => {
-        console.log(
-          `Embeddings for document ${documentId} generation triggered successfully`
-        );
-      })
-      .catch((error) => {
-        console.error(
-          `Error generating embeddings for document ${documentId}:`,
-          error.message
-        );
-      });
+    const jobResponse = await axios.post(`${indexerUrl}/jobs/embed`, null, {
+      params: { document_id: documentId },
+    });
 
     res.json({
       success: true,
-      message: "Embedding generation triggered for document chunks",
+      message: "Embedding generation queued for document chunks",
+      data: {
+        job_id: jobResponse.data.job_id,
+      },
     });
   } catch (error) {
     console.error("Embed error:", error);
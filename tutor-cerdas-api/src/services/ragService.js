@@ -10,6 +10,14 @@ const genAI = new GoogleGenerativeAI(process.env.GEMINI_API_KEY);
 const model = genAI.getGenerativeModel({ model: "gemini-2.5-flash" });
 
 const INDEXER_URL = process.env.INDEXER_URL || "http://localhost:8000";
+// Lexical and hybrid modes need the indexer's full-text search migration
+const RETRIEVAL_MODE = process.env.RETRIEVAL_MODE || "vector";
+
+// Answers to history-free questions, reused while the indexer's corpus
+// version is unchanged (0 disables). Paraphrases share an answer when the
+// indexer's semantic cache maps them to the same earlier query.
+const ANSWER_CACHE_SIZE = parseInt(process.env.ANSWER_CACHE_SIZE || "0", 10);
+const answerCache = new Map();
 
 /**
  * Detect language of the input text
@@ -36,20 +44,86 @@ export function detectLanguage(text) {
  * @returns {Promise<Array>} - Array of relevant chunks
  */
 export async function retrieveContext(query, topK = 5) {
+  const data = await retrieve(query, topK);
+  return data ? data.results : [];
+}
+
+/**
+ * Call the indexer's /retrieve endpoint, falling back to vector search
+ * when another mode fails (e.g. the full-text search migration is missing)
+ * @param {string} query - User query
+ * @param {number} topK - Number of chunks to retrieve
+ * @param {string} mode - Retrieval mode: vector, lexical or hybrid
+ * @returns {Promise<Object|null>} - Full response (results, cache, cached_query, corpus_version) or null on error
+ */
+async function retrieve(query, topK = 5, mode = RETRIEVAL_MODE) {
   try {
     const response = await axios.post(`${INDEXER_URL}/retrieve`, {
       query,
       top_k: topK,
+      mode,
     });
 
     if (response.data.success) {
-      return response.data.results;
+      return response.data;
     }
 
-    return [];
+    return null;
   } catch (error) {
+    if (mode !== "vector") {
+      console.error(
+        `Error retrieving context in ${mode} mode, falling back to vector:`,
+        error.message
+      );
+      return retrieve(query, topK, "vector");
+    }
     console.error("Error retrieving context:", error.message);
-    return [];
+    return null;
+  }
+}
+
+/**
+ * Answer cache keys for a retrieval: the question itself and, on a
+ * semantic cache hit, the earlier question whose context was reused
+ * @param {string} userMessage - User's message
+ * @param {Object} retrieval - /retrieve response
+ * @param {string} language - Detected language
+ * @returns {string[]} - Cache keys
+ */
+function answerCacheKeys(userMessage, retrieval, language) {
+  const normalize = (text) =>
+    text.normalize("NFKC").replace(/\s+/g, " ").trim().toLowerCase();
+  const prefix = `${retrieval.corpus_version}:${language}:`;
+
+  const keys = [prefix + normalize(userMessage)];
+  if (retrieval.cached_query) {
+    keys.push(prefix + normalize(retrieval.cached_query));
+  }
+  return keys;
+}
+
+/**
+ * Retrieve relevant context for many queries with one indexer call
+ * (for evaluation and bulk question-answering jobs)
+ * @param {string[]} queries - User queries
+ * @param {number} topK - Number of chunks to retrieve per query
+ * @returns {Promise<Array<Array>>} - Array of relevant chunks per query, in input order
+ */
+export async function retrieveContextBatch(queries, topK = 5) {
+  try {
+    const response = await axios.post(`${INDEXER_URL}/retrieve/batch`, {
+      queries,
+      top_k: topK,
+    });
+
+    if (response.data.success) {
+      return response.data.results.map((item) => item.results);
+    }
+
+    return queries.map(() => []);
+  } catch (error) {
+    console.error("Error retrieving context batch:", error.message);
+    return queries.map(() => []);
   }
 }
 
@@ -143,8 +217,30 @@ export async function generateResponse(
     const language = detectLanguage(userMessage);
 
     // Retrieve context if not provided
+    let cacheKeys = [];
     if (!context) {
-      context = await retrieveContext(userMessage, 5);
+      const retrieval = await retrieve(userMessage, 5);
+      context = retrieval ? retrieval.results : [];
+
+      // Follow-up questions depend on the history, so only standalone
+      // questions are answered from the cache
+      if (
+        ANSWER_CACHE_SIZE > 0 &&
+        retrieval &&
+        retrieval.corpus_version != null &&
+        chatHistory.length === 0
+      ) {
+        cacheKeys = answerCacheKeys(userMessage, retrieval, language);
+        for (const key of cacheKeys) {
+          const cached = answerCache.get(key);
+          if (cached) {
+            // Refresh recency (Map iteration order is insertion order)
+            answerCache.delete(key);
+            answerCache.set(key, cached);
+            return { ...cached, cached: true };
+          }
+        }
+      }
     }
 
     // Build prompt with chat history
@@ -163,13 +259,22 @@ export async function generateResponse(
       preview: chunk.content.substring(0, 150) + "...",
     }));
 
-    return {
+    const answer = {
       reply,
       language,
       sources,
       context_used: context.length > 0,
       history_used: chatHistory.length > 0,
     };
+
+    if (cacheKeys.length > 0) {
+      answerCache.set(cacheKeys[0], answer);
+      while (answerCache.size > ANSWER_CACHE_SIZE) {
+        answerCache.delete(answerCache.keys().next().value);
+      }
+    }
+
+    return answer;
   } catch (error) {
     console.error("Error generating response:", error);
     throw new Error(`Failed to generate response: ${error.message}`);